@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+O stream SSE (/api/stream/, finance/stream.py) só funciona servido por aqui:
+    uvicorn backend.asgi:application --workers 4
+Com mais de um worker, use FINANCE_EVENTS_BROKER=finance.events.PostgresBroker.
 """
 
 import os
@@ -0,0 +1,204 @@
+"""
+Roteamento primary / réplicas de leitura.
+
+- Escritas (e `select_for_update`, que o Django já trata como escrita) vão sempre
+  pro `default`.
+- Leituras vão pra uma réplica saudável escolhida ao acaso, exceto:
+    * dentro de `transaction.atomic()` no primary;
+    * em requests que não são GET/HEAD/OPTIONS;
+    * por alguns segundos depois que o cliente escreveu (cookie `db_pin`), pra
+      ele não ver a transação recém-criada "sumir" por atraso de replicação.
+- Uma réplica que falha no health check (conexão ou atraso de replicação acima
+  de REPLICA_MAX_LAG_SECONDS) é ejetada por REPLICA_EJECT_SECONDS.
+
+Configuração em settings: DATABASE_REPLICAS (aliases de DATABASES),
+REPLICA_STICKY_SECONDS, REPLICA_HEALTH_CHECK_INTERVAL, REPLICA_EJECT_SECONDS,
+REPLICA_MAX_LAG_SECONDS. Sem réplicas configuradas tudo fica no `default`.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = "db_pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# True enquanto o request atual deve ler do primary
+_use_primary: ContextVar[bool] = ContextVar("use_primary", default=False)
+
+
+def replica_aliases() -> list[str]:
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def use_primary() -> bool:
+    return _use_primary.get()
+
+
+class pin_to_primary:
+    '''
+    Força leituras no primary dentro do bloco:
+
+        with pin_to_primary():
+            ...
+    '''
+
+    def __enter__(self):
+        self._token = _use_primary.set(True)
+        return self
+
+    def __exit__(self, *exc):
+        _use_primary.reset(self._token)
+
+
+def replay_lag(caught_up: bool | None, seconds) -> float:
+    '''
+    Atraso da réplica em segundos. Com tudo o que chegou do primary já aplicado
+    (LSN recebido = LSN aplicado) é 0: num primary sem escritas o tempo desde a
+    última transação aplicada só cresce, mas a réplica está em dia.
+    '''
+    if caught_up or seconds is None:
+        return 0.0
+    return float(seconds)
+
+
+def probe_replica(alias: str) -> bool:
+    ''' Health check padrão: conecta, roda SELECT 1 e, no Postgres, mede o atraso de replay '''
+    max_lag = getattr(settings, "REPLICA_MAX_LAG_SECONDS", None)
+    try:
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            if max_lag is not None and connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(), "
+                    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                )
+                if replay_lag(*cursor.fetchone()) > max_lag:
+                    return False
+        return True
+    except DatabaseError:
+        return False
+
+
+class ReplicaHealth:
+    '''
+    Guarda o estado de saúde das réplicas por processo. Cada réplica é checada no
+    máximo a cada `check_interval` segundos; se falhar fica ejetada por `eject_seconds`.
+    '''
+
+    def __init__(self, check_interval: float = 5.0, eject_seconds: float = 30.0, probe=probe_replica, clock=time.monotonic):
+        self.check_interval = check_interval
+        self.eject_seconds = eject_seconds
+        self.probe = probe
+        self.clock = clock
+        self._checked_at: dict[str, float] = {}
+        self._ejected_until: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def eject(self, alias: str, seconds: float | None = None):
+        with self._lock:
+            self._ejected_until[alias] = self.clock() + (self.eject_seconds if seconds is None else seconds)
+
+    def is_ejected(self, alias: str) -> bool:
+        return self._ejected_until.get(alias, 0.0) > self.clock()
+
+    def is_healthy(self, alias: str) -> bool:
+        if self.is_ejected(alias):
+            return False
+        now = self.clock()
+        with self._lock:
+            due = now - self._checked_at.get(alias, float("-inf")) >= self.check_interval
+            if due:
+                self._checked_at[alias] = now
+        if due and not self.probe(alias):
+            self.eject(alias)
+            return False
+        return True
+
+    def healthy(self, aliases) -> list[str]:
+        return [alias for alias in aliases if self.is_healthy(alias)]
+
+
+health = ReplicaHealth(
+    check_interval=getattr(settings, "REPLICA_HEALTH_CHECK_INTERVAL", 5.0),
+    eject_seconds=getattr(settings, "REPLICA_EJECT_SECONDS", 30.0),
+)
+
+
+class PrimaryReplicaRouter:
+    '''
+    Router de DATABASE_ROUTERS: leituras em réplicas saudáveis, escritas no primary.
+    '''
+
+    def __init__(self, replicas=None, health_checker=None):
+        self.replicas = replica_aliases() if replicas is None else list(replicas)
+        self.health = health_checker or health
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas:
+            return None
+        if use_primary():
+            return DEFAULT_DB_ALIAS
+        # leitura dentro de uma transação aberta no primary enxerga o que ela escreveu
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        healthy = self.health.healthy(self.replicas)
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        return random.choice(healthy)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS if self.replicas else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *self.replicas}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # réplicas recebem o schema por replicação
+        if db in self.replicas:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Decide, por request, se as leituras podem ir pra réplica, e marca o cliente
+    com o cookie `db_pin` depois de uma escrita (read-your-writes).
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.window = getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+
+    def _pinned(self, request) -> bool:
+        if request.method not in SAFE_METHODS:
+            return True
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        token = _use_primary.set(self._pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+
+        if request.method not in SAFE_METHODS and replica_aliases():
+            response.set_cookie(
+                PIN_COOKIE,
+                str(int(time.time() + self.window)),
+                max_age=self.window,
+                httponly=True,
+                samesite="Lax",
+                path="/",
+            )
+        return response
@@ -0,0 +1,48 @@
+"""
+Parser JSON do DRF com orjson (ver backend/renderers.py).
+
+Aceita o mesmo que o JSONParser do DRF com STRICT_JSON: rejeita NaN/Infinity e
+devolve ParseError com a mesma mensagem. Corpo em outro encoding que não UTF-8
+ou com sequência longa de dígitos (o orjson transforma inteiro acima de 64 bits
+em float, o DRF mantém int) vai pro JSONParser do DRF.
+"""
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+# 20+ dígitos seguidos pode ser inteiro que não cabe em 64 bits. Procura
+# trocando todo dígito por "0" e o resto por espaço: bem mais rápido que regex
+DIGITS = bytes(ord("0") if ord("0") <= i <= ord("9") else ord(" ") for i in range(256))
+LONG_NUMBER = b"0" * 20
+
+
+class ORJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read() if stream is not None else b""
+        if LONG_NUMBER in body.translate(DIGITS):
+            return super().parse(_Replay(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # refaz no JSONParser pra devolver a mesma mensagem de erro
+            return super().parse(_Replay(body), media_type, parser_context)
+
+
+class _Replay:
+    ''' Stream já lido, pra reaproveitar no JSONParser do DRF '''
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def read(self, *args):
+        body, self.body = self.body, b""
+        return body
@@ -0,0 +1,62 @@
+"""
+Renderer JSON do DRF com orjson.
+
+Mesma saída (byte a byte) do rest_framework.renderers.JSONRenderer com as
+configurações do projeto (COMPACT_JSON, UNICODE_JSON, STRICT_JSON):
+- Decimal de serializer já chega como string; Decimal "cru" (SummaryView) vira
+  número, igual ao encoder do DRF;
+- date/time/datetime saem nativos do orjson (isoformat, "Z" no lugar de "+00:00",
+  igual ao DRF);
+- U+2028/U+2029 escapados como o DRF faz.
+Diferença conhecida: float NaN/Infinity sai como null (o DRF levanta erro);
+os números do projeto são Decimal e esses continuam levantando.
+O resto (lazy strings, QuerySet, timedelta...) passa pelo encoder do DRF via
+`default`. Quando o orjson não dá conta (inteiro acima de 64 bits, indentação
+pedida pelo cliente / browsable API, ensure_ascii) ou não está instalado, cai
+no JSONRenderer do DRF.
+"""
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+LINE_SEPARATOR = "\u2028".encode()
+PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def __init__(self):
+        self._fallback = JSONEncoder(ensure_ascii=False)
+
+    def _default(self, obj):
+        if isinstance(obj, Decimal) and not obj.is_finite():
+            raise ValueError("Out of range float values are not JSON compliant")
+        return self._fallback.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if (
+            orjson is None
+            or self.encoder_class is not JSONEncoder
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # mesmo escape do DRF (JSON válido, mas quebra em JavaScript antigo)
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b"\\u2028").replace(PARAGRAPH_SEPARATOR, b"\\u2029")
+        return ret
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "backend.db_routing.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -65,6 +66,16 @@ REST_FRAMEWORK = {
         "rest_framework.filters.SearchFilter",
         "rest_framework.filters.OrderingFilter",
     ],
+    # orjson com a mesma saída do JSONRenderer (ver backend/renderers.py)
+    "DEFAULT_RENDERER_CLASSES": [
+        "backend.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "backend.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 50,
 }
@@ -105,6 +116,71 @@ DATABASES = {
     }
 }
 
+# Réplicas de leitura (opcional): DATABASE_REPLICA_HOSTS=host1,host2 no .env.
+# Usam o mesmo banco/usuário/senha do default. Ver backend/db_routing.py.
+DATABASE_REPLICAS = []
+for i, host in enumerate(config("DATABASE_REPLICA_HOSTS", default="", cast=Csv()), start=1):
+    alias = f"replica_{i}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Sharding por usuário dos dados do finance (opcional), ver finance/sharding.py.
+# FINANCE_SHARD_DATABASES=caixinha_s1,outro-host/caixinha_s2 (mesmo usuário/senha do
+# default) ou caminhos .sqlite3 pra testar local. "default" também vale como shard.
+FINANCE_SHARDS = []
+for i, entry in enumerate(config("FINANCE_SHARD_DATABASES", default="", cast=Csv()), start=1):
+    if entry == "default":
+        FINANCE_SHARDS.append("default")
+        continue
+    alias = f"shard_{i}"
+    if entry.endswith(".sqlite3"):
+        DATABASES[alias] = {"ENGINE": "django.db.backends.sqlite3", "NAME": entry}
+    else:
+        host, _, name = entry.rpartition("/")
+        DATABASES[alias] = {**DATABASES["default"], "NAME": name, "HOST": host or DATABASES["default"]["HOST"]}
+    FINANCE_SHARDS.append(alias)
+
+DATABASE_ROUTERS = ["finance.sharding.ShardRouter", "backend.db_routing.PrimaryReplicaRouter"]
+# depois de uma escrita, o cliente lê do primary por esse tempo (cookie db_pin)
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=10, cast=int)
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+REPLICA_EJECT_SECONDS = 30
+REPLICA_MAX_LAG_SECONDS = config("REPLICA_MAX_LAG_SECONDS", default=30, cast=int)
+
+# Particionamento da tabela de transações (Postgres): "year" ou "month".
+# Ver finance/partitioning.py e `manage.py transaction_partitions`.
+FINANCE_PARTITION_INTERVAL = config("FINANCE_PARTITION_INTERVAL", default="year")
+
+# Transações mais antigas que isso (em meses) podem ser arquivadas
+# com `manage.py archive_transactions` (ver finance/archive.py).
+FINANCE_ARCHIVE_AFTER_MONTHS = config("FINANCE_ARCHIVE_AFTER_MONTHS", default=24, cast=int)
+
+# Delta-sync (/api/sync/): por quantos dias guardar os registros de remoção.
+# Cliente que ficar mais tempo que isso sem sincronizar refaz o sync completo.
+FINANCE_SYNC_TOMBSTONE_DAYS = config("FINANCE_SYNC_TOMBSTONE_DAYS", default=90, cast=int)
+# Chaves de idempotência do /api/transactions/batch/: reenvio depois disso aplica de novo.
+FINANCE_IDEMPOTENCY_DAYS = config("FINANCE_IDEMPOTENCY_DAYS", default=30, cast=int)
+
+# Stream SSE (/api/stream/, ver finance/stream.py e finance/events.py).
+# Com vários workers ASGI: FINANCE_EVENTS_BROKER=finance.events.PostgresBroker
+FINANCE_EVENTS_BROKER = config("FINANCE_EVENTS_BROKER", default="finance.events.InMemoryBroker")
+FINANCE_EVENTS_HEARTBEAT = 15  # segundos entre os `: ping`
+FINANCE_EVENTS_BUFFER = 256  # eventos guardados por usuário pra replay (Last-Event-ID)
+FINANCE_EVENTS_BUFFER_USERS = 10000  # usuários com buffer de replay por processo (LRU)
+
+# Razão em memória pras leituras (summary, analytics, recent); ver finance/ledger.py.
+# O teto é por processo: os usuários lidos há mais tempo saem primeiro.
+FINANCE_LEDGER_ENGINE = config("FINANCE_LEDGER_ENGINE", default=False, cast=bool)
+FINANCE_LEDGER_MEMORY_MB = config("FINANCE_LEDGER_MEMORY_MB", default=64, cast=int)
+
+# Relatório da plataforma (/api/platform/report/, `manage.py platform_report` no cron):
+# passando disso (em horas) o endpoint marca o último como "stale".
+FINANCE_PLATFORM_REPORT_MAX_AGE_HOURS = config("FINANCE_PLATFORM_REPORT_MAX_AGE_HOURS", default=24, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,212 @@
+# backend/tests.py
+import io
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from backend import db_routing
+from backend.db_routing import (
+    PIN_COOKIE,
+    PrimaryReplicaRouter,
+    ReplicaHealth,
+    ReplicaRoutingMiddleware,
+    pin_to_primary,
+    probe_replica,
+    use_primary,
+)
+from backend.parsers import ORJSONParser
+from backend.renderers import ORJSONRenderer
+from finance.models import Category, Transaction
+from finance.serializers import CategorySerializer, TransactionSerializer
+from finance.summary import build_summary
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _router(probe=lambda alias: True, clock=None):
+    checker = ReplicaHealth(check_interval=5, eject_seconds=30, probe=probe, clock=clock or FakeClock())
+    return PrimaryReplicaRouter(replicas=["replica_1", "replica_2"], health_checker=checker)
+
+
+def test_reads_go_to_replicas_and_writes_to_primary():
+    router = _router()
+    reads = {router.db_for_read(Transaction) for _ in range(50)}
+    assert reads == {"replica_1", "replica_2"}
+    assert router.db_for_write(Transaction) == "default"
+    assert router.allow_migrate("replica_1", "finance") is False
+    assert router.allow_migrate("default", "finance") is None
+
+
+def test_router_without_replicas_does_not_interfere():
+    router = PrimaryReplicaRouter(replicas=[])
+    assert router.db_for_read(Transaction) is None
+    assert router.db_for_write(Transaction) is None
+
+
+def test_pinned_reads_stay_on_primary():
+    router = _router()
+    with pin_to_primary():
+        assert router.db_for_read(Transaction) == "default"
+    assert router.db_for_read(Transaction) != "default"
+
+
+def test_unhealthy_replica_is_ejected_then_rechecked():
+    clock = FakeClock()
+    down = {"replica_1"}
+    router = _router(probe=lambda alias: alias not in down, clock=clock)
+
+    assert {router.db_for_read(Transaction) for _ in range(30)} == {"replica_2"}
+
+    down.clear()
+    clock.now += 10  # ainda ejetada
+    assert {router.db_for_read(Transaction) for _ in range(30)} == {"replica_2"}
+
+    clock.now += 30  # passou o tempo de ejeção, volta depois do novo health check
+    assert {router.db_for_read(Transaction) for _ in range(50)} == {"replica_1", "replica_2"}
+
+    down.update({"replica_1", "replica_2"})
+    clock.now += 10
+    assert router.db_for_read(Transaction) == "default"
+
+
+class FakeReplica:
+    vendor = "postgresql"
+
+    def __init__(self, row):
+        self.row = row
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+@override_settings(REPLICA_MAX_LAG_SECONDS=10)
+def test_probe_measures_lag_only_while_replay_is_behind(monkeypatch):
+    # (LSN recebido = aplicado, segundos desde a última transação aplicada)
+    replicas = {
+        "idle": FakeReplica((True, Decimal("3600"))),  # primary sem escritas há 1h: em dia
+        "behind": FakeReplica((False, Decimal("60"))),
+        "catching_up": FakeReplica((False, Decimal("2"))),
+        "primary": FakeReplica((None, None)),  # fora de recovery as funções devolvem NULL
+    }
+    monkeypatch.setattr(db_routing, "connections", replicas)
+    assert {alias: probe_replica(alias) for alias in replicas} == {
+        "idle": True, "behind": False, "catching_up": True, "primary": True,
+    }
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+def test_middleware_pins_after_write_via_cookie():
+    seen = []
+
+    def view(request):
+        seen.append(use_primary())
+        return HttpResponse("ok")
+
+    middleware = ReplicaRoutingMiddleware(view)
+    rf = RequestFactory()
+
+    response = middleware(rf.post("/api/transactions/"))
+    assert seen[-1] is True
+    pin = response.cookies[PIN_COOKIE]
+    assert int(pin["max-age"]) == middleware.window
+
+    middleware(rf.get("/api/summary/"))
+    assert seen[-1] is False
+
+    request = rf.get("/api/summary/")
+    request.COOKIES[PIN_COOKIE] = pin.value
+    middleware(request)
+    assert seen[-1] is True
+
+    request = rf.get("/api/summary/")
+    request.COOKIES[PIN_COOKIE] = str(int(time.time()) - 1)
+    middleware(request)
+    assert seen[-1] is False
+
+
+def _same_json(data, **kwargs):
+    expected = JSONRenderer().render(data, **kwargs)
+    assert ORJSONRenderer().render(data, **kwargs) == expected
+    return expected
+
+
+@pytest.mark.django_db
+def test_orjson_renderer_matches_drf_for_finance_payloads():
+    user = get_user_model().objects.create_user(username="john", email="john@test.com", password="12345678")
+    mine = Category.objects.create(user=user, name="Café ☕")
+    Transaction.objects.bulk_create([
+        Transaction(
+            user=user, type="OUT" if i % 3 else "IN", amount=Decimal(f"{i}.{i % 100:02d}"),
+            date=date(2026, 1, 1 + i % 28), description=f"linha {i} \u2028 ção", category=mine if i % 2 else None,
+        )
+        for i in range(60)
+    ])
+    rows = Transaction.objects.select_related("category").filter(user=user)
+
+    _same_json({"count": 60, "next": None, "previous": None, "results": TransactionSerializer(rows, many=True).data})
+    _same_json(CategorySerializer(Category.objects.all(), many=True).data)
+    body = _same_json(build_summary(user, 2026, 1))
+    assert b'"balance_total":' in body and b"\\u2028" not in body
+
+
+def test_orjson_renderer_matches_drf_for_edge_cases():
+    _same_json({
+        "utc": datetime(2026, 1, 1, 10, 0, 0, 123456, tzinfo=timezone.utc),
+        "offset": datetime(2026, 1, 1, 10, 0, tzinfo=timezone(timedelta(hours=-3))),
+        "naive": datetime(2026, 1, 1, 10, 0),
+        "date": date(2026, 1, 2),
+        "lazy": gettext_lazy("Outros"),
+        "duration": timedelta(days=1, seconds=5),
+        "big": 2 ** 70,
+        1: "int key",
+        "separators": "a\u2028b\u2029c",
+        "decimal": Decimal("10.50"),
+    })
+    _same_json({"x": [1, 2]}, accepted_media_type="application/json; indent=4")
+    assert ORJSONRenderer().render(None) == b""
+    with pytest.raises(ValueError):
+        ORJSONRenderer().render({"x": Decimal("NaN")})
+
+
+@pytest.mark.parametrize("body", [
+    b'{"amount": "10.50", "description": "p\xc3\xa3o", "tags": [1, 2.5, null, true]}',
+    b'{"id": 123456789012345678901234567890}',
+    b'{"x": NaN}',
+    b'{"x": ',
+    b"",
+])
+def test_orjson_parser_matches_drf(body):
+    def parse(parser):
+        try:
+            return parser.parse(io.BytesIO(body), "application/json", {})
+        except ParseError as exc:
+            return str(exc.detail)
+
+    assert parse(ORJSONParser()) == parse(JSONParser())
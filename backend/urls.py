@@ -18,17 +18,28 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from finance.views import CategoryViewSet, TransactionViewSet, SummaryView
+from finance.stream import stream
+from finance.views import (
+    AnalyticsView, BudgetViewSet, CategoryRuleViewSet, CategoryViewSet, PlatformReportView, RecurringTransactionViewSet,
+    TransactionViewSet, SummaryView, SyncView,
+)
 
 router = DefaultRouter()
 router.register(r"categories", CategoryViewSet, basename="category")
 router.register(r"transactions", TransactionViewSet, basename="transaction")
+router.register(r"rules", CategoryRuleViewSet, basename="categoryrule")
+router.register(r"recurring", RecurringTransactionViewSet, basename="recurringtransaction")
+router.register(r"budgets", BudgetViewSet, basename="budget")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include([
         path("", include(router.urls)),
         path("summary/", SummaryView.as_view(), name="summary"),
+        path("analytics/", AnalyticsView.as_view(), name="analytics"),
+        path("sync/", SyncView.as_view(), name="sync"),
+        path("stream/", stream, name="stream"),
+        path("platform/report/", PlatformReportView.as_view(), name="platform-report"),
     ])),
     path("api/auth/", include("login.urls")),
 ]
@@ -1,14 +1,239 @@
+import json
+from datetime import date
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 
 # Register your models here.
-from .models import Category, Transaction
+from .models import AccountPurge, Budget, Category, CategoryRule, RecurringTransaction, Transaction
+from .partitioning import estimated_rows
+from .purge import request_purge
+
+# Com milhões de transações o changelist não pode contar nem enumerar nada da
+# tabela toda: contagem estimada pelas estatísticas, filtros de categoria/usuário por
+# autocomplete e, passando das primeiras páginas, navegação por cursor
+# (?after=<data>.<id>) em vez de OFFSET.
+
+# abaixo disso (ou sem estatística) conta de verdade
+EXACT_COUNT_BELOW = 10_000
+# links numerados só até aqui; mais fundo é "Próxima página" pelo cursor
+MAX_OFFSET_PAGE = 20
+CURSOR_VAR = "after"
+
+
+def _planned_rows(queryset) -> int:
+    return json.loads(queryset.explain(format="json"))[0]["Plan"]["Plan Rows"]
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    No Postgres, resultado grande não é contado: sem filtro vale o reltuples da
+    tabela, com filtro a estimativa do planner (EXPLAIN). COUNT(*) de verdade só
+    abaixo de EXACT_COUNT_BELOW.
+    '''
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == "postgresql":
+            estimate = _planned_rows(queryset) if queryset.query.where else estimated_rows(queryset.db)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                return estimate
+        return super().count
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        for page in super().get_elided_page_range(number, on_each_side=on_each_side, on_ends=on_ends):
+            if page == self.ELLIPSIS or page <= MAX_OFFSET_PAGE:
+                yield page
+
+
+def _parse_cursor(value: str | None) -> tuple[date, int] | None:
+    try:
+        day, pk = (value or "").split(".")
+        return date.fromisoformat(day), int(pk)
+    except ValueError:
+        return None
+
+
+class TransactionChangeList(ChangeList):
+    '''
+    Na ordem padrão (-date, -id) a página seguinte vem por cursor: WHERE
+    (date, id) < (última linha) no índice tx_date_idx, sem OFFSET e sem COUNT.
+    '''
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = _parse_cursor(request.GET.get(CURSOR_VAR))
+        self.next_cursor_url = None
+        super().__init__(request, *args, **kwargs)
+
+    @property
+    def default_ordering(self) -> bool:
+        return ORDER_VAR not in self.params
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # filtro, ordem e número de página recomeçam do início
+        return super().get_query_string(new_params, [*(remove or []), CURSOR_VAR])
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        if self.cursor and self.default_ordering:
+            day, pk = self.cursor
+            queryset = queryset.filter(Q(date__lt=day) | Q(date=day, pk__lt=pk))
+        return queryset
+
+    def get_results(self, request):
+        if not (self.cursor and self.default_ordering):
+            super().get_results(request)
+            if self.default_ordering and self.multi_page and not self.show_all:
+                page = list(self.result_list)  # avalia o slice que o template vai usar
+                if len(page) == self.list_per_page and self.page_num < self.paginator.num_pages:
+                    self._set_next_cursor(page[-1])
+            return
+
+        rows = list(self.queryset[: self.list_per_page + 1])
+        self.result_list = rows[: self.list_per_page]
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        if len(rows) > self.list_per_page:
+            self._set_next_cursor(self.result_list[-1])
+
+    def _set_next_cursor(self, last: Transaction):
+        self.next_cursor_url = self.get_query_string({CURSOR_VAR: f"{last.date.isoformat()}.{last.pk}"})
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    ''' Filtro por FK com o select2 do admin no lugar da lista com todos os objetos '''
+    template = "admin/finance/autocomplete_filter.html"
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        widget = AutocompleteSelect(self.field, changelist.model_admin.admin_site, attrs={"style": "width: 100%"})
+        choice = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(), required=False, widget=widget
+        )
+        yield {
+            "selected": bool(self.lookup_val),
+            "query_string": changelist.get_query_string(remove=self.expected_parameters()),
+            "hidden": [
+                (name, value) for name, value in changelist.params.items()
+                if name not in self.expected_parameters() and name != CURSOR_VAR
+            ],
+            "widget": choice.widget.render(self.lookup_kwarg, self.lookup_val[-1] if self.lookup_val else None),
+        }
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
+    list_display = ["name", "user"]
+    list_select_related = ["user"]
     search_fields = ["name"]
+    autocomplete_fields = ["user"]
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ["date", "type", "amount", "category", "description"]
-    list_filter = ["type", "category"]
-    search_fields = ["description"]
\ No newline at end of file
+    list_display = ["date", "type", "amount", "category", "user", "description"]
+    list_select_related = ["category", "user"]
+    list_filter = ["type", ("category", AutocompleteFilter), ("user", AutocompleteFilter)]
+    date_hierarchy = "date"
+    search_fields = ["description"]
+    search_help_text = "Começo da descrição ou id da transação."
+    autocomplete_fields = ["category", "user"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(Transaction._meta.get_field("category"), self.admin_site).media
+
+    def get_changelist(self, request, **kwargs):
+        return TransactionChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # prefixo (índice tx_description_prefix_idx) em vez de ILIKE '%termo%' na tabela toda
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        match = Q(description__istartswith=term)
+        if term.isdigit():
+            match |= Q(pk=int(term))
+        return queryset.filter(match), False
+
+@admin.register(CategoryRule)
+class CategoryRuleAdmin(admin.ModelAdmin):
+    list_display = ["user", "kind", "pattern", "min_amount", "max_amount", "category", "priority"]
+    list_select_related = ["user", "category"]
+    list_filter = ["kind"]
+    search_fields = ["pattern"]
+    autocomplete_fields = ["user", "category"]
+
+@admin.register(RecurringTransaction)
+class RecurringTransactionAdmin(admin.ModelAdmin):
+    list_display = ["user", "description", "amount", "frequency", "interval", "next_run", "active"]
+    list_select_related = ["user"]
+    list_filter = ["frequency", "active"]
+    search_fields = ["description"]
+    autocomplete_fields = ["user", "category"]
+    readonly_fields = ["position", "last_run"]
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ["user", "category", "month", "limit"]
+    list_select_related = ["user", "category"]
+    autocomplete_fields = ["user", "category"]
+
+
+@admin.register(AccountPurge)
+class AccountPurgeAdmin(admin.ModelAdmin):
+    list_display = ["username", "user_id", "requested_at", "finished_at", "batches", "max_batch_ms", "error"]
+    search_fields = ["username"]
+    readonly_fields = [f.name for f in AccountPurge._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+User = get_user_model()
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class PurgingUserAdmin(UserAdmin):
+    '''
+    Excluir usuário pelo admin só desativa e agenda a exclusão em lotes
+    (finance/purge.py): nada de collector varrendo milhões de linhas no request.
+    '''
+
+    def get_deleted_objects(self, objs, request):
+        deleted = [f"{obj} (desativado agora; dados apagados em segundo plano pelo purge_accounts)" for obj in objs]
+        return deleted, {User._meta.verbose_name_plural: len(deleted)}, set(), []
+
+    def delete_model(self, request, obj):
+        request_purge(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            request_purge(user)
@@ -0,0 +1,273 @@
+'''finance/analytics.py'''
+"""
+Análises do GET /api/analytics/: tendência por categoria, médias móveis de 3 e
+12 meses, comparação com o ano anterior e previsão do fechamento do mês.
+
+Uma consulta agrupada traz os totais diários por categoria/tipo (mais uma pros
+snapshots de meses arquivados, que entram no dia 1 do mês), já em centavos
+inteiros. Daí pra frente é tudo em arrays NumPy int64: a matriz mês x
+(categoria, tipo) sai de um `np.add.at`, as médias móveis de somas acumuladas e
+a previsão de máscaras sobre os dias. Centavos inteiros deixam os totais iguais
+(exatos) aos do SummaryView.
+
+Definições:
+- `series[].*_avg_3` / `*_avg_12`: média dos 3/12 meses terminando naquele mês
+  (contando só meses desde a primeira movimentação do usuário);
+- `by_category[].avg_3` / `avg_12`: média dos 3/12 meses fechados antes do mês
+  de referência (a base pra comparar o mês atual);
+- `yoy_*`: mês de referência contra o mesmo mês do ano anterior; no mês
+  corrente compara só até o dia de hoje nos dois anos;
+- `forecast` (só no mês corrente): o que já entrou/saiu até hoje, mais o que já
+  está lançado pros próximos dias ou, se for maior, a média do que entrou/saiu
+  depois deste dia do mês nos últimos 12 meses (sem histórico, o ritmo diário
+  do mês projetado até o fim). Mês arquivado conta inteiro no dia 1.
+"""
+import calendar
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.db import connections
+from django.db.models import BigIntegerField, Sum, Value
+from django.db.models.functions import Cast, Round
+
+from .models import ArchivedMonthTotal, Category, Transaction
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 120
+WINDOWS = (3, 12)
+EPOCH = date(1970, 1, 1).toordinal()
+
+
+def cents(expression):
+    ''' Valor em centavos inteiros (arredonda antes do cast: no SQLite o decimal vem como REAL) '''
+    return Cast(Round(expression * Value(Decimal(100))), BigIntegerField())
+
+
+def money(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _month_label(index: int) -> str:
+    year, month = divmod(int(index), 12)
+    return f"{year + 1970:04d}-{month + 1:02d}"
+
+
+def _month_index(year: int, month: int) -> int:
+    ''' meses desde 1970-01, o mesmo que datetime64[M] '''
+    return (year - 1970) * 12 + month - 1
+
+
+def _rounded_div(values, divisor):
+    ''' divisão inteira arredondando (meio pra cima), elemento a elemento '''
+    return (2 * values + divisor) // (2 * divisor)
+
+
+@dataclass
+class DailyTotals:
+    '''
+    Totais diários do usuário em arrays paralelos (uma posição por
+    dia/categoria/tipo). `column` = índice da categoria * 2 + (1 se entrada).
+    '''
+    month: np.ndarray        # meses desde 1970-01
+    day: np.ndarray          # dia do mês (1..31)
+    column: np.ndarray
+    cents: np.ndarray        # int64
+    category_ids: np.ndarray  # id da categoria de cada índice (-1 = sem categoria)
+
+    @property
+    def columns(self) -> int:
+        return 2 * len(self.category_ids)
+
+
+def raw_rows(qs) -> list[tuple]:
+    ''' Linhas do queryset sem os conversores do Django (um por valor, pesa em dezenas de milhares de linhas) '''
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def to_days(dates) -> np.ndarray:
+    if isinstance(dates[0], str):  # SQLite devolve a data como texto
+        return np.array(dates, dtype="datetime64[D]")
+    # toordinal é bem mais rápido que o numpy convertendo objetos date
+    return (np.array([d.toordinal() for d in dates], dtype=np.int64) - EPOCH).astype("datetime64[D]")
+
+
+def load_daily_totals(user) -> DailyTotals:
+    live = (
+        Transaction.objects.filter(user=user)
+        .order_by()
+        .values("date", "category_id", "type")
+        .annotate(cents=cents(Sum("amount")))
+    )
+    archived = (
+        ArchivedMonthTotal.objects.filter(user=user)
+        .order_by()
+        .values("month", "category_id", "type")
+        .annotate(cents=cents(Sum("total")))
+    )
+    rows = raw_rows(live) + raw_rows(archived)
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return DailyTotals(empty, empty, empty, empty, empty)
+
+    dates, categories, types, amounts = zip(*rows)
+    days = to_days(dates)
+    months = days.astype("datetime64[M]")
+    category_ids, category_index = np.unique(
+        np.array([-1 if c is None else c for c in categories], dtype=np.int64), return_inverse=True
+    )
+    income = np.array(types) == Transaction.Type.INCOME
+    return DailyTotals(
+        month=months.astype(np.int64),
+        day=(days - months).astype(np.int64) + 1,
+        column=category_index.astype(np.int64) * 2 + income,
+        cents=np.array(amounts, dtype=np.int64),
+        category_ids=category_ids,
+    )
+
+
+def _by_type(matrix) -> tuple[np.ndarray, np.ndarray]:
+    ''' (entradas, saídas) somando as colunas de categoria '''
+    return matrix[..., 1::2].sum(axis=-1), matrix[..., 0::2].sum(axis=-1)
+
+
+def _column_sums(totals: DailyTotals, mask) -> np.ndarray:
+    sums = np.zeros(totals.columns, dtype=np.int64)
+    np.add.at(sums, totals.column[mask], totals.cents[mask])
+    return sums
+
+
+def build_analytics(
+    user, year: int, month: int, months: int = DEFAULT_MONTHS, today: date | None = None,
+    totals: DailyTotals | None = None,
+) -> dict:
+    '''
+    Payload do AnalyticsView (valores em Decimal, como o build_summary).
+    `totals` já carregado (ex.: do razão em memória, finance/ledger.py) evita as consultas.
+    '''
+    today = today or date.today()
+    months = max(1, min(months, MAX_MONTHS))
+    totals = load_daily_totals(user) if totals is None else totals
+    ref = _month_index(year, month)
+
+    has_data = len(totals.cents) > 0
+    first = int(totals.month.min()) if has_data else ref
+    # folga de 12 meses antes da janela pras médias móveis e o ano anterior
+    start = min(first, ref - months - max(WINDOWS) + 1)
+    end = max(int(totals.month.max()) if has_data else ref, ref)
+
+    matrix = np.zeros((end - start + 1, totals.columns), dtype=np.int64)
+    np.add.at(matrix, (totals.month - start, totals.column), totals.cents)
+    # linha i de `cumulative` = soma dos meses antes do mês i
+    cumulative = np.zeros((matrix.shape[0] + 1, totals.columns), dtype=np.int64)
+    np.cumsum(matrix, axis=0, out=cumulative[1:])
+
+    r = ref - start
+    first_row = first - start
+    window = np.arange(r - months + 1, r + 1)
+
+    # série mensal com médias móveis (terminando no próprio mês)
+    income, expense = _by_type(matrix)
+    cum_income, cum_expense = _by_type(cumulative)
+    series = []
+    rolling = {}
+    for k in WINDOWS:
+        divisor = np.clip(window - first_row + 1, 1, k)
+        rolling[k] = (
+            _rounded_div(cum_income[window + 1] - cum_income[window + 1 - k], divisor),
+            _rounded_div(cum_expense[window + 1] - cum_expense[window + 1 - k], divisor),
+        )
+    for pos, i in enumerate(window):
+        item = {
+            "month": _month_label(start + i),
+            "income": money(income[i]),
+            "expense": money(expense[i]),
+            "balance_month": money(income[i] - expense[i]),
+        }
+        for k in WINDOWS:
+            item[f"income_avg_{k}"] = money(rolling[k][0][pos])
+            item[f"expense_avg_{k}"] = money(rolling[k][1][pos])
+        series.append(item)
+
+    # mês corrente: compara/projeta só até hoje
+    current = ref == _month_index(today.year, today.month)
+    month_mask = totals.month == ref
+    to_date = totals.day <= today.day if current else np.ones(len(totals.cents), dtype=bool)
+    this_year = _column_sums(totals, month_mask & to_date)
+    previous_year = _column_sums(totals, (totals.month == ref - 12) & to_date)
+
+    # categorias: mês de referência contra as médias dos meses fechados anteriores
+    completed = r - first_row
+    baselines = {}
+    for k in WINDOWS:
+        n = min(max(completed, 0), k)
+        baselines[k] = _rounded_div(cumulative[r] - cumulative[r - k], n) if n else None
+
+    active = matrix[window].any(axis=0) | previous_year.astype(bool)
+    names = dict(
+        Category.objects.filter(id__in=[int(c) for c in totals.category_ids if c >= 0]).values_list("id", "name")
+    )
+    by_category = []
+    for column in np.flatnonzero(active):
+        category_id = int(totals.category_ids[column // 2])
+        delta = this_year[column] - previous_year[column]
+        by_category.append({
+            "category__id": category_id if category_id >= 0 else None,
+            "category__name": names.get(category_id),
+            "type": Transaction.Type.INCOME if column % 2 else Transaction.Type.EXPENSE,
+            "total": money(matrix[r, column]),
+            **{
+                f"avg_{k}": None if baselines[k] is None else money(baselines[k][column])
+                for k in WINDOWS
+            },
+            "previous_year": money(previous_year[column]),
+            "yoy_delta": money(delta),
+            "yoy_pct": round(float(delta) * 100 / float(previous_year[column]), 1) if previous_year[column] else None,
+            "trend": [money(v) for v in matrix[window, column]],
+        })
+    by_category.sort(key=lambda r: (r["type"], r["category__name"] is None, r["category__name"] or ""))
+
+    balance_total = int(totals.cents[totals.column % 2 == 1].sum() - totals.cents[totals.column % 2 == 0].sum())
+    return {
+        "month": _month_label(ref),
+        "months": months,
+        "balance_total": money(balance_total),
+        "series": series,
+        "by_category": by_category,
+        "forecast": _forecast(totals, ref, today, month_mask, to_date, balance_total, first) if current else None,
+    }
+
+
+def _forecast(totals: DailyTotals, ref: int, today: date, month_mask, to_date, balance_total: int, first: int) -> dict:
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    income = totals.column % 2 == 1
+
+    def split(mask):
+        return int(totals.cents[mask & income].sum()), int(totals.cents[mask & ~income].sum())
+
+    so_far = split(month_mask & to_date)
+    scheduled = split(month_mask & ~to_date)
+    history = min(max(ref - first, 0), 12)
+    if history:
+        rest = split((totals.month >= ref - history) & (totals.month < ref) & (totals.day > today.day))
+        usual = [_rounded_div(v, history) for v in rest]
+    else:
+        usual = [_rounded_div(v * (days_in_month - today.day), today.day) for v in so_far]
+    projected = [done + max(planned, typical) for done, planned, typical in zip(so_far, scheduled, usual)]
+
+    month_balance = so_far[0] - so_far[1] + scheduled[0] - scheduled[1]
+    projected_balance = projected[0] - projected[1]
+    return {
+        "days_elapsed": today.day,
+        "days_in_month": days_in_month,
+        "income": money(so_far[0]),
+        "expense": money(so_far[1]),
+        "projected_income": money(projected[0]),
+        "projected_expense": money(projected[1]),
+        "projected_balance_month": money(projected_balance),
+        "projected_balance_total": money(balance_total - month_balance + projected_balance),
+    }
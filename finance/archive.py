@@ -0,0 +1,352 @@
+'''finance/archive.py'''
+"""
+Arquivamento do histórico frio de transações.
+
+Transações mais antigas que o horizonte (FINANCE_ARCHIVE_AFTER_MONTHS) saem da
+tabela quente e vão pra TransactionArchive: um registro por usuário/ano com as
+linhas em JSON compactado. No lugar delas ficam snapshots ArchivedMonthTotal
+(soma por mês/tipo/categoria), que o SummaryView usa pra manter saldo e totais
+mensais corretos.
+
+O horizonte é sempre o primeiro dia de um mês, então um mês é arquivado inteiro.
+A listagem de transações lê do arquivo (read-through) quando o mês pedido é
+anterior ao horizonte ou, sem mês, quando a página/filtro/ordem precisa das
+linhas arquivadas; o retrieve de um id arquivado acha o ano pela faixa de ids.
+`restore_user` devolve as linhas pra tabela.
+"""
+import heapq
+import json
+import zlib
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Max, Sum
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .budgets import add_spending, record_spending, spending_row
+from .models import ArchivedMonthTotal, Category, Transaction, TransactionArchive
+from .sharding import shard_aliases, shard_for_user_id, use_shard
+from .sync import bump_epoch, next_seq
+
+# colunas guardadas no payload, nessa ordem
+FIELDS = ("id", "type", "amount", "date", "description", "category_id", "created_at")
+# ids por DELETE (fica abaixo do limite de parâmetros do SQLite)
+DELETE_CHUNK = 500
+
+
+def archive_after_months() -> int:
+    return getattr(settings, "FINANCE_ARCHIVE_AFTER_MONTHS", 24)
+
+
+def archive_horizon(today: date | None = None, months: int | None = None) -> date:
+    ''' Primeiro dia do mês a partir do qual as transações continuam na tabela '''
+    today = today or date.today()
+    months = archive_after_months() if months is None else months
+    total = today.year * 12 + (today.month - 1) - months
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def encode_rows(rows: list[dict]) -> bytes:
+    packed = [
+        [
+            r["id"], r["type"], str(r["amount"]), r["date"].isoformat(), r["description"],
+            r["category_id"], r["created_at"].isoformat(),
+        ]
+        for r in rows
+    ]
+    return zlib.compress(json.dumps(packed, separators=(",", ":"), ensure_ascii=False).encode(), 6)
+
+
+def decode_rows(payload: bytes) -> list[dict]:
+    rows = []
+    for values in json.loads(zlib.decompress(bytes(payload))):
+        row = dict(zip(FIELDS, values))
+        row["amount"] = Decimal(row["amount"])
+        row["date"] = parse_date(row["date"])
+        row["created_at"] = parse_datetime(row["created_at"])
+        rows.append(row)
+    return rows
+
+
+def _month_key(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def archive_user_year(user_id: int, year: int, before: date) -> int:
+    '''
+    Arquiva as transações do usuário no `year` com data < `before`.
+    Tudo na mesma transação: payload, snapshots e DELETE das linhas arquivadas.
+    '''
+    with use_shard(shard_for_user_id(user_id)), transaction.atomic(using=router.db_for_write(Transaction)):
+        return _archive_user_year(user_id, year, before)
+
+
+def _archive_user_year(user_id: int, year: int, before: date) -> int:
+    end = min(before, date(year + 1, 1, 1))
+    fresh = list(
+        Transaction.objects
+        .filter(user_id=user_id, date__gte=date(year, 1, 1), date__lt=end)
+        .order_by("date", "id")
+        .values(*FIELDS)
+    )
+    if not fresh:
+        return 0
+
+    archive = TransactionArchive.objects.select_for_update().filter(user_id=user_id, year=year).first()
+    previous = decode_rows(archive.payload) if archive else []
+    if archive is None:
+        archive = TransactionArchive(user_id=user_id, year=year)
+
+    # snapshots calculados das mesmas linhas que serão apagadas (não de um
+    # aggregate separado), pra não perder nada lançado no meio do caminho
+    totals = defaultdict(lambda: [Decimal("0.00"), 0])
+    for r in fresh:
+        key = (_month_key(r["date"]), r["type"], r["category_id"])
+        totals[key][0] += r["amount"]
+        totals[key][1] += 1
+
+    existing = {
+        (s.month, s.type, s.category_id): s
+        for s in ArchivedMonthTotal.objects.filter(
+            user_id=user_id, month__gte=date(year, 1, 1), month__lt=date(year + 1, 1, 1)
+        )
+    }
+    to_create, to_update = [], []
+    for key, (total, count) in totals.items():
+        snapshot = existing.get(key)
+        if snapshot:
+            snapshot.total += total
+            snapshot.count += count
+            to_update.append(snapshot)
+        else:
+            month, tx_type, category_id = key
+            to_create.append(ArchivedMonthTotal(
+                user_id=user_id, month=month, type=tx_type, category_id=category_id, total=total, count=count,
+            ))
+    ArchivedMonthTotal.objects.bulk_create(to_create)
+    ArchivedMonthTotal.objects.bulk_update(to_update, ["total", "count"])
+
+    rows = sorted(previous + fresh, key=lambda r: (r["date"], r["id"]))
+    archive.payload = encode_rows(rows)
+    archive.row_count = len(rows)
+    archive.first_date = rows[0]["date"]
+    archive.last_date = rows[-1]["date"]
+    archive.first_id = min(r["id"] for r in rows)
+    archive.last_id = max(r["id"] for r in rows)
+    archive.save()
+
+    ids = [r["id"] for r in fresh]
+    for i in range(0, len(ids), DELETE_CHUNK):
+        # _raw_delete: DELETE direto, sem o collector carregar as linhas
+        qs = Transaction.objects.filter(user_id=user_id, id__in=ids[i:i + DELETE_CHUNK])
+        qs._raw_delete(qs.db)
+    # linhas saíram sem tombstone: caches do razão recarregam
+    bump_epoch(user_id)
+    return len(fresh)
+
+
+def archive_user(user_id: int, before: date) -> int:
+    with use_shard(shard_for_user_id(user_id)):
+        years = list(
+            Transaction.objects.filter(user_id=user_id, date__lt=before)
+            .dates("date", "year")
+        )
+    return sum(archive_user_year(user_id, d.year, before) for d in years)
+
+
+def archive_all(before: date, user_id: int | None = None, log=None) -> dict:
+    '''
+    Arquiva tudo com data < `before`, usuário por usuário (uma transação por usuário/ano).
+    '''
+    log = log or (lambda msg: None)
+    user_ids = set()
+    # com sharding, procura em todos os shards
+    for alias in shard_aliases() or [None]:
+        with use_shard(alias):
+            qs = Transaction.objects.filter(date__lt=before)
+            if user_id is not None:
+                qs = qs.filter(user_id=user_id)
+            user_ids |= set(qs.order_by().values_list("user_id", flat=True).distinct())
+    user_ids = sorted(user_ids - {None})
+
+    archived = 0
+    for uid in user_ids:
+        count = archive_user(uid, before)
+        archived += count
+        log(f"usuário {uid}: {count} transações arquivadas")
+    return {"users": len(user_ids), "transactions": archived}
+
+
+def restore_user(user_id: int, year: int | None = None) -> int:
+    '''
+    Devolve pra tabela as transações arquivadas do usuário (de um ano ou todas),
+    com os ids originais, e remove os snapshots correspondentes.
+    '''
+    with use_shard(shard_for_user_id(user_id)), transaction.atomic(using=router.db_for_write(Transaction)):
+        return _restore_user(user_id, year)
+
+
+def _restore_user(user_id: int, year: int | None) -> int:
+    archives = TransactionArchive.objects.select_for_update().filter(user_id=user_id)
+    if year is not None:
+        archives = archives.filter(year=year)
+
+    restored = 0
+    # linhas restauradas voltam pro delta-sync como alteradas
+    seq = next_seq(user_id, using=archives.db) if archives.exists() else 0
+    for archive in archives:
+        rows = decode_rows(archive.payload)
+        known = set(
+            Category.objects.filter(id__in={r["category_id"] for r in rows if r["category_id"]})
+            .values_list("id", flat=True)
+        )
+        fallback = None
+        objs = []
+        for r in rows:
+            if r["category_id"] not in known:
+                # categoria apagada depois do arquivamento: mesma regra do destroy
+                if fallback is None:
+                    fallback, _ = Category.objects.get_or_create(user=None, name="Outros")
+                r["category_id"] = fallback.id
+            objs.append(Transaction(user_id=user_id, sync_seq=seq, **r))
+        Transaction.objects.bulk_create(objs, batch_size=1000)
+        # o auto_now_add troca o created_at no bulk_create: volta o original
+        for obj, r in zip(objs, rows):
+            obj.created_at = r["created_at"]
+        Transaction.objects.bulk_update(objs, ["created_at"], batch_size=1000)
+
+        snapshots = ArchivedMonthTotal.objects.filter(
+            user_id=user_id, month__gte=date(archive.year, 1, 1), month__lt=date(archive.year + 1, 1, 1)
+        )
+        # o contador de gasto já tinha os snapshots; só muda o que trocou de categoria no caminho
+        spending = {}
+        for category_id, tx_type, total, count, month in snapshots.values_list(
+            "category_id", "type", "total", "count", "month"
+        ):
+            add_spending(spending, user_id, category_id, tx_type, total, month, sign=-1, count=count)
+        for obj in objs:
+            add_spending(spending, *spending_row(obj))
+        record_spending(spending, archives.db)
+        snapshots.delete()
+        archive.delete()
+        restored += len(rows)
+    if restored:
+        bump_epoch(user_id)
+    return restored
+
+
+def archived_transactions(user, start: date | None = None, end: date | None = None) -> list[Transaction]:
+    '''
+    Read-through: transações arquivadas do usuário em [start, end) (None = sem
+    limite daquele lado), como instâncias não salvas de Transaction (com a
+    categoria já preenchida), prontas pro serializer.
+    '''
+    archives = TransactionArchive.objects.filter(user=user)
+    if start is not None:
+        archives = archives.filter(year__gte=start.year, last_date__gte=start)
+    if end is not None:
+        archives = archives.filter(year__lte=end.year, first_date__lt=end)
+    rows = [
+        r for a in archives for r in decode_rows(a.payload)
+        if (start is None or start <= r["date"]) and (end is None or r["date"] < end)
+    ]
+    return _as_transactions(user, rows)
+
+
+def archived_extent(user, tx_type: str | None = None) -> tuple[int, date | None]:
+    '''
+    Quantas transações o usuário tem no arquivo (de um tipo ou todas) e a maior
+    data arquivada, sem descompactar nada: metadados dos arquivos + snapshots.
+    '''
+    archives = TransactionArchive.objects.filter(user=user)
+    extent = archives.aggregate(count=Sum("row_count"), last_date=Max("last_date"))
+    if tx_type is not None:
+        extent["count"] = ArchivedMonthTotal.objects.filter(user=user, type=tx_type).aggregate(n=Sum("count"))["n"]
+    return extent["count"] or 0, extent["last_date"]
+
+
+def archived_transaction(user, pk: int) -> Transaction | None:
+    ''' Uma transação arquivada pelo id (retrieve de um id que saiu da tabela) '''
+    # só os anos cuja faixa de ids cobre o pk (quase sempre um)
+    archives = TransactionArchive.objects.filter(user=user, first_id__lte=pk, last_id__gte=pk)
+    for payload in archives.values_list("payload", flat=True):
+        found = [r for r in decode_rows(payload) if r["id"] == pk]
+        if found:
+            return _as_transactions(user, found)[0]
+    return None
+
+
+def _as_transactions(user, rows: list[dict]) -> list[Transaction]:
+    if not rows:
+        return []
+    categories = Category.objects.in_bulk({r["category_id"] for r in rows if r["category_id"]})
+    result = []
+    for r in rows:
+        tx = Transaction(user=user, **r)
+        tx.category = categories.get(r["category_id"])
+        result.append(tx)
+    return result
+
+
+def _sort_value(value, descending: bool):
+    if not descending:
+        return value
+    if isinstance(value, datetime):
+        return -value.timestamp()
+    if isinstance(value, date):
+        return -value.toordinal()
+    return -value
+
+
+class MergedRows:
+    '''
+    Transações da tabela (queryset) + arquivadas, na ordem de `ordering`, como
+    uma sequência que o Paginator fatia: a página k só busca no banco as
+    primeiras (k + 1) * page_size linhas, nunca a tabela do usuário inteira.
+
+    `archived` é a lista ou uma função que a carrega. Com `count` (quantas são) e
+    `last_date` (a maior data arquivada) conhecidos e ordem por -date, a página
+    que cabe nas linhas da tabela mais novas que o arquivo sai sem carregá-lo.
+    '''
+
+    def __init__(self, queryset, archived, ordering: list[str], count: int | None = None,
+                 last_date: date | None = None):
+        if not any(field.lstrip("-") == "id" for field in ordering):
+            ordering = [*ordering, "-id"]
+        self.queryset = queryset.order_by(*ordering)
+        self.key = lambda tx: tuple(
+            _sort_value(getattr(tx, field.lstrip("-")), field.startswith("-")) for field in ordering
+        )
+        self._load = archived if callable(archived) else (lambda: archived)
+        self._rows = None
+        self._count = count
+        self.last_date = last_date if ordering[0] == "-date" else None
+
+    @property
+    def archived(self) -> list[Transaction]:
+        if self._rows is None:
+            self._rows = sorted(self._load(), key=self.key)
+        return self._rows
+
+    def count(self) -> int:
+        archived = self._count if self._count is not None else len(self.archived)
+        return self.queryset.count() + archived
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if stop is None:
+            return list(islice(heapq.merge(self.queryset, self.archived, key=self.key), start, None))
+        live = list(self.queryset[:stop])
+        if self.last_date is not None and len(live) == stop and live[-1].date > self.last_date:
+            # a página inteira é mais nova que tudo no arquivo
+            return live[start:stop]
+        return list(islice(heapq.merge(live, self.archived, key=self.key), start, stop))
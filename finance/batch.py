@@ -0,0 +1,264 @@
+'''finance/batch.py'''
+"""
+Escrita em lote pros clientes offline: POST /api/transactions/batch/ com uma
+lista de até MAX_OPERATIONS operações, aplicadas em ordem numa transação só:
+
+    [
+        {"op": "create", "key": "c-1", "data": {"type": "OUT", "amount": "9.90", "date": "2026-01-05"}},
+        {"op": "update", "key": "u-1", "id": 7, "data": {"amount": "12.00"}},
+        {"op": "delete", "key": "d-1", "id": 8}
+    ]
+
+Resposta: `{"results": [...]}` na mesma ordem, com `status` (201, 200, 204 ou
+404 pra id que não existe/não é do usuário), `id` e `transaction`.
+
+- Validação pelo BatchTransactionListSerializer (as categorias citadas vêm numa
+  consulta só); qualquer operação inválida devolve 400 com os erros por
+  posição e nada é aplicado. Id inexistente não invalida o lote: vira um 404
+  naquela posição.
+- Sem categoria (ou category=null): regras do usuário (finance/categorize.py)
+  pro lote todo de uma vez, depois o "Outros".
+- `key` (opcional, única por usuário): o resultado fica guardado
+  (IdempotencyKey) e reenviar a mesma chave devolve o resultado de antes com
+  `replayed: true`, sem aplicar de novo. As chaves duram
+  FINANCE_IDEMPOTENCY_DAYS (padrão 30; `manage.py prune_tombstones` apaga).
+- bulk_create / bulk_update / DELETE em lote: cada operação reserva o seu
+  número da sequência do delta-sync (um `next_seq` pro lote todo) e as remoções
+  deixam tombstones, como o save()/delete() fariam pelos signals; os
+  contadores de gasto dos orçamentos (finance/budgets.py) mudam numa chamada só.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .budgets import add_spending, record_spending, spending_row
+from .categorize import categorize_many, default_category
+from .events import publish_on_commit
+from .models import Category, IdempotencyKey, Tombstone, Transaction
+from .serializers import BatchOperationSerializer, BatchTransactionSerializer, TransactionSerializer
+from .sharding import shard_aliases, use_shard
+from .sync import lock_counters, next_seq
+
+MAX_OPERATIONS = 1000
+# obrigatórios no create (o lote valida tudo como parcial, por causa dos updates)
+REQUIRED_ON_CREATE = ("type", "amount", "date")
+
+
+class BatchConflict(Exception):
+    ''' Outro envio com as mesmas chaves gravou primeiro: o cliente tenta de novo e recebe o replay '''
+
+
+def idempotency_retention_days() -> int:
+    return getattr(settings, "FINANCE_IDEMPOTENCY_DAYS", 30)
+
+
+def _months(*dates):
+    return sorted({f"{d:%Y-%m}" for d in dates if d})
+
+
+def _validate(request, payload) -> tuple[list[dict], dict, dict]:
+    '''
+    (operações, resultados guardados por chave, campos validados por posição).
+    ValidationError com os erros por posição se alguma operação for inválida.
+    '''
+    envelope = BatchOperationSerializer(data=payload, many=True, max_length=MAX_OPERATIONS, allow_empty=False)
+    envelope.is_valid(raise_exception=True)
+    operations = envelope.validated_data
+
+    keys = [op.get("key") for op in operations]
+    repeated = {key for key, n in Counter(k for k in keys if k).items() if n > 1}
+    if repeated:
+        raise serializers.ValidationError(
+            [{"key": ["Chave repetida no lote."]} if key in repeated else {} for key in keys]
+        )
+    stored = {}
+    if any(keys):
+        stored = dict(
+            IdempotencyKey.objects.filter(user=request.user, key__in=[k for k in keys if k])
+            .values_list("key", "result")
+        )
+
+    # o que já foi aplicado num envio anterior não é validado de novo
+    writes = [
+        i for i, op in enumerate(operations)
+        if op["op"] != "delete" and op.get("key") not in stored
+    ]
+    items = BatchTransactionSerializer(
+        data=[operations[i]["data"] for i in writes], many=True, partial=True, context={"request": request}
+    )
+    items.is_valid()
+    errors = [{} for _ in operations]
+    for i, item_errors in zip(writes, items.errors or [{}] * len(writes)):
+        missing = {
+            name: [serializers.Field.default_error_messages["required"]]
+            for name in REQUIRED_ON_CREATE
+            if operations[i]["op"] == "create" and name not in operations[i]["data"]
+        }
+        if item_errors or missing:
+            errors[i] = {"data": {**missing, **item_errors}}
+    if any(errors):
+        raise serializers.ValidationError(errors)
+    return operations, stored, dict(zip(writes, items.validated_data))
+
+
+def _fill_categories(user, operations, fields: dict, existing: dict):
+    ''' Categoria pelas regras (uma passada pro lote) ou "Outros" onde não veio/veio null '''
+    pending = []
+    for i, attrs in fields.items():
+        op = operations[i]
+        if op["op"] == "create" and attrs.get("category") is None:
+            instance = None
+        elif op["op"] == "update" and "category" in attrs and attrs["category"] is None:
+            instance = existing.get(op["id"])
+        else:
+            continue
+        pending.append((i, instance))
+    if not pending:
+        return
+
+    suggested = categorize_many(user, [
+        (
+            fields[i].get("description", getattr(instance, "description", "")),
+            fields[i].get("amount", getattr(instance, "amount", None)),
+        )
+        for i, instance in pending
+    ])
+    found = Category.objects.in_bulk({pk for pk in suggested if pk is not None})
+    fallback = default_category(user) if any(pk is None or pk not in found for pk in suggested) else None
+    for (i, _), pk in zip(pending, suggested):
+        fields[i]["category"] = found.get(pk) or fallback
+
+
+def apply_batch(request, payload) -> list[dict]:
+    '''
+    Aplica o lote e devolve os resultados na ordem das operações.
+    ValidationError (400) se alguma for inválida; BatchConflict se outro envio
+    com as mesmas chaves gravou no meio do caminho.
+    '''
+    user = request.user
+    operations, stored, fields = _validate(request, payload)
+
+    using = router.db_for_write(Transaction)
+    try:
+        with transaction.atomic(using=using):
+            # com o contador do usuário travado as transações lidas aqui não
+            # mudam até o commit (toda escrita passa pelo next_seq)
+            lock_counters([user.pk], using)
+            ids = {op["id"] for op in operations if op["op"] != "create" and op.get("key") not in stored}
+            existing = (
+                Transaction.objects.using(using).select_related("category").filter(user=user).in_bulk(ids)
+                if ids else {}
+            )
+            _fill_categories(user, operations, fields, existing)
+            plan, results = _plan(user, operations, stored, fields, existing)
+
+            _write(user, plan, using)
+            for i, action, tx, _, _ in plan:
+                results[i] = {
+                    "op": action, "status": {"create": 201, "update": 200, "delete": 204}[action], "id": tx.pk,
+                }
+            written = [(i, tx) for i, action, tx, _, _ in plan if action != "delete"]
+            data = TransactionSerializer([tx for _, tx in written], many=True).data
+            for (i, _), item in zip(written, data):
+                results[i]["transaction"] = item
+            IdempotencyKey.objects.bulk_create([
+                IdempotencyKey(user=user, key=op["key"], result=results[i])
+                for i, op in enumerate(operations)
+                if op.get("key") and op["key"] not in stored
+            ])
+    except IntegrityError as exc:
+        # só é conflito se outro envio gravou alguma das nossas chaves
+        # (uniq_idempotency_key_per_user); qualquer outro erro de integridade sobe
+        keys = [op["key"] for op in operations if op.get("key") and op["key"] not in stored]
+        if keys and IdempotencyKey.objects.using(using).filter(user=user, key__in=keys).exists():
+            raise BatchConflict() from exc
+        raise
+    return results
+
+
+def _plan(user, operations, stored: dict, fields: dict, existing: dict) -> tuple[list, list]:
+    '''
+    Plano na ordem das operações: (posição, ação, transação, como estava antes,
+    campos alterados), e os resultados já conhecidos (replays e 404).
+    '''
+    plan = []
+    results = [None] * len(operations)
+    deleted = set()
+    for i, op in enumerate(operations):
+        if op.get("key") in stored:
+            results[i] = {**stored[op["key"]], "replayed": True}
+            continue
+        if op["op"] == "create":
+            plan.append((i, "create", Transaction(user=user, **fields[i]), None, ()))
+            continue
+        tx = existing.get(op["id"])
+        if tx is None or tx.pk in deleted:
+            results[i] = {"op": op["op"], "status": 404, "id": op["id"], "detail": "Transação não encontrada."}
+            continue
+        if op["op"] == "delete":
+            deleted.add(tx.pk)
+            plan.append((i, "delete", tx, None, ()))
+        else:
+            previous = spending_row(tx)
+            for name, value in fields[i].items():
+                setattr(tx, name, value)
+            plan.append((i, "update", tx, previous, tuple(fields[i])))
+    return plan, results
+
+
+def _write(user, plan, using: str):
+    if not plan:
+        return
+    last = next_seq(user.pk, len(plan), using=using)
+    created, updated, removed, tombstones = [], {}, [], []
+    events, spending = [], {}
+    for seq, (_, action, tx, previous, names) in enumerate(plan, start=last - len(plan) + 1):
+        if action == "delete":
+            removed.append(tx.pk)
+            tombstones.append(Tombstone(user=user, kind=Tombstone.Kind.TRANSACTION, object_id=tx.pk, sync_seq=seq))
+            events.append((seq, tx, {"deleted": True, "months": _months(tx.date)}))
+            add_spending(spending, *spending_row(tx), sign=-1)
+            continue
+        tx.sync_seq = seq
+        if action == "create":
+            created.append(tx)
+        else:
+            # só os campos que o cliente mandou pra essa transação
+            updated.setdefault(tx.pk, (tx, {"sync_seq"}))[1].update(names)
+            events.append((seq, tx, {"deleted": False, "months": _months(tx.date, previous[4])}))
+            add_spending(spending, *previous, sign=-1)
+        add_spending(spending, *spending_row(tx))
+
+    Transaction.objects.bulk_create(created, batch_size=500)
+    # um bulk_update por conjunto de campos: nenhuma linha regrava campo que o cliente não mandou
+    by_fields = defaultdict(list)
+    for tx, names in updated.values():
+        by_fields[tuple(sorted(names))].append(tx)
+    for names, txs in by_fields.items():
+        Transaction.objects.bulk_update(txs, names, batch_size=500)
+    if removed:
+        # sem passar pelos signals: os tombstones vão no bulk_create abaixo, com o seq de cada operação
+        Transaction.objects.filter(user=user, pk__in=removed)._raw_delete(using)
+        Tombstone.objects.bulk_create(tombstones, batch_size=500)
+    record_spending(spending, using)
+
+    for tx in created:
+        events.append((tx.sync_seq, tx, {"deleted": False, "months": _months(tx.date)}))
+    for seq, tx, data in sorted(events, key=lambda e: e[0]):
+        publish_on_commit(user.pk, Tombstone.Kind.TRANSACTION, seq, {"id": tx.pk, **data}, using)
+
+
+def prune_idempotency_keys(days: int | None = None) -> int:
+    ''' Apaga as chaves mais antigas que `days` (FINANCE_IDEMPOTENCY_DAYS) em todos os bancos '''
+    days = idempotency_retention_days() if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    removed = 0
+    for alias in shard_aliases() or [None]:
+        with use_shard(alias):
+            old = IdempotencyKey.objects.filter(created_at__lt=cutoff)
+            removed += old._raw_delete(old.db)
+    return removed
@@ -0,0 +1,322 @@
+'''finance/budgets.py'''
+"""
+Orçamentos por categoria e mês (Budget) e os contadores de gasto que eles leem.
+
+SpendingCounter guarda, por (usuário, categoria, mês), a soma e a quantidade
+das saídas, as da tabela e as arquivadas (arquivar não muda o contador). Toda
+escrita em Transaction atualiza o contador na mesma transação do banco:
+
+- save()/delete(): signals (finance/signals.py), com os valores anteriores
+  lidos no pre_save;
+- lotes (finance/batch.py, finance/recurring.py): os deltas do lote todo numa
+  chamada de `record_spending`;
+- categoria trocada em massa: `move_spending` antes do UPDATE (regras) e
+  `move_category` no CategoryViewSet.destroy, que leva o contador inteiro
+  (arquivadas inclusive) pro "Outros".
+
+Entrada e transação sem categoria não contam. Categoria apagada fora do
+destroy leva os contadores junto (CASCADE) e as transações ficam sem categoria.
+
+Quando o gasto sobe, `record_spending` confere os limiares THRESHOLDS do
+orçamento do mês (ou do recorrente) olhando só contador e orçamento: cada um
+cruzado vira um BudgetEvent (uma vez por limiar e mês) e um evento "budget" no
+stream SSE. `reconcile` (`manage.py reconcile_budgets`) recalcula os contadores
+das linhas e mostra/corrige as diferenças.
+"""
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from .events import publish_on_commit
+from .models import ArchivedMonthTotal, Budget, BudgetEvent, SpendingCounter, Transaction
+from .sharding import shard_aliases, use_shard
+from .sync import lock_counters, next_seqs
+
+THRESHOLDS = (50, 80, 100)
+# usuários por transação do banco no reconcile
+RECONCILE_USERS = 500
+
+ZERO = Decimal("0.00")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def spending_row(tx) -> tuple:
+    ''' O que o contador precisa de uma transação: (user_id, category_id, type, amount, date) '''
+    return tx.user_id, tx.category_id, tx.type, tx.amount, tx.date
+
+
+def add_spending(deltas: dict, user_id, category_id, tx_type, amount, day, sign: int = 1, count: int = 1):
+    ''' Soma uma saída (ou `count` delas, num snapshot) em `deltas`; sign=-1 tira. Entrada e sem categoria não contam '''
+    if tx_type != Transaction.Type.EXPENSE or category_id is None or user_id is None:
+        return
+    entry = deltas.setdefault((user_id, category_id, month_start(day)), [ZERO, 0])
+    entry[0] += sign * Decimal(str(amount))
+    entry[1] += sign * count
+
+
+def _apply(deltas: dict, using: str) -> dict:
+    ''' Soma os deltas nos contadores (criando os que faltam); devolve {chave: gasto depois} '''
+    counters = SpendingCounter.objects.using(using)
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        counters.bulk_create(
+            [SpendingCounter(user_id=u, category_id=c, month=m) for u, c, m in deltas], ignore_conflicts=True
+        )
+        scope = counters.filter(
+            user_id__in={k[0] for k in deltas}, category_id__in={k[1] for k in deltas}, month__in={k[2] for k in deltas}
+        )
+
+        def per_key(index, output_field):
+            return Case(
+                *[When(Q(user_id=u, category_id=c, month=m), then=Value(value[index])) for (u, c, m), value in deltas.items()],
+                default=Value(0), output_field=output_field,
+            )
+
+        scope.update(
+            spent=F("spent") + per_key(0, DecimalField(max_digits=14, decimal_places=2)),
+            count=F("count") + per_key(1, IntegerField()),
+        )
+        rows = scope.order_by().values_list("user_id", "category_id", "month", "spent")
+        return {(u, c, m): spent for u, c, m, spent in rows if (u, c, m) in deltas}
+    # no Postgres um upsert só; as linhas em ordem de chave, pra dois lotes com
+    # contadores em comum travarem na mesma ordem (sem deadlock)
+    q = connection.ops.quote_name
+    keys = sorted(deltas)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {q(SpendingCounter._meta.db_table)} AS s (user_id, category_id, month, spent, {q('count')}) "
+            f"VALUES {', '.join(['(%s, %s, %s::date, %s::numeric, %s)'] * len(keys))} "
+            "ON CONFLICT (user_id, category_id, month) DO UPDATE "
+            f"SET spent = s.spent + EXCLUDED.spent, {q('count')} = s.{q('count')} + EXCLUDED.{q('count')} "
+            "RETURNING s.user_id, s.category_id, s.month, s.spent",
+            [value for key in keys for value in (*key, *deltas[key])],
+        )
+        return {(u, c, m): spent for u, c, m, spent in cursor.fetchall()}
+
+
+def record_spending(deltas: dict, using: str):
+    '''
+    Aplica {(user_id, category_id, mês): [valor, quantidade]} nos contadores e
+    avisa dos limiares cruzados. Precisa rodar na transação da escrita.
+    '''
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not deltas:
+        return
+    # sem savepoint: sempre roda dentro da transação de quem escreveu
+    with transaction.atomic(using=using, savepoint=False):
+        after = _apply(deltas, using)
+        rising = {key: (after[key] - amount, after[key]) for key, (amount, _) in deltas.items() if amount > 0}
+        if rising:
+            _check_thresholds(rising, using)
+
+
+def _budgets_for(keys, using: str) -> dict:
+    ''' {(user_id, category_id, mês): Budget} valendo em cada chave (o do mês ganha do recorrente) '''
+    budgets = Budget.objects.using(using).filter(
+        Q(month__in={k[2] for k in keys}) | Q(month__isnull=True),
+        user_id__in={k[0] for k in keys}, category_id__in={k[1] for k in keys},
+    ).order_by()
+    by_pair = defaultdict(dict)
+    for budget in budgets:
+        by_pair[budget.user_id, budget.category_id][budget.month] = budget
+    found = {}
+    for user_id, category_id, month in keys:
+        options = by_pair.get((user_id, category_id), {})
+        budget = options.get(month) or options.get(None)
+        if budget is not None:
+            found[user_id, category_id, month] = budget
+    return found
+
+
+def _check_thresholds(rising: dict, using: str):
+    budgets = _budgets_for(rising, using)
+    events = []
+    for key, budget in budgets.items():
+        before, after = rising[key]
+        for threshold in THRESHOLDS:
+            line = budget.limit * threshold / 100
+            if before < line <= after:
+                events.append(BudgetEvent(
+                    user_id=budget.user_id, budget=budget, month=key[2], threshold=threshold, spent=after,
+                    limit=budget.limit,
+                ))
+    if not events:
+        return
+    # o gasto pode cair e subir de novo no mês: limiar já avisado não repete
+    seen = set(
+        BudgetEvent.objects.using(using)
+        .filter(budget__in={e.budget_id for e in events}, month__in={e.month for e in events})
+        .values_list("budget_id", "month", "threshold")
+    )
+    events = [e for e in events if (e.budget_id, e.month, e.threshold) not in seen]
+    if not events:
+        return
+    BudgetEvent.objects.using(using).bulk_create(events, ignore_conflicts=True)
+    per_user = Counter(e.user_id for e in events)
+    last = next_seqs(per_user, using)
+    seq = {user_id: last[user_id] - n for user_id, n in per_user.items()}
+    for event in events:
+        seq[event.user_id] += 1
+        publish_on_commit(event.user_id, "budget", seq[event.user_id], {
+            "budget": event.budget_id, "category": event.budget.category_id, "month": f"{event.month:%Y-%m}",
+            "threshold": event.threshold, "spent": f"{event.spent:.2f}", "limit": f"{event.limit:.2f}",
+        }, using)
+
+
+def move_spending(queryset, category_id: int):
+    ''' Antes de um UPDATE que leva as transações do queryset pra `category_id`: o gasto delas vai junto '''
+    rows = (
+        queryset.filter(type=Transaction.Type.EXPENSE)
+        .exclude(category_id=category_id)
+        .order_by()
+        .values_list("user_id", "category_id", TruncMonth("date"))
+        .annotate(total=Sum("amount"), n=Count("id"))
+    )
+    deltas = {}
+    for user_id, old, month, total, n in rows:
+        # sem categoria (old=None) não estava no contador: só entra no novo
+        add_spending(deltas, user_id, old, Transaction.Type.EXPENSE, total, month, sign=-1, count=n)
+        add_spending(deltas, user_id, category_id, Transaction.Type.EXPENSE, total, month, count=n)
+    record_spending(deltas, queryset.db)
+
+
+def move_category(user_id: int, old_id: int, new_id: int, using: str | None = None):
+    ''' Leva os contadores da categoria `old_id` pra `new_id` (transações e arquivadas mudaram juntas) '''
+    using = using or router.db_for_write(SpendingCounter)
+    deltas = {}
+    for month, spent, n in SpendingCounter.objects.using(using).filter(
+        user_id=user_id, category_id=old_id
+    ).values_list("month", "spent", "count"):
+        deltas[user_id, old_id, month] = [-spent, -n]
+        deltas[user_id, new_id, month] = [spent, n]
+    record_spending(deltas, using)
+
+
+def percent_of(spent, limit) -> int | None:
+    return round(spent * 100 / limit) if limit else None
+
+
+def spent_in(user_id: int, category_ids, month: date, using: str | None = None) -> dict:
+    ''' {category_id: gasto} do usuário no mês, direto dos contadores '''
+    using = using or router.db_for_read(SpendingCounter)
+    return dict(
+        SpendingCounter.objects.using(using)
+        .filter(user_id=user_id, category_id__in=set(category_ids), month=month_start(month))
+        .values_list("category_id", "spent")
+    )
+
+
+def usage(user_id: int, keys, using: str | None = None) -> dict:
+    '''
+    Uso do orçamento em cada (category_id, mês) de `keys` que tem orçamento:
+    {chave: {"budget", "limit", "spent", "percent"}}. Duas consultas, qualquer
+    que seja o número de chaves.
+    '''
+    keys = {(category_id, month_start(month)) for category_id, month in keys if category_id is not None}
+    if not keys:
+        return {}
+    using = using or router.db_for_read(SpendingCounter)
+    budgets = _budgets_for({(user_id, c, m) for c, m in keys}, using)
+    if not budgets:
+        return {}
+    spent = dict(
+        ((c, m), value) for c, m, value in SpendingCounter.objects.using(using).filter(
+            user_id=user_id, category_id__in={k[1] for k in budgets}, month__in={k[2] for k in budgets}
+        ).values_list("category_id", "month", "spent")
+    )
+    result = {}
+    for (_, category_id, month), budget in budgets.items():
+        value = spent.get((category_id, month), ZERO)
+        result[category_id, month] = {
+            "budget": budget.pk,
+            "limit": budget.limit,
+            "spent": value,
+            "percent": percent_of(value, budget.limit),
+        }
+    return result
+
+
+def _expected(user_ids, using: str) -> dict:
+    ''' Contadores recalculados das linhas: transações + snapshots arquivados '''
+    expected = defaultdict(lambda: [ZERO, 0])
+    live = (
+        Transaction.objects.using(using)
+        .filter(user_id__in=user_ids, type=Transaction.Type.EXPENSE, category__isnull=False)
+        .order_by()
+        .values_list("user_id", "category_id", TruncMonth("date"))
+        .annotate(total=Sum("amount"), n=Count("id"))
+    )
+    archived = (
+        ArchivedMonthTotal.objects.using(using)
+        .filter(user_id__in=user_ids, type=Transaction.Type.EXPENSE, category__isnull=False)
+        .order_by()
+        .values_list("user_id", "category_id", "month")
+        .annotate(total=Sum("total"), n=Sum("count"))
+    )
+    for query in (live, archived):
+        for user_id, category_id, month, total, n in query:
+            entry = expected[user_id, category_id, month]
+            entry[0] += total
+            entry[1] += n
+    return expected
+
+
+def _reconcile_users(user_ids: list, using: str, fix: bool) -> list[dict]:
+    counters = SpendingCounter.objects.using(using).filter(user_id__in=user_ids)
+    if fix:
+        # com os SyncCounter travados nenhuma escrita desses usuários entra no meio,
+        # nem a que criaria um contador novo (toda escrita passa pelo next_seq)
+        lock_counters(user_ids, using)
+    expected = _expected(user_ids, using)
+    actual = {(c.user_id, c.category_id, c.month): c for c in counters}
+    drift, to_create, to_update = [], [], []
+    for key in expected.keys() | actual.keys():
+        spent, count = expected.get(key, (ZERO, 0))
+        counter = actual.get(key)
+        if counter is not None and counter.spent == spent and counter.count == count:
+            continue
+        if counter is None and not count:
+            continue
+        drift.append({
+            "user": key[0], "category": key[1], "month": f"{key[2]:%Y-%m}",
+            "counter": counter.spent if counter else ZERO, "expected": spent,
+        })
+        if counter is None:
+            to_create.append(SpendingCounter(user_id=key[0], category_id=key[1], month=key[2], spent=spent, count=count))
+        else:
+            counter.spent, counter.count = spent, count
+            to_update.append(counter)
+    if fix:
+        SpendingCounter.objects.using(using).bulk_create(to_create)
+        SpendingCounter.objects.using(using).bulk_update(to_update, ["spent", "count"], batch_size=1000)
+    return drift
+
+
+def reconcile(fix: bool = False, user_id: int | None = None, log=None) -> list[dict]:
+    ''' Confere (e com fix=True corrige) os contadores contra as linhas, em todos os bancos '''
+    log = log or (lambda msg: None)
+    drift = []
+    for alias in shard_aliases() or [None]:
+        with use_shard(alias):
+            using = router.db_for_write(SpendingCounter)
+            if user_id is not None:
+                user_ids = [user_id]
+            else:
+                user_ids = set()
+                for model in (Transaction, ArchivedMonthTotal, SpendingCounter):
+                    user_ids |= set(model.objects.using(using).order_by().values_list("user_id", flat=True).distinct())
+                user_ids = sorted(user_ids - {None})
+            for i in range(0, len(user_ids), RECONCILE_USERS):
+                chunk = user_ids[i:i + RECONCILE_USERS]
+                with transaction.atomic(using=using):
+                    found = _reconcile_users(chunk, using, fix)
+                drift += found
+                log(f"{using}: {min(i + RECONCILE_USERS, len(user_ids))}/{len(user_ids)} usuários, {len(found)} diferenças")
+    return drift
@@ -0,0 +1,515 @@
+'''finance/categorize.py'''
+"""
+Categorização automática pelas regras do usuário (CategoryRule).
+
+As regras de um usuário viram um `RuleMatcher` só:
+- palavras-chave e prefixos num autômato Aho-Corasick (pyahocorasick, ou a
+  versão em Python puro abaixo se não estiver instalado). O prefixo entra como
+  "\\x02prefixo" e cada descrição como "\\x02descrição\\x03", então os dois
+  tipos saem da mesma varredura, que não depende de quantas regras existem;
+- regex com trechos literais obrigatórios (3+ caracteres, ex. "posto " em
+  `posto (shell|ipiranga)` ou "ifood"/"rappi" em `(ifood|rappi) .*`) põe esses
+  trechos no mesmo autômato e só roda nas descrições onde um deles apareceu;
+- as outras regex numa alternância só, na ordem de prioridade
+  (`(?=.*?(?:p1))(?P<r0>)|(?=.*?(?:p2))(?P<r1>)|...`): o primeiro ramo que
+  casa é o de menor prioridade e o grupo vazio diz qual foi;
+- regras só de valor numa lista na ordem de prioridade.
+Em lote (`match_many`) as descrições são juntas numa string e o autômato passa
+uma vez por tudo.
+
+Palavra-chave e prefixo comparam sem maiúsculas/acentos e com os espaços
+colapsados; a regex roda na descrição original com IGNORECASE. Com várias
+regras casando, vale a de menor `priority` (empate: a criada antes) cuja faixa
+de valor (se tiver) aceita o valor.
+
+O matcher fica num cache por processo (MATCHER_CACHE_SIZE usuários) e é
+reconstruído quando as regras mudam: cada `matcher_for` confere
+quantidade/última alteração das regras (uma consulta agregada).
+"""
+import re
+import threading
+import unicodedata
+from bisect import bisect_right
+from collections import OrderedDict, deque
+
+from django.db import router, transaction
+from django.db.models import Count, F, Max, Q
+
+from .budgets import move_spending
+from .models import Category, CategoryRule, Transaction
+from .sync import touch
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - dependência opcional
+    ahocorasick = None
+
+MATCHER_CACHE_SIZE = 1000
+BATCH_SIZE = 1000
+DEFAULT_CATEGORY = "Outros"
+
+START, END = "\x02", "\x03"
+_SEPARATOR = END + START
+_START = re.compile(START)
+_CONTROL = re.compile("[\x02\x03]")
+_MARKS = re.compile(r"[\u0300-\u036f]+")
+REGEX_FLAGS = re.DOTALL | re.IGNORECASE
+# regex sem um trecho literal desse tamanho vai pra regex combinada
+MIN_LITERAL = 3
+# backreference e grupo nomeado quebram a regex combinada (números/nomes dos grupos mudam)
+_UNSUPPORTED = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?<[^=!]")
+
+
+def normalize(text: str) -> str:
+    ''' Sem maiúsculas, acentos e espaços repetidos (palavras-chave e prefixos) '''
+    text = text.casefold()
+    if not text.isascii():
+        text = _MARKS.sub("", unicodedata.normalize("NFD", text))
+    return " ".join(text.split())
+
+
+def regex_branch(pattern: str) -> str:
+    ''' Trecho da regex combinada: casa se o padrão aparece em qualquer ponto da descrição '''
+    return f"(?=.*?(?:{pattern}))"
+
+
+def check_regex(pattern: str):
+    ''' ValueError se a regex não compila ou não cabe na regex combinada '''
+    if _UNSUPPORTED.search(pattern):
+        raise ValueError("Grupos nomeados e referências (\\1, (?P=...)) não são suportados.")
+    try:
+        re.compile(regex_branch(pattern), REGEX_FLAGS)
+    except re.error as exc:
+        raise ValueError(f"Regex inválida: {exc}") from exc
+
+
+class _NoLiterals(Exception):
+    ''' Trecho do padrão que a leitura conservadora não entende: regex sem filtro '''
+
+
+def _skip_quantifier(pattern: str, i: int) -> int:
+    if pattern[i:i + 1] in ("*", "+", "?"):
+        i += 1
+    elif pattern[i:i + 1] == "{":
+        close = pattern.find("}", i)
+        if close < 0:
+            raise _NoLiterals
+        i = close + 1
+    else:
+        return i
+    # lazy (*?) / possessivo (*+)
+    return i + 1 if pattern[i:i + 1] in ("?", "+") else i
+
+
+def _skip_class(pattern: str, i: int) -> int:
+    ''' Pula um [...] (com ] logo no começo ou escapado) '''
+    i += 1
+    if pattern[i:i + 1] == "^":
+        i += 1
+    if pattern[i:i + 1] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    if i >= len(pattern):
+        raise _NoLiterals
+    return i + 1
+
+
+def _sequence(pattern: str, i: int) -> tuple[list[list[frozenset]], int]:
+    '''
+    Lê o padrão a partir de `i` até o ")" do grupo (ou o fim): para cada ramo da
+    alternância, conjuntos de trechos literais dos quais toda descrição casada
+    contém pelo menos um. Só entende caractere comum, escape de pontuação,
+    grupos (?:...)/(...), alternância, classes e quantificadores; qualquer outro
+    (?...) (flags, lookaround) desiste do padrão todo.
+    '''
+    branches, run = [[]], []
+
+    def flush():
+        if run:
+            branches[-1].append(frozenset(["".join(run)]))
+            run.clear()
+
+    while i < len(pattern):
+        char = pattern[i]
+        if char == ")":
+            break
+        if char == "|":
+            flush()
+            branches.append([])
+            i += 1
+            continue
+        if char == "(":
+            if pattern.startswith("(?", i) and not pattern.startswith("(?:", i):
+                raise _NoLiterals
+            flush()
+            inner, i = _sequence(pattern, i + (3 if pattern.startswith("(?:", i) else 1))
+            if i >= len(pattern):
+                raise _NoLiterals
+            i += 1
+            optional = pattern[i:i + 1] in ("?", "*", "{")
+            i = _skip_quantifier(pattern, i)
+            if not optional:
+                branches[-1] += _required(inner)
+            continue
+        if char == "[":
+            flush()
+            i = _skip_quantifier(pattern, _skip_class(pattern, i))
+            continue
+        if char in ".^$*+?{":
+            flush()
+            i = _skip_quantifier(pattern, i + (char in ".^$"))
+            continue
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            if not escaped:
+                raise _NoLiterals
+            i += 2
+            if escaped.isalnum():  # \d, \b, \1...: não é literal
+                flush()
+                i = _skip_quantifier(pattern, i)
+                continue
+            char = escaped
+        else:
+            i += 1
+        if pattern[i:i + 1] in ("?", "*", "{"):
+            # caractere opcional: o trecho acaba antes dele
+            flush()
+            i = _skip_quantifier(pattern, i)
+        elif pattern[i:i + 1] == "+":
+            run.append(char)
+            flush()
+            i = _skip_quantifier(pattern, i)
+        else:
+            run.append(char)
+    flush()
+    return branches, i
+
+
+def _required(branches: list[list[frozenset]]) -> list[frozenset]:
+    if len(branches) == 1:
+        return branches[0]
+    # alternância: precisa de um trecho em cada ramo
+    options = [_best_literals(branch) for branch in branches]
+    return [frozenset().union(*options)] if all(options) else []
+
+
+def _best_literals(found: list[frozenset]) -> frozenset | None:
+    best, best_length = None, MIN_LITERAL - 1
+    for literals in found:
+        words = {normalize(w) for w in literals if not _CONTROL.search(w)}
+        if len(words) != len(literals):
+            continue
+        length = min(len(w) for w in words)
+        if length > best_length or (length == best_length and best is not None and len(words) < len(best)):
+            best, best_length = frozenset(words), length
+    return best
+
+
+def required_literals(pattern: str) -> frozenset | None:
+    '''
+    Trechos literais (normalizados, MIN_LITERAL+ caracteres) dos quais toda
+    descrição casada pela regex contém pelo menos um: entram no autômato como
+    filtro. None se a regex não tem (ex.: `\\d{4}\\*\\d+`) ou se a leitura do
+    padrão (só com str, sem o parser interno do `re`) não tem certeza.
+    '''
+    try:
+        branches, end = _sequence(pattern, 0)
+    except _NoLiterals:
+        return None
+    if end != len(pattern):
+        return None
+    return _best_literals(_required(branches))
+
+
+class _Automaton:
+    '''
+    Aho-Corasick em Python puro, com a mesma interface usada do
+    ahocorasick.Automaton: add_word / make_automaton / iter -> (fim, valor).
+    '''
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add_word(self, word: str, value):
+        node = 0
+        for char in word:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node] = [value]
+
+    def make_automaton(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter(self, text: str):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for value in out[node]:
+                yield end, value
+
+
+def new_automaton():
+    return ahocorasick.Automaton() if ahocorasick else _Automaton()
+
+
+class RuleMatcher:
+    '''
+    Regras de um usuário compiladas. `rules` vem na ordem de prioridade; a
+    posição na lista (rank) é o critério de desempate em tudo daqui.
+    '''
+
+    def __init__(self, rules):
+        self.categories = []
+        self.ranges = []
+        words = {}
+        combined = []
+        self.amount_ranks = []
+        self.verify = {}  # rank -> regex conferida só onde o trecho literal dela apareceu
+        for rank, rule in enumerate(rules):
+            self.categories.append(rule.category_id)
+            self.ranges.append(
+                None if rule.min_amount is None and rule.max_amount is None else (rule.min_amount, rule.max_amount)
+            )
+            if rule.kind == CategoryRule.Kind.AMOUNT:
+                self.amount_ranks.append(rank)
+                continue
+            if rule.kind == CategoryRule.Kind.REGEX:
+                literals = required_literals(rule.pattern)
+                if literals is None:
+                    combined.append((rank, rule.pattern))
+                    continue
+                self.verify[rank] = re.compile(rule.pattern, REGEX_FLAGS)
+            else:
+                word = normalize(rule.pattern)
+                if not word:
+                    continue
+                literals = [START + word if rule.kind == CategoryRule.Kind.PREFIX else word]
+            for word in literals:
+                words.setdefault(word, []).append(rank)
+
+        self.automaton = None
+        if words:
+            self.automaton = new_automaton()
+            for word, ranks in words.items():
+                self.automaton.add_word(word, tuple(ranks))
+            self.automaton.make_automaton()
+
+        self.regex = None
+        self.regex_ranks = [rank for rank, _ in combined]
+        if combined:
+            self.regex = re.compile(
+                "|".join(f"{regex_branch(pattern)}(?P<r{rank}>)" for rank, pattern in combined), REGEX_FLAGS
+            )
+            self.regexes = [re.compile(pattern, REGEX_FLAGS) for _, pattern in combined]
+
+    def _accepts(self, rank: int, amount) -> bool:
+        bounds = self.ranges[rank]
+        if bounds is None:
+            return True
+        if amount is None:
+            return False
+        low, high = bounds
+        return (low is None or amount >= low) and (high is None or amount <= high)
+
+    def _best_regex(self, description: str, amount, best: int | None) -> int | None:
+        ''' Regex sem trecho literal: a combinada diz a primeira que casa '''
+        found = self.regex.match(description)
+        if found is None:
+            return best
+        rank = int(found.lastgroup[1:])
+        if best is not None and rank > best:
+            return best
+        if self._accepts(rank, amount):
+            return rank
+        # raro: a primeira regex que casou não aceita o valor; testa as seguintes uma a uma
+        start = self.regex_ranks.index(rank) + 1
+        for position in range(start, len(self.regex_ranks)):
+            rank = self.regex_ranks[position]
+            if best is not None and rank > best:
+                break
+            if self._accepts(rank, amount) and self.regexes[position].search(description):
+                return rank
+        return best
+
+    def _finish(self, description: str, amount, best: int | None, candidates) -> int | None:
+        ''' Completa o melhor rank das palavras com as regex e as regras de valor '''
+        for rank in sorted(candidates or ()):
+            if best is not None and rank > best:
+                break
+            if self._accepts(rank, amount) and self.verify[rank].search(description):
+                best = rank
+                break
+        if self.regex is not None and (best is None or self.regex_ranks[0] < best):
+            best = self._best_regex(description, amount, best)
+        for rank in self.amount_ranks:
+            if best is not None and rank > best:
+                break
+            if self._accepts(rank, amount):
+                best = rank
+                break
+        return None if best is None else self.categories[best]
+
+    def match(self, description: str, amount=None) -> int | None:
+        ''' Id da categoria da regra que ganha, ou None '''
+        return self.match_many([(description, amount)])[0]
+
+    def match_many(self, items) -> list[int | None]:
+        ''' [(descrição, valor), ...] -> id da categoria (ou None) de cada item, na mesma ordem '''
+        items = [(description or "", amount) for description, amount in items]
+        best = [None] * len(items)
+        candidates = {}
+        if self.automaton is not None and items:
+            text = _SEPARATOR.join(description.strip() for description, _ in items)
+            if text.count(START) + text.count(END) != 2 * (len(items) - 1):
+                # descrição com os caracteres de controle usados como separador
+                text = _SEPARATOR.join(_CONTROL.sub(" ", d).strip() for d, _ in items)
+            text = START + normalize(text) + END
+            starts = [found.start() for found in _START.finditer(text)]
+            verify = self.verify
+            for end, ranks in self.automaton.iter(text):
+                row = bisect_right(starts, end) - 1
+                for rank in ranks:
+                    current = best[row]
+                    if current is not None and rank >= current:
+                        break
+                    if rank in verify:
+                        candidates.setdefault(row, set()).add(rank)
+                    elif self._accepts(rank, items[row][1]):
+                        best[row] = rank
+                        break
+        if self.regex is None and not self.amount_ranks:
+            # só palavras: as regex com trecho literal rodam nas linhas onde ele apareceu
+            categories = self.categories
+            result = [None if rank is None else categories[rank] for rank in best]
+            for row, ranks in candidates.items():
+                result[row] = self._finish(*items[row], best[row], ranks)
+            return result
+        return [
+            self._finish(description, amount, rank, candidates.get(row))
+            for row, ((description, amount), rank) in enumerate(zip(items, best))
+        ]
+
+
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+
+
+def _rules_version(user_id: int) -> tuple:
+    version = CategoryRule.objects.filter(user_id=user_id).aggregate(
+        count=Count("id"), last_id=Max("id"), updated=Max("updated_at")
+    )
+    return version["count"], version["last_id"], version["updated"]
+
+
+def matcher_for(user_id: int) -> RuleMatcher | None:
+    ''' Matcher do usuário (do cache, se as regras não mudaram); None se ele não tem regras '''
+    version = _rules_version(user_id)
+    with _matchers_lock:
+        cached = _matchers.get(user_id)
+        if cached is not None and cached[0] == version:
+            _matchers.move_to_end(user_id)
+            return cached[1]
+    if not version[0]:
+        invalidate(user_id)
+        return None
+
+    matcher = RuleMatcher(CategoryRule.objects.filter(user_id=user_id).order_by("priority", "id"))
+    with _matchers_lock:
+        _matchers[user_id] = (version, matcher)
+        _matchers.move_to_end(user_id)
+        while len(_matchers) > MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+def invalidate(user_id: int | None = None):
+    ''' Tira o matcher do cache (ou todos, sem usuário) '''
+    with _matchers_lock:
+        if user_id is None:
+            _matchers.clear()
+        else:
+            _matchers.pop(user_id, None)
+
+
+def categorize_many(user, items) -> list[int | None]:
+    '''
+    Categoria pelas regras de cada (descrição, valor) de uma importação em lote;
+    None onde nenhuma regra casa (quem chama decide o fallback).
+    '''
+    items = list(items)
+    matcher = matcher_for(user.pk)
+    return matcher.match_many(items) if matcher else [None] * len(items)
+
+
+def default_category(user=None) -> Category:
+    ''' "Outros" do usuário (criado no cadastro) ou, se não tiver, o global '''
+    owner = Q(user__isnull=True) if user is None else Q(user=user) | Q(user__isnull=True)
+    category = (
+        Category.objects.filter(owner, name=DEFAULT_CATEGORY)
+        .order_by(F("user_id").asc(nulls_last=True))
+        .first()
+    )
+    if category is None:
+        category, _ = Category.objects.get_or_create(user=None, name=DEFAULT_CATEGORY)
+    return category
+
+
+def uncategorized(user):
+    ''' Transações do usuário sem categoria ou em "Outros" (dele ou global) '''
+    defaults = Category.objects.filter(Q(user=user) | Q(user__isnull=True), name=DEFAULT_CATEGORY).values("id")
+    return Transaction.objects.filter(user=user).filter(Q(category__isnull=True) | Q(category__in=defaults))
+
+
+def apply_to_uncategorized(user, batch_size: int = BATCH_SIZE) -> dict:
+    '''
+    Roda as regras de novo sobre as transações em "Outros"/sem categoria, em
+    lotes de `batch_size` por id: um UPDATE por categoria de destino em cada
+    lote (marcando as linhas pro delta-sync). Transações arquivadas ficam de fora.
+    '''
+    matcher = matcher_for(user.pk)
+    result = {"scanned": 0, "updated": 0}
+    if matcher is None:
+        return result
+
+    pending = uncategorized(user)
+    last_id = 0
+    while True:
+        rows = list(
+            pending.filter(id__gt=last_id).order_by("id").values_list("id", "description", "amount")[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        result["scanned"] += len(rows)
+
+        targets = {}
+        for (pk, _, _), category_id in zip(rows, matcher.match_many((d, a) for _, d, a in rows)):
+            if category_id is not None:
+                targets.setdefault(category_id, []).append(pk)
+        with transaction.atomic(using=router.db_for_write(Transaction)):
+            for category_id, ids in targets.items():
+                # de novo o filtro de "Outros": quem mudou a categoria no meio do caminho fica como está
+                move_spending(pending.filter(id__in=ids), category_id)
+                result["updated"] += touch(pending.filter(id__in=ids), user.pk, category_id=category_id)
+    return result
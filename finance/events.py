@@ -0,0 +1,199 @@
+'''finance/events.py'''
+"""
+Pub/sub dos avisos de mudança do finance pro stream SSE (finance/stream.py).
+
+Os signals publicam, depois do commit, um aviso pequeno por mudança:
+    Event(id=<sync_seq>, kind="transaction" | "category" | "budget", data={...})
+O id é o `sync_seq` da mudança (ver finance/sync.py), então é crescente por
+usuário em todos os workers e serve de `Last-Event-ID`.
+
+O backend é plugável (FINANCE_EVENTS_BROKER):
+- InMemoryBroker (padrão): fan-out dentro do processo, com um buffer curto por
+  usuário pra replay na reconexão. Suficiente pra um worker e pros testes.
+- PostgresBroker: publica com NOTIFY e cada processo escuta com LISTEN e
+  repassa pros seus assinantes locais, então funciona com vários workers.
+"""
+import asyncio
+import json
+import threading
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+# avisa o consumidor que a fila estourou e ele deve mandar um snapshot
+OVERFLOW = object()
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    kind: str
+    data: dict = field(default_factory=dict)
+
+    def to_json(self, user_id: int) -> str:
+        return json.dumps(
+            {"user": user_id, "id": self.id, "kind": self.kind, "data": self.data}, separators=(",", ":")
+        )
+
+    @classmethod
+    def from_json(cls, raw: str) -> tuple[int, "Event"]:
+        payload = json.loads(raw)
+        return payload["user"], cls(payload["id"], payload["kind"], payload["data"])
+
+
+class Subscription:
+    '''
+    Fila de eventos de uma conexão. `push` pode ser chamado de qualquer thread;
+    `get` roda no event loop que criou a assinatura.
+    '''
+
+    def __init__(self, user_id: int, maxsize: int = 100):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # consumidor lento: descarta a fila e pede snapshot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    def push(self, event: Event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop já fechado: conexão acabou
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InMemoryBroker:
+    '''
+    Buffer de replay de até `buffer_size` eventos por usuário, pra no máximo
+    `buffer_users` usuários: passando disso sai o que publicou há mais tempo
+    (LRU). Quem reconectar depois disso recebe um snapshot no lugar do replay.
+    '''
+
+    def __init__(self, buffer_size: int | None = None, buffer_users: int | None = None):
+        self.buffer_size = buffer_size or getattr(settings, "FINANCE_EVENTS_BUFFER", 256)
+        self.buffer_users = buffer_users or getattr(settings, "FINANCE_EVENTS_BUFFER_USERS", 10000)
+        self._lock = threading.Lock()
+        self._buffers: OrderedDict[int, deque] = OrderedDict()
+        self._subscribers: dict[int, set[Subscription]] = defaultdict(set)
+
+    def publish(self, user_id: int, event: Event):
+        self._deliver(user_id, event)
+
+    def _deliver(self, user_id: int, event: Event):
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = deque(maxlen=self.buffer_size)
+                if len(self._buffers) > self.buffer_users:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(user_id)
+            buffer.append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def replay(self, user_id: int, after: int) -> list[Event] | None:
+        '''
+        Eventos com id > `after` ainda no buffer, em ordem. None quando o buffer
+        não cobre o intervalo (evento mais antigo guardado já é posterior ao `after`).
+        '''
+        with self._lock:
+            buffered = list(self._buffers.get(user_id, ()))
+        # o buffer só descarta os mais antigos: se o primeiro guardado é <= after,
+        # nada depois de `after` se perdeu
+        if not buffered or buffered[0].id > after:
+            return None
+        return [e for e in buffered if e.id > after]
+
+
+class PostgresBroker(InMemoryBroker):
+    '''
+    Fan-out entre processos com LISTEN/NOTIFY (precisa de psycopg 3).
+    O listener é uma conexão dedicada por processo, aberta na primeira assinatura.
+    '''
+    channel = "finance_events"
+
+    def __init__(self, buffer_size: int | None = None, using: str = "default"):
+        super().__init__(buffer_size)
+        self.using = using
+        self._listener: asyncio.Task | None = None
+
+    def publish(self, user_id: int, event: Event):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, event.to_json(user_id)])
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = super().subscribe(user_id)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return subscription
+
+    async def _listen(self):
+        import psycopg
+
+        params = {
+            k: v for k, v in connections[self.using].get_connection_params().items()
+            if k in ("dbname", "user", "password", "host", "port", "sslmode", "options")
+        }
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(**params, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {self.channel}")
+                    async for notify in conn.notifies():
+                        user_id, event = Event.from_json(notify.payload)
+                        self._deliver(user_id, event)
+            except psycopg.OperationalError:
+                await asyncio.sleep(1)
+
+
+def publish_on_commit(user_id: int, kind: str, seq: int, data: dict, using: str):
+    ''' Publica depois do commit da escrita (erro no broker não derruba o request) '''
+    event = Event(seq, kind, data)
+    transaction.on_commit(lambda: get_broker().publish(user_id, event), using=using, robust=True)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, "FINANCE_EVENTS_BROKER", "finance.events.InMemoryBroker")
+            _broker = import_string(path)()
+    return _broker
+
+
+def set_broker(broker):
+    ''' Troca o broker do processo (testes) '''
+    global _broker
+    with _broker_lock:
+        _broker = broker
@@ -0,0 +1,321 @@
+'''finance/ledger.py'''
+"""
+Motor de leitura em memória (opcional) pro razão de cada usuário.
+
+Com FINANCE_LEDGER_ENGINE=True, o SummaryView, o /analytics/ (série e
+categorias) e o /transactions/recent/ respondem de uma cópia em colunas NumPy
+das transações do usuário, carregada na primeira leitura:
+    ids (int64), dias desde 1970-01-01 (int32), valor em centavos (int64),
+    entrada? (bool) e categoria (int64, -1 = sem categoria),
+ordenadas por (dia, id). Os snapshots de meses arquivados entram como linhas
+de id 0 no dia 1 do mês. São ~29 bytes por transação (~2,9 MB por 100k).
+
+Cada leitura confere o SyncCounter do usuário (uma consulta):
+- `seq` andou: aplica só o que mudou desde a cópia (transações com sync_seq
+  maior e tombstones de transação; ver finance/sync.py);
+- `epoch` mudou (arquivamento, restauração, snapshots remapeados) ou os
+  tombstones que faltam já foram apagados: recarrega.
+Escrita que não passa pelo save() nem reserva seq (bulk_create/update direto)
+só aparece quando o usuário for recarregado, a mesma regra do delta-sync.
+
+As cópias ficam num LRU por processo limitado por FINANCE_LEDGER_MEMORY_MB
+(padrão 64); os usuários lidos há mais tempo saem primeiro. `?source=db` nas
+views calcula direto no banco, pra conferir.
+"""
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.db import router
+from django.db.models import F
+
+from .analytics import EPOCH, DailyTotals, cents, money, raw_rows, to_days
+from .models import ArchivedMonthTotal, Category, SyncCounter, Tombstone, Transaction
+from .summary import month_range
+
+ARCHIVED_ID = 0
+# mudanças acima disso reordenam a cópia inteira em vez de inserir linha a linha
+MERGE_LIMIT = 256
+
+
+def enabled() -> bool:
+    return getattr(settings, "FINANCE_LEDGER_ENGINE", False)
+
+
+def use_ledger(request) -> bool:
+    ''' Responde do razão em memória? (`?source=db` força o banco) '''
+    return enabled() and request.query_params.get("source") != "db"
+
+
+def _day(d: date) -> int:
+    return d.toordinal() - EPOCH
+
+
+@dataclass(frozen=True)
+class UserLedger:
+    '''
+    Cópia imutável do razão de um usuário; mudanças geram uma cópia nova
+    (quem está lendo a anterior não vê nada pela metade).
+    '''
+    ids: np.ndarray
+    days: np.ndarray
+    cents: np.ndarray
+    income: np.ndarray
+    category: np.ndarray
+    seq: int = 0
+    epoch: int = 0
+
+    @classmethod
+    def from_rows(cls, rows, seq: int = 0, epoch: int = 0) -> "UserLedger":
+        ''' rows: (id, data, tipo, categoria, centavos) '''
+        if not rows:
+            return cls.empty(seq, epoch)
+        ids, dates, types, categories, amounts = zip(*rows)
+        ledger = cls(
+            ids=np.array(ids, dtype=np.int64),
+            days=to_days(dates).astype(np.int32),
+            cents=np.array(amounts, dtype=np.int64),
+            income=np.array(types) == Transaction.Type.INCOME,
+            category=np.array([-1 if c is None else c for c in categories], dtype=np.int64),
+            seq=seq,
+            epoch=epoch,
+        )
+        return ledger._sorted()
+
+    @classmethod
+    def empty(cls, seq: int = 0, epoch: int = 0) -> "UserLedger":
+        return cls(
+            np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros(0, np.int64),
+            np.zeros(0, bool), np.zeros(0, np.int64), seq, epoch,
+        )
+
+    @property
+    def columns(self) -> tuple[np.ndarray, ...]:
+        return self.ids, self.days, self.cents, self.income, self.category
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _sorted(self) -> "UserLedger":
+        order = np.lexsort((self.ids, self.days))
+        return UserLedger(*(column[order] for column in self.columns), seq=self.seq, epoch=self.epoch)
+
+    def apply(self, changed: "UserLedger", deleted_ids, seq: int) -> "UserLedger":
+        ''' Nova cópia sem as linhas removidas/alteradas e com as versões novas das alteradas '''
+        gone = np.concatenate([changed.ids, np.asarray(deleted_ids, dtype=np.int64)])
+        keep = ~np.isin(self.ids, gone) | (self.ids == ARCHIVED_ID)
+        kept = [column[keep] for column in self.columns]
+        if len(changed) > MERGE_LIMIT:
+            merged = UserLedger(*(np.concatenate(pair) for pair in zip(kept, changed.columns)), seq=seq, epoch=self.epoch)
+            return merged._sorted()
+
+        # poucas linhas: insere cada uma na posição certa em vez de reordenar tudo
+        changed = changed._sorted()
+        ids, days = kept[0], kept[1]
+        positions = []
+        for day, pk in zip(changed.days, changed.ids):
+            lo, hi = np.searchsorted(days, day, "left"), np.searchsorted(days, day, "right")
+            positions.append(lo + np.searchsorted(ids[lo:hi], pk))
+        return UserLedger(
+            *(np.insert(column, positions, new) for column, new in zip(kept, changed.columns)),
+            seq=seq,
+            epoch=self.epoch,
+        )
+
+    def window(self, start: date | None = None, end: date | None = None) -> slice:
+        ''' Fatia das linhas com data em [start, end) '''
+        lo = 0 if start is None else int(np.searchsorted(self.days, _day(start), "left"))
+        hi = len(self) if end is None else int(np.searchsorted(self.days, _day(end), "left"))
+        return slice(lo, hi)
+
+    def totals(self, rows=slice(None)) -> tuple[int, int]:
+        ''' (entradas, saídas) em centavos '''
+        amounts, income = self.cents[rows], self.income[rows]
+        return int(amounts[income].sum()), int(amounts[~income].sum())
+
+    def by_category(self, rows=slice(None)) -> list[tuple[int, bool, int]]:
+        ''' [(categoria, entrada?, centavos)] '''
+        keys = self.category[rows] * 2 + self.income[rows]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = np.zeros(len(unique), dtype=np.int64)
+        np.add.at(sums, inverse, self.cents[rows])
+        return [(int(key) // 2, bool(key % 2), int(total)) for key, total in zip(unique, sums)]
+
+    def recent_ids(self, rows=slice(None), tx_type: str | None = None, category: int | None = None,
+                   limit: int = 10) -> list[int]:
+        ''' Ids das transações mais recentes (data, id decrescentes) '''
+        mask = self.ids[rows] != ARCHIVED_ID
+        if tx_type in (Transaction.Type.INCOME, Transaction.Type.EXPENSE):
+            mask &= self.income[rows] == (tx_type == Transaction.Type.INCOME)
+        if category is not None:
+            mask &= self.category[rows] == category
+        return [int(pk) for pk in self.ids[rows][mask][::-1][:limit]]
+
+    def daily_totals(self) -> DailyTotals:
+        ''' Mesmo formato do finance.analytics.load_daily_totals '''
+        days = self.days.astype("datetime64[D]")
+        months = days.astype("datetime64[M]")
+        category_ids, category_index = np.unique(self.category, return_inverse=True)
+        return DailyTotals(
+            month=months.astype(np.int64),
+            day=(days - months).astype(np.int64) + 1,
+            column=category_index.astype(np.int64) * 2 + self.income,
+            cents=self.cents,
+            category_ids=category_ids,
+        )
+
+
+def _transaction_rows(qs) -> list[tuple]:
+    # a anotação fica por último: é a ordem das colunas no SQL
+    return raw_rows(
+        qs.order_by().annotate(amount_cents=cents(F("amount")))
+        .values_list("id", "date", "type", "category_id", "amount_cents")
+    )
+
+
+def load_ledger(user_id: int, using: str, seq: int = 0, epoch: int = 0) -> UserLedger:
+    archived = raw_rows(
+        ArchivedMonthTotal.objects.using(using).filter(user_id=user_id).order_by()
+        .annotate(total_cents=cents(F("total")))
+        .values_list("month", "type", "category_id", "total_cents")
+    )
+    rows = _transaction_rows(Transaction.objects.using(using).filter(user_id=user_id))
+    rows += [(ARCHIVED_ID, *row) for row in archived]
+    return UserLedger.from_rows(rows, seq, epoch)
+
+
+class LedgerEngine:
+    '''
+    LRU de UserLedger por usuário com teto de memória, seguro entre threads.
+    Um usuário maior que o teto sozinho ainda fica (é o que está sendo lido).
+    '''
+
+    def __init__(self, memory_bytes: int | None = None):
+        if memory_bytes is None:
+            memory_bytes = getattr(settings, "FINANCE_LEDGER_MEMORY_MB", 64) * 1024 * 1024
+        self.memory_bytes = memory_bytes
+        self.used_bytes = 0
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._ledgers: OrderedDict[int, UserLedger] = OrderedDict()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._ledgers
+
+    def clear(self):
+        with self._lock:
+            self._ledgers.clear()
+            self.used_bytes = 0
+
+    def _store(self, user_id: int, ledger: UserLedger):
+        with self._lock:
+            old = self._ledgers.pop(user_id, None)
+            if old is not None:
+                self.used_bytes -= old.nbytes
+            self._ledgers[user_id] = ledger
+            self.used_bytes += ledger.nbytes
+            while self.used_bytes > self.memory_bytes and len(self._ledgers) > 1:
+                _, evicted = self._ledgers.popitem(last=False)
+                self.used_bytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+
+    def ledger(self, user_id: int) -> UserLedger:
+        ''' Razão do usuário em dia com o banco (carrega, atualiza ou reaproveita) '''
+        # contador e mudanças do mesmo banco (shard do usuário / mesma réplica)
+        using = router.db_for_read(Transaction)
+        seq, pruned, epoch = (
+            SyncCounter.objects.using(using).filter(user_id=user_id)
+            .values_list("seq", "pruned_seq", "epoch").first() or (0, 0, 0)
+        )
+        with self._lock:
+            ledger = self._ledgers.get(user_id)
+            if ledger is not None:
+                self._ledgers.move_to_end(user_id)
+
+        if ledger is None or ledger.epoch != epoch or ledger.seq < pruned:
+            self.stats["loads"] += 1
+            ledger = load_ledger(user_id, using, seq, epoch)
+        elif ledger.seq < seq:
+            self.stats["updates"] += 1
+            changed = UserLedger.from_rows(_transaction_rows(
+                Transaction.objects.using(using).filter(user_id=user_id, sync_seq__gt=ledger.seq)
+            ))
+            deleted = Tombstone.objects.using(using).filter(
+                user_id=user_id, kind=Tombstone.Kind.TRANSACTION, sync_seq__gt=ledger.seq
+            ).values_list("object_id", flat=True)
+            ledger = ledger.apply(changed, list(deleted), seq)
+        else:
+            # em dia (ou réplica atrasada em relação à cópia): usa o que tem
+            self.stats["hits"] += 1
+            return ledger
+        self._store(user_id, ledger)
+        return ledger
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> LedgerEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LedgerEngine()
+    return _engine
+
+
+def set_engine(engine: LedgerEngine | None):
+    ''' Troca o engine do processo (testes, benchmark) '''
+    global _engine
+    with _engine_lock:
+        _engine = engine
+
+
+def build_summary(user, year: int, month: int) -> dict:
+    ''' Mesmo payload do finance.summary.build_summary, calculado do razão em memória '''
+    ledger = get_engine().ledger(user.pk)
+    rows = ledger.window(*month_range(year, month))
+    income, expense = ledger.totals(rows)
+    groups = ledger.by_category(rows)
+    names = dict(
+        Category.objects.filter(id__in=[c for c, _, _ in groups if c >= 0]).values_list("id", "name")
+    )
+    by_category = sorted(
+        (
+            {
+                "category__id": category if category >= 0 else None,
+                "category__name": names.get(category),
+                "type": Transaction.Type.INCOME if is_income else Transaction.Type.EXPENSE,
+                "total": money(total),
+            }
+            for category, is_income, total in groups
+        ),
+        key=lambda r: (r["type"], r["category__name"] is None, r["category__name"] or ""),
+    )
+    all_income, all_expense = ledger.totals()
+    return {
+        "month": f"{year:04d}-{month:02d}",
+        "income": money(income),
+        "expense": money(expense),
+        "balance_month": money(income - expense),
+        "balance_total": money(all_income - all_expense),
+        "by_category": by_category,
+    }
+
+
+def daily_totals(user) -> DailyTotals:
+    return get_engine().ledger(user.pk).daily_totals()
+
+
+def recent_ids(user, bounds: tuple[date, date] | None, tx_type: str | None, category: int | None,
+               limit: int) -> list[int]:
+    ledger = get_engine().ledger(user.pk)
+    rows = ledger.window(*bounds) if bounds else slice(None)
+    return ledger.recent_ids(rows, tx_type, category, limit)
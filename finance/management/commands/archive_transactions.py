@@ -0,0 +1,41 @@
+'''finance/management/commands/archive_transactions.py'''
+"""
+Move transações antigas pra TransactionArchive, deixando snapshots mensais.
+
+    python manage.py archive_transactions                # horizonte do settings
+    python manage.py archive_transactions --months 36
+    python manage.py archive_transactions --user 42 --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from finance import archive
+from finance.models import Transaction
+from finance.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = "Arquiva transações mais antigas que o horizonte (FINANCE_ARCHIVE_AFTER_MONTHS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int,
+                            help="Arquiva o que for mais antigo que N meses (padrão: FINANCE_ARCHIVE_AFTER_MONTHS).")
+        parser.add_argument("--user", type=int, help="Só esse usuário (id).")
+        parser.add_argument("--dry-run", action="store_true", help="Só mostra quantas transações seriam arquivadas.")
+
+    def handle(self, *args, **opts):
+        before = archive.archive_horizon(months=opts["months"])
+        if opts["dry_run"]:
+            total = 0
+            for alias in shard_aliases() or [None]:
+                with use_shard(alias):
+                    qs = Transaction.objects.filter(date__lt=before)
+                    if opts["user"] is not None:
+                        qs = qs.filter(user_id=opts["user"])
+                    total += qs.count()
+            self.stdout.write(f"{total} transações com data < {before} seriam arquivadas.")
+            return
+
+        result = archive.archive_all(before, user_id=opts["user"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['transactions']} transações de {result['users']} usuários arquivadas (data < {before})."
+        ))
@@ -0,0 +1,77 @@
+'''finance/management/commands/bench_batch.py'''
+"""
+Compara o envio de N transações uma a uma (POST /api/transactions/) com o
+POST /api/transactions/batch/ (finance/batch.py): criação, reenvio com as
+mesmas chaves e um lote misto de update/delete. Usa um usuário temporário,
+apagado no fim.
+
+    python manage.py bench_batch
+    python manage.py bench_batch --ops 1000 --single 200
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from rest_framework.test import APIClient
+
+from finance.models import IdempotencyKey, Transaction
+from finance.sharding import shard_for_user_id, use_shard
+
+
+class Command(BaseCommand):
+    help = "Benchmark do POST /api/transactions/batch/ contra POSTs individuais."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ops", type=int, default=1000, help="Operações no lote (padrão: 1000).")
+        parser.add_argument("--single", type=int, default=100, help="POSTs individuais medidos, extrapolados pra --ops (padrão: 100).")
+
+    def handle(self, *args, **opts):
+        ops, single = max(1, opts["ops"]), max(1, opts["single"])
+        user = get_user_model().objects.create_user(
+            username=f"bench_batch_{get_random_string(6)}", password=get_random_string(20)
+        )
+        client = APIClient(SERVER_NAME="localhost")
+        client.force_authenticate(user=user)
+        try:
+            self._run(client, ops, single)
+        finally:
+            with use_shard(shard_for_user_id(user.pk)):
+                Transaction.objects.filter(user=user).delete()
+                IdempotencyKey.objects.filter(user=user).delete()
+            user.delete()
+
+    def _post(self, client, url, body) -> tuple[float, object]:
+        started = time.perf_counter()
+        resp = client.post(url, body, format="json")
+        elapsed = (time.perf_counter() - started) * 1000
+        if resp.status_code not in (200, 201):
+            raise RuntimeError(f"{url}: {resp.status_code} {resp.content[:200]!r}")
+        return elapsed, resp
+
+    def _run(self, client, ops: int, single: int):
+        def body(i):
+            return {"type": "OUT", "amount": f"{i % 500 + 1}.90", "date": "2026-01-10", "description": f"compra {i}"}
+
+        started = time.perf_counter()
+        for i in range(single):
+            client.post(reverse("transaction-list"), body(i), format="json")
+        one_by_one = (time.perf_counter() - started) * 1000 / single * ops
+
+        url = reverse("transaction-batch")
+        creates = [{"op": "create", "key": f"bench-{i}", "data": body(i)} for i in range(ops)]
+        create_ms, resp = self._post(client, url, creates)
+        replay_ms, _ = self._post(client, url, creates)
+        ids = [item["id"] for item in resp.json()["results"]]
+        mixed = [
+            {"op": "delete", "id": pk} if n % 4 == 0 else {"op": "update", "id": pk, "data": {"amount": "1.00"}}
+            for n, pk in enumerate(ids)
+        ]
+        mixed_ms, _ = self._post(client, url, mixed)
+
+        self.stdout.write(f"{ops} operações")
+        self.stdout.write(f"{'uma a uma (estimado)':<24} {one_by_one:>9.1f} ms")
+        self.stdout.write(f"{'batch create':<24} {create_ms:>9.1f} ms")
+        self.stdout.write(f"{'batch reenvio (replay)':<24} {replay_ms:>9.1f} ms")
+        self.stdout.write(f"{'batch update/delete':<24} {mixed_ms:>9.1f} ms")
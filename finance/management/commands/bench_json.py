@@ -0,0 +1,85 @@
+'''finance/management/commands/bench_json.py'''
+"""
+Compara o JSONRenderer/JSONParser do DRF com os de orjson (backend/renderers.py,
+backend/parsers.py) numa página de transações serializada.
+
+Os payloads são montados em memória (não toca no banco): a lista paginada do
+TransactionSerializer com 50 linhas (PAGE_SIZE) e com 10k linhas (export/sync
+completo).
+
+    python manage.py bench_json
+    python manage.py bench_json --rows 50,10000,50000 --repeat 20
+"""
+import io
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from backend.parsers import ORJSONParser
+from backend.renderers import ORJSONRenderer
+from finance.models import Category, Transaction
+from finance.serializers import TransactionSerializer
+
+
+def build_payload(rows: int) -> dict:
+    categories = [Category(id=i, name=name) for i, name in enumerate(["Outros", "Mercado", "Transporte", "Lazer"], 1)]
+    created = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    transactions = [
+        Transaction(
+            id=i, type="OUT" if i % 4 else "IN", amount=Decimal(i % 5000) + Decimal("0.99"),
+            date=date(2026, 1, 1) + timedelta(days=i % 365), description=f"lançamento {i}",
+            category=categories[i % len(categories)], created_at=created + timedelta(seconds=i),
+        )
+        for i in range(1, rows + 1)
+    ]
+    return {"count": rows, "next": None, "previous": None, "results": TransactionSerializer(transactions, many=True).data}
+
+
+def best_of(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Benchmark do renderer/parser JSON (DRF x orjson) em páginas de transações."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="50,10000", help="Tamanhos de payload separados por vírgula (padrão: 50,10000).")
+        parser.add_argument("--repeat", type=int, default=10, help="Repetições por medida; vale a melhor (padrão: 10).")
+
+    def handle(self, *args, **opts):
+        try:
+            sizes = [int(part) for part in opts["rows"].split(",")]
+        except ValueError:
+            raise CommandError("--rows precisa ser uma lista de inteiros, ex: 50,10000")
+        repeat = max(1, opts["repeat"])
+
+        self.stdout.write(f"{'linhas':>8} {'bytes':>10} {'etapa':>7} {'drf ms':>9} {'orjson ms':>10} {'ganho':>7}")
+        for rows in sizes:
+            data = build_payload(rows)
+            body = JSONRenderer().render(data)
+            if ORJSONRenderer().render(data) != body:
+                raise CommandError(f"Saída diferente do JSONRenderer com {rows} linhas")
+
+            timings = {
+                "render": (
+                    best_of(lambda: JSONRenderer().render(data), repeat),
+                    best_of(lambda: ORJSONRenderer().render(data), repeat),
+                ),
+                "parse": (
+                    best_of(lambda: JSONParser().parse(io.BytesIO(body)), repeat),
+                    best_of(lambda: ORJSONParser().parse(io.BytesIO(body)), repeat),
+                ),
+            }
+            for step, (drf, fast) in timings.items():
+                self.stdout.write(
+                    f"{rows:>8} {len(body):>10} {step:>7} {drf * 1000:>9.3f} {fast * 1000:>10.3f} {drf / fast:>6.1f}x"
+                )
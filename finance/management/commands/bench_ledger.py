@@ -0,0 +1,122 @@
+'''finance/management/commands/bench_ledger.py'''
+"""
+Mede o razão em memória (finance/ledger.py) contra as consultas no banco,
+com um usuário temporário de N transações (padrão 100k, espalhadas em 10 anos):
+carga, memória, latência do summary/recent/totais diários e de aplicar uma mudança.
+
+    python manage.py bench_ledger
+    python manage.py bench_ledger --rows 200000 --repeat 50
+
+O usuário e as transações são apagados no fim (--keep pra manter).
+"""
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+from django.utils.crypto import get_random_string
+
+from finance import ledger
+from finance.analytics import load_daily_totals
+from finance.models import Category, Transaction
+from finance.sharding import shard_for_user_id, use_shard
+from finance.summary import build_summary
+
+
+def timed(func, repeat: int) -> float:
+    ''' Mediana em ms '''
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+class Command(BaseCommand):
+    help = "Benchmark do razão em memória (latência e memória por 100k transações)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000, help="Transações do usuário de teste (padrão: 100000).")
+        parser.add_argument("--repeat", type=int, default=20, help="Repetições por medida; vale a mediana (padrão: 20).")
+        parser.add_argument("--keep", action="store_true", help="Não apaga o usuário de teste no fim.")
+
+    def handle(self, *args, **opts):
+        rows, repeat = max(1, opts["rows"]), max(1, opts["repeat"])
+        user = get_user_model().objects.create_user(
+            username=f"bench_ledger_{get_random_string(6)}", password=get_random_string(20)
+        )
+        try:
+            with use_shard(shard_for_user_id(user.pk)):
+                self._seed(user, rows)
+                self._run(user, rows, repeat)
+        finally:
+            if not opts["keep"]:
+                with use_shard(shard_for_user_id(user.pk)):
+                    qs = Transaction.objects.filter(user=user)
+                    qs._raw_delete(qs.db)
+                user.delete()
+
+    def _seed(self, user, rows: int):
+        rng = random.Random(42)
+        categories = [Category.objects.create(user=user, name=f"Bench {i}") for i in range(12)]
+        first = date.today() - timedelta(days=3650)
+        batch = []
+        for i in range(rows):
+            batch.append(Transaction(
+                user=user, type="IN" if rng.random() < 0.2 else "OUT",
+                amount=Decimal(rng.randint(100, 500_000)) / 100, date=first + timedelta(days=rng.randrange(3650)),
+                description=f"bench {i}", category=rng.choice(categories),
+            ))
+            if len(batch) == 5000:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        Transaction.objects.bulk_create(batch)
+        connection = connections[router.db_for_write(Transaction)]
+        if connection.vendor == "postgresql":
+            # estatísticas em dia, como teria um usuário real (senão o planner erra logo depois da carga)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Transaction._meta.db_table}")
+        self.stdout.write(f"{rows} transações criadas para {user.username}")
+
+    def _run(self, user, rows: int, repeat: int):
+        engine = ledger.LedgerEngine(memory_bytes=1 << 40)
+        tracemalloc.start()
+        started = time.perf_counter()
+        copy = engine.ledger(user.pk)
+        load_ms = (time.perf_counter() - started) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        per_100k = 100_000 / rows
+        self.stdout.write(f"carga: {load_ms:.1f} ms, pico de alocação {peak / 2**20:.1f} MB")
+        self.stdout.write(
+            f"memória: {copy.nbytes / 2**20:.2f} MB ({copy.nbytes * per_100k / 2**20:.2f} MB por 100k transações)"
+        )
+
+        today = date.today()
+        ledger.set_engine(engine)
+        cases = [
+            ("summary do mês", lambda: build_summary(user, today.year, today.month),
+             lambda: ledger.build_summary(user, today.year, today.month)),
+            ("recent (10)", lambda: list(Transaction.objects.filter(user=user).order_by("-date", "-id")
+                                         .values_list("id", flat=True)[:10]),
+             lambda: ledger.recent_ids(user, None, None, None, 10)),
+            ("totais diários", lambda: load_daily_totals(user), lambda: ledger.daily_totals(user)),
+        ]
+        self.stdout.write(f"{'consulta':<16} {'banco ms':>9} {'memória ms':>11}")
+        for name, db, memory in cases:
+            self.stdout.write(f"{name:<16} {timed(db, repeat):>9.2f} {timed(memory, repeat):>11.2f}")
+
+        tx = Transaction.objects.filter(user=user).first()
+        samples = []
+        for _ in range(max(1, repeat // 4)):
+            tx.amount += 1
+            tx.save()
+            samples.append(timed(lambda: engine.ledger(user.pk), 1))
+        self.stdout.write(f"atualizar com 1 mudança: {sorted(samples)[len(samples) // 2]:.2f} ms")
+        ledger.set_engine(None)
@@ -0,0 +1,72 @@
+'''finance/management/commands/bench_platform_report.py'''
+"""
+Mede o relatório da plataforma (finance/platform_report.py) com 1, 2, 4...
+processos sobre usuários temporários com transações aleatórias e mostra o
+ganho de cada um contra 1 processo. Tudo é apagado no fim.
+
+    python manage.py bench_platform_report
+    python manage.py bench_platform_report --users 2000 --per-user 1000 --workers 1 2 4 8
+"""
+import os
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+
+from finance import platform_report
+from finance.models import Transaction
+from finance.sharding import shard_for_user_id, use_shard
+
+
+class Command(BaseCommand):
+    help = "Benchmark do relatório da plataforma por número de processos."
+
+    def add_arguments(self, parser):
+        cpus = os.cpu_count() or 1
+        parser.add_argument("--users", type=int, default=1000, help="Usuários temporários (padrão: 1000).")
+        parser.add_argument("--per-user", type=int, default=500, help="Transações por usuário (padrão: 500).")
+        parser.add_argument("--workers", type=int, nargs="+",
+                            default=sorted({cpus, *(1 << i for i in range(cpus.bit_length()))}),
+                            help="Números de processos a medir (padrão: 1, 2, 4... até o número de CPUs).")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        prefix = f"bench_report_{get_random_string(6)}_"
+        User.objects.bulk_create([User(username=f"{prefix}{i}") for i in range(max(1, opts["users"]))])
+        users = list(User.objects.filter(username__startswith=prefix).values_list("pk", flat=True))
+        by_shard = defaultdict(list)
+        for user_id in users:
+            by_shard[shard_for_user_id(user_id)].append(user_id)
+        rng = np.random.default_rng(42)
+        per_user = max(1, opts["per_user"])
+        start = date.today() - timedelta(days=730)
+        try:
+            for alias, ids in by_shard.items():
+                with use_shard(alias):
+                    for user_id in ids:
+                        days = rng.integers(0, 730, per_user).tolist()
+                        amounts = np.round(rng.lognormal(4, 1.2, per_user), 2).tolist()
+                        Transaction.objects.bulk_create([
+                            Transaction(user_id=user_id, type="OUT" if day % 5 else "IN", amount=amount,
+                                        date=start + timedelta(days=day), description="bench")
+                            for day, amount in zip(days, amounts)
+                        ], batch_size=5000)
+            self.stdout.write(f"{len(users) * per_user} transações de {len(users)} usuários")
+
+            baseline = None
+            for workers in opts["workers"]:
+                started = time.perf_counter()
+                platform_report.collect(max(1, workers))
+                elapsed = time.perf_counter() - started
+                baseline = baseline or elapsed
+                self.stdout.write(f"{workers} processos: {elapsed:.2f}s ({baseline / elapsed:.2f}x o primeiro)")
+        finally:
+            for alias, ids in by_shard.items():
+                with use_shard(alias):
+                    qs = Transaction.objects.filter(user_id__in=ids)
+                    qs._raw_delete(qs.db)
+            User.objects.filter(pk__in=users).delete()
@@ -0,0 +1,68 @@
+'''finance/management/commands/bench_recurring.py'''
+"""
+Mede o scheduler de recorrentes (finance/recurring.py): N recorrências vencidas
+espalhadas por usuários temporários, criadas de uma vez pelo run_due, com a
+taxa e a projeção pra 1 milhão. Tudo é apagado no fim.
+
+    python manage.py bench_recurring
+    python manage.py bench_recurring --templates 200000 --users 5000 --chunk-size 2000
+"""
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+
+from finance import recurring
+from finance.models import RecurringTransaction, SyncCounter, Transaction
+from finance.sharding import shard_for_user_id, use_shard
+
+
+class Command(BaseCommand):
+    help = "Benchmark do scheduler de lançamentos recorrentes (recorrências/s)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--templates", type=int, default=100_000, help="Recorrências vencidas (padrão: 100000).")
+        parser.add_argument("--users", type=int, default=2000, help="Usuários temporários (padrão: 2000).")
+        parser.add_argument("--chunk-size", type=int, default=recurring.CHUNK_SIZE,
+                            help=f"Recorrências por lote (padrão: {recurring.CHUNK_SIZE}).")
+
+    def handle(self, *args, **opts):
+        templates, chunk_size = max(1, opts["templates"]), max(1, opts["chunk_size"])
+        User = get_user_model()
+        prefix = f"bench_recurring_{get_random_string(6)}_"
+        User.objects.bulk_create([User(username=f"{prefix}{i}") for i in range(max(1, opts["users"]))])
+        users = list(User.objects.filter(username__startswith=prefix).values_list("pk", flat=True))
+        by_shard = defaultdict(list)
+        for user_id in users:
+            by_shard[shard_for_user_id(user_id)].append(user_id)
+        try:
+            today = date.today()
+            for alias, ids in by_shard.items():
+                with use_shard(alias):
+                    share = templates * len(ids) // len(users)
+                    RecurringTransaction.objects.bulk_create([
+                        RecurringTransaction(
+                            user_id=ids[i % len(ids)], type="OUT", amount=Decimal(i % 900 + 10), start_date=today,
+                            next_run=today, description=f"assinatura {i}",
+                        )
+                        for i in range(share)
+                    ], batch_size=5000)
+
+            started = time.perf_counter()
+            totals = recurring.run_due(today, chunk_size)
+            elapsed = time.perf_counter() - started
+            rate = totals["recurring"] / elapsed if elapsed else 0
+            self.stdout.write(f"{totals['recurring']} recorrências, {totals['created']} transações em {elapsed:.1f}s")
+            if rate:
+                self.stdout.write(f"{rate:.0f} recorrências/s; 1 milhão em ~{1_000_000 / rate / 60:.1f} min")
+        finally:
+            for alias, ids in by_shard.items():
+                with use_shard(alias):
+                    for model in (Transaction, RecurringTransaction, SyncCounter):
+                        qs = model.objects.filter(user_id__in=ids)
+                        qs._raw_delete(qs.db)
+            User.objects.filter(pk__in=users).delete()
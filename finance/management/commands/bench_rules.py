@@ -0,0 +1,70 @@
+'''finance/management/commands/bench_rules.py'''
+"""
+Mede a categorização automática (finance/categorize.py): descrições por
+milissegundo com 10, 1000 e 10000 regras por usuário (palavras-chave,
+prefixos e regex misturados), montadas em memória (não toca no banco).
+
+    python manage.py bench_rules
+    python manage.py bench_rules --rules 10,100000 --rows 20000
+"""
+import random
+import string
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import categorize
+from finance.models import CategoryRule
+
+from .bench_json import best_of
+
+
+def build_rules(count: int, words: list[str]) -> list[CategoryRule]:
+    kinds = [CategoryRule.Kind.KEYWORD, CategoryRule.Kind.PREFIX, CategoryRule.Kind.REGEX]
+    rules = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        pattern = rf"{words[i]}\s*\d+" if kind == CategoryRule.Kind.REGEX else words[i]
+        rules.append(CategoryRule(id=i + 1, kind=kind, pattern=pattern, category_id=i % 50 + 1, priority=100))
+    # algumas sem trecho literal (vão pra regex combinada) e uma de valor
+    rules += [
+        CategoryRule(kind=CategoryRule.Kind.REGEX, pattern=r"\d{4}\*\d{2}", category_id=1),
+        CategoryRule(kind=CategoryRule.Kind.AMOUNT, min_amount=Decimal("5000"), category_id=2),
+    ]
+    return rules
+
+
+class Command(BaseCommand):
+    help = "Benchmark da categorização automática (descrições/ms por quantidade de regras)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rules", default="10,1000,10000", help="Quantidades de regras separadas por vírgula (padrão: 10,1000,10000).")
+        parser.add_argument("--rows", type=int, default=10_000, help="Descrições por lote (padrão: 10000).")
+        parser.add_argument("--repeat", type=int, default=5, help="Repetições por medida; vale a melhor (padrão: 5).")
+
+    def handle(self, *args, **opts):
+        try:
+            sizes = [int(part) for part in opts["rules"].split(",")]
+        except ValueError:
+            raise CommandError("--rules precisa ser uma lista de inteiros, ex: 10,1000")
+        rows, repeat = max(1, opts["rows"]), max(1, opts["repeat"])
+
+        rng = random.Random(42)
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))) for _ in range(max(sizes) * 2)]
+        items = [
+            (f"Compra cartão {rng.choice(words)} São Paulo {i}", Decimal(rng.randint(100, 999_999)) / 100)
+            for i in range(rows)
+        ]
+        self.stdout.write(f"autômato: {'pyahocorasick' if categorize.ahocorasick else 'Python puro'}")
+        self.stdout.write(f"{'regras':>8} {'compilar ms':>12} {'lote ms':>9} {'desc/ms':>9} {'casadas':>8}")
+        for count in sizes:
+            rules = build_rules(count, words)
+            started = time.perf_counter()
+            matcher = categorize.RuleMatcher(rules)
+            compile_ms = (time.perf_counter() - started) * 1000
+            matched = sum(category is not None for category in matcher.match_many(items))
+            elapsed = best_of(lambda: matcher.match_many(items), repeat)
+            self.stdout.write(
+                f"{count:>8} {compile_ms:>12.1f} {elapsed * 1000:>9.2f} {rows / elapsed / 1000:>9.0f} {matched:>8}"
+            )
@@ -0,0 +1,85 @@
+'''finance/management/commands/finance_shards.py'''
+"""
+Manutenção do sharding por usuário (ver finance/sharding.py).
+
+    python manage.py finance_shards list
+    python manage.py finance_shards prepare                       # faixas de id + categorias globais
+    python manage.py finance_shards prepare --assign-existing default
+    python manage.py finance_shards move --user 42 --to shard_2
+    python manage.py finance_shards rebalance --dry-run
+    python manage.py finance_shards rebalance --max-moves 100
+
+`prepare` é idempotente e deve rodar depois do `migrate` de cada shard novo.
+`move` e `rebalance` copiam os dados do usuário pro shard de destino numa
+transação e só depois apagam da origem; rode com o usuário sem escrever (ou
+aceite que o move aborta se algo mudar no meio).
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from finance import sharding
+from finance.models import UserShard
+
+
+class Command(BaseCommand):
+    help = "Lista, prepara e rebalanceia os shards de dados do finance."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["list", "prepare", "move", "rebalance"])
+        parser.add_argument("--user", type=int, help="move: id do usuário.")
+        parser.add_argument("--to", help="move: alias do shard de destino.")
+        parser.add_argument("--assign-existing", metavar="ALIAS",
+                            help="prepare: registra nesse shard os usuários que ainda não estão no diretório "
+                                 "(dados de antes do sharding).")
+        parser.add_argument("--max-moves", type=int, help="rebalance: no máximo N usuários movidos.")
+        parser.add_argument("--dry-run", action="store_true", help="rebalance: só mostra o plano.")
+
+    def handle(self, *args, **opts):
+        if not sharding.sharding_enabled():
+            raise CommandError("Sharding desligado: configure FINANCE_SHARD_DATABASES.")
+        try:
+            getattr(self, opts["action"])(opts)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+    def list(self, opts):
+        counts = dict(UserShard.objects.values_list("alias").annotate(n=Count("user")))
+        for alias in sharding.shard_aliases():
+            self.stdout.write(f"{alias:<20} {counts.get(alias, 0)} usuários")
+
+    def prepare(self, opts):
+        for alias in sharding.shard_aliases():
+            tables = sharding.prepare_shard(alias)
+            self.stdout.write(f"{alias}: sequências ajustadas em {', '.join(tables) or 'nenhuma tabela'}")
+        for alias, created in sharding.sync_global_categories().items():
+            self.stdout.write(f"{alias}: {created} categorias globais criadas")
+
+        target = opts["assign_existing"]
+        if target:
+            if target not in sharding.shard_aliases():
+                raise CommandError(f"{target} não está em FINANCE_SHARDS.")
+            missing = get_user_model().objects.filter(finance_shard__isnull=True).values_list("pk", flat=True)
+            entries = UserShard.objects.bulk_create([UserShard(user_id=pk, alias=target) for pk in missing])
+            self.stdout.write(f"{len(entries)} usuários registrados em {target}")
+
+    def move(self, opts):
+        if opts["user"] is None or not opts["to"]:
+            raise CommandError("move precisa de --user e --to.")
+        copied = sharding.move_user(opts["user"], opts["to"], log=self.stdout.write)
+        if not copied:
+            self.stdout.write(f"Usuário {opts['user']} já está em {opts['to']}.")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Usuário {opts['user']} movido pra {opts['to']}."))
+
+    def rebalance(self, opts):
+        plan = sharding.rebalance_plan(opts["max_moves"])
+        if not plan:
+            self.stdout.write("Shards já balanceados.")
+            return
+        for user_id, source, target in plan:
+            self.stdout.write(f"usuário {user_id}: {source} -> {target}")
+            if not opts["dry_run"]:
+                sharding.move_user(user_id, target)
+        verb = "seriam movidos" if opts["dry_run"] else "movidos"
+        self.stdout.write(self.style.SUCCESS(f"{len(plan)} usuários {verb}."))
@@ -0,0 +1,481 @@
+'''finance/management/commands/loadtest.py'''
+"""
+Gera carga concorrente contra um servidor local pra descobrir o teto de req/s
+e como a latência degrada com a concorrência.
+
+Fluxo:
+  1. cria (se precisar) N usuários de carga com algumas transações;
+  2. sobe um servidor local (runserver/WSGI ou uvicorn/ASGI) num subprocesso,
+     ou usa um já rodando via --url;
+  3. faz login de cada usuário pelo LoginView (cookies JWT);
+  4. vários clientes async repetem um mix de chamadas (dashboard, list, create,
+     summary) até acabar o tempo / o número de requests;
+  5. imprime throughput, taxa de erro e percentis de latência por rota.
+
+O access token é renovado pelo RefreshView antes de expirar (ou ao receber 401).
+Tudo roda offline, só com sockets locais.
+
+Exemplos:
+    python manage.py loadtest --users 20 --concurrency 50 --duration 30
+    python manage.py loadtest --server asgi --workers 4 --mix dashboard=1,create=1
+    python manage.py loadtest --url http://127.0.0.1:8000 --requests 5000
+"""
+import asyncio
+import base64
+import importlib.util
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.models import Category, Transaction
+from finance.sharding import shard_for_user_id, use_shard
+
+PASSWORD = "loadtest-12345"
+EMAIL = "loadtest{}@caixinha.local"
+DEFAULT_MIX = "dashboard=4,list=3,create=1,summary=2"
+SCENARIOS = ("dashboard", "list", "create", "summary")
+# renova o access token quando faltar menos que isso pra expirar
+REFRESH_MARGIN = 30
+
+
+@dataclass
+class HttpResult:
+    status: int
+    headers: list[tuple[str, str]]
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+    def cookies(self) -> dict[str, str]:
+        jar = SimpleCookie()
+        for name, value in self.headers:
+            if name.lower() == "set-cookie":
+                jar.load(value)
+        return {k: morsel.value for k, morsel in jar.items()}
+
+
+def _dechunk(body: bytes) -> bytes:
+    out = bytearray()
+    while body:
+        size_line, _, rest = body.partition(b"\r\n")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            break
+        out += rest[:size]
+        body = rest[size + 2:]
+    return bytes(out)
+
+
+async def http_request(host, port, method, path, body=None, cookies=None, timeout=30.0) -> HttpResult:
+    '''
+    Cliente HTTP/1.1 mínimo em cima de asyncio (uma conexão por request),
+    pra não depender de libs externas.
+    '''
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        payload = b"" if body is None else json.dumps(body).encode()
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {host}:{port}",
+            "Connection: close",
+            "Accept: application/json",
+            f"Content-Length: {len(payload)}",
+        ]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        if cookies:
+            lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in cookies.items()))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    head, _, content = raw.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers.append((name.strip(), value.strip()))
+    if any(n.lower() == "transfer-encoding" and "chunked" in v.lower() for n, v in headers):
+        content = _dechunk(content)
+    return HttpResult(int(status_line.split()[1]), headers, content)
+
+
+def jwt_exp(token: str) -> float:
+    ''' Lê o "exp" do payload do JWT sem validar assinatura '''
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, ValueError, KeyError):
+        return 0.0
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    ''' Percentil por nearest-rank; espera a lista já ordenada '''
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def parse_mix(raw: str) -> dict[str, int]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise CommandError(f"Cenário desconhecido no --mix: {name!r} (use {', '.join(SCENARIOS)})")
+        try:
+            mix[name] = int(weight or 1)
+        except ValueError:
+            raise CommandError(f"Peso inválido no --mix: {part!r}")
+    if not any(mix.values()):
+        raise CommandError("--mix precisa de pelo menos um peso positivo")
+    return mix
+
+
+@dataclass
+class Session:
+    email: str
+    cookies: dict[str, str] = field(default_factory=dict)
+    access_exp: float = 0.0
+    categories: list[int] = field(default_factory=list)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class LoadRunner:
+    '''
+    Dispara os cenários com `concurrency` clientes async e guarda as latências por rota.
+    '''
+
+    def __init__(self, host, port, emails, mix, concurrency, duration, max_requests, timeout):
+        self.host = host
+        self.port = port
+        self.emails = emails
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = max_requests
+        self.timeout = timeout
+
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, Counter] = defaultdict(Counter)
+        self.refreshes = 0
+        self.expired = 0
+        self.login_failures = 0
+        self.sent = 0
+        self.elapsed = 0.0
+
+    def _record(self, route, started, status):
+        self.latencies[route].append(time.perf_counter() - started)
+        if status is None or status >= 400:
+            self.errors[route][status or "conn"] += 1
+
+    async def _raw(self, route, method, path, body=None, cookies=None):
+        started = time.perf_counter()
+        self.sent += 1
+        try:
+            res = await http_request(self.host, self.port, method, path, body, cookies, self.timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            self._record(route, started, None)
+            return None
+        self._record(route, started, res.status)
+        return res
+
+    async def login(self, session: Session) -> bool:
+        ''' Loga o usuário; login que falha fica registrado como erro da rota "login" '''
+        res = await self._raw("login", "POST", "/api/auth/login/", {"email": session.email, "password": PASSWORD})
+        if res is None or res.status != 200:
+            self.login_failures += 1
+            return False
+        session.cookies.update(res.cookies())
+        session.access_exp = jwt_exp(session.cookies.get("access_token", ""))
+
+        res = await self._raw("categories", "GET", "/api/categories/", cookies=session.cookies)
+        if res is not None and res.status == 200:
+            data = res.json()
+            items = data["results"] if isinstance(data, dict) else data
+            session.categories = [c["id"] for c in items]
+        return True
+
+    async def refresh(self, session: Session):
+        # sem cookies de propósito: com o access_token vencido no cookie o
+        # CookieJWTAuthentication devolve 401 antes do AllowAny do RefreshView
+        res = await self._raw("refresh", "POST", "/api/auth/refresh/", {"refresh": session.cookies.get("refresh_token", "")})
+        if res is None or res.status != 200:
+            # refresh também expirou: loga de novo (se falhar, as chamadas
+            # seguintes dão 401 e entram como erro, a carga continua)
+            session.cookies.clear()
+            await self.login(session)
+            return
+        data = res.json()
+        session.cookies["access_token"] = data["access"]
+        if "refresh" in data:
+            session.cookies["refresh_token"] = data["refresh"]
+        session.access_exp = jwt_exp(data["access"])
+        self.refreshes += 1
+
+    async def call(self, session: Session, route, method, path, body=None):
+        if session.access_exp - time.time() < REFRESH_MARGIN:
+            async with session.lock:
+                if session.access_exp - time.time() < REFRESH_MARGIN:
+                    await self.refresh(session)
+
+        res = await self._raw(route, method, path, body, session.cookies)
+        if res is not None and res.status == 401:
+            self.expired += 1
+            async with session.lock:
+                await self.refresh(session)
+            res = await self._raw(route, method, path, body, session.cookies)
+        return res
+
+    async def scenario_dashboard(self, session):
+        await self.call(session, "summary", "GET", "/api/summary/")
+        await self.call(session, "recent", "GET", "/api/transactions/recent/?limit=10")
+
+    async def scenario_list(self, session):
+        month = date.today() - timedelta(days=30 * random.randrange(12))
+        await self.call(session, "list", "GET", f"/api/transactions/?month={month:%Y-%m}")
+
+    async def scenario_create(self, session):
+        body = {
+            "type": random.choice(["IN", "OUT"]),
+            "amount": f"{random.randint(100, 50000) / 100:.2f}",
+            "date": date.today().isoformat(),
+            "description": "loadtest",
+        }
+        if session.categories:
+            body["category"] = random.choice(session.categories)
+        await self.call(session, "create", "POST", "/api/transactions/", body)
+
+    async def scenario_summary(self, session):
+        month = date.today() - timedelta(days=30 * random.randrange(12))
+        await self.call(session, "summary", "GET", f"/api/summary/?month={month:%Y-%m}")
+
+    async def _worker(self, sessions, deadline):
+        names = list(self.mix)
+        weights = [self.mix[n] for n in names]
+        while time.perf_counter() < deadline:
+            if self.max_requests and self.sent >= self.max_requests:
+                return
+            session = random.choice(sessions)
+            scenario = random.choices(names, weights)[0]
+            await getattr(self, f"scenario_{scenario}")(session)
+
+    async def run(self):
+        sessions = [Session(email) for email in self.emails]
+        # login fora da janela medida, em lotes pra não derrubar o servidor
+        logged = []
+        for i in range(0, len(sessions), self.concurrency):
+            logged += await asyncio.gather(*(self.login(s) for s in sessions[i:i + self.concurrency]))
+        if not any(logged):
+            raise CommandError(f"Login falhou para todos os {len(sessions)} usuários de carga.")
+        # quem não logou fica de fora da carga (e conta em login_failures)
+        sessions = [s for s, ok in zip(sessions, logged) if ok]
+        for route in ("login", "categories"):
+            self.latencies.pop(route, None)
+            self.errors.pop(route, None)
+        self.sent = 0
+
+        started = time.perf_counter()
+        deadline = started + self.duration
+        await asyncio.gather(*(self._worker(sessions, deadline) for _ in range(self.concurrency)))
+        self.elapsed = time.perf_counter() - started
+
+    def report(self) -> dict:
+        routes = {}
+        total = 0
+        total_errors = 0
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            errors = sum(self.errors[route].values())
+            total += len(values)
+            total_errors += errors
+            routes[route] = {
+                "requests": len(values),
+                "errors": errors,
+                "error_rate": errors / len(values) if values else 0.0,
+                "rps": len(values) / self.elapsed if self.elapsed else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p90_ms": percentile(values, 90) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": values[-1] * 1000 if values else 0.0,
+                "status": {str(k): v for k, v in self.errors[route].items()},
+            }
+        return {
+            "elapsed_s": self.elapsed,
+            "requests": total,
+            "errors": total_errors,
+            "rps": total / self.elapsed if self.elapsed else 0.0,
+            "token_refreshes": self.refreshes,
+            "expired_401": self.expired,
+            "login_failures": self.login_failures,
+            "routes": routes,
+        }
+
+
+class Command(BaseCommand):
+    help = "Teste de carga concorrente (login por cookie JWT + mix de chamadas) contra um servidor local."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Usuários de carga (criados se não existirem).")
+        parser.add_argument("--seed-transactions", type=int, default=200,
+                            help="Transações criadas para cada usuário de carga que ainda não tiver nenhuma.")
+        parser.add_argument("--concurrency", type=int, default=50, help="Clientes async simultâneos.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Duração da medição em segundos.")
+        parser.add_argument("--requests", type=int, default=0, help="Para depois de N requests (0 = só pelo tempo).")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos dos cenários (padrão: {DEFAULT_MIX}).")
+        parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi",
+                            help="wsgi = runserver; asgi = uvicorn backend.asgi (precisa do uvicorn).")
+        parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn (só --server asgi).")
+        parser.add_argument("--url", help="Usa um servidor já rodando em vez de subir um (ex: http://127.0.0.1:8000).")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Timeout por request em segundos.")
+        parser.add_argument("--json", action="store_true", help="Imprime o relatório em JSON.")
+
+    def handle(self, *args, **opts):
+        mix = parse_mix(opts["mix"])
+        emails = self.seed_users(opts["users"], opts["seed_transactions"])
+
+        proc = None
+        if opts["url"]:
+            parts = urlsplit(opts["url"])
+            host, port = parts.hostname or "127.0.0.1", parts.port or 80
+        else:
+            host = "127.0.0.1"
+            proc, port = self.start_server(opts["server"], opts["workers"])
+
+        try:
+            runner = LoadRunner(host, port, emails, mix, opts["concurrency"], opts["duration"],
+                                opts["requests"], opts["timeout"])
+            asyncio.run(runner.run())
+        finally:
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+        report = runner.report()
+        if opts["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def seed_users(self, count: int, tx_per_user: int) -> list[str]:
+        User = get_user_model()
+        emails = [EMAIL.format(i) for i in range(count)]
+        existing = set(User.objects.filter(username__in=emails).values_list("username", flat=True))
+
+        # LoginView autentica com username=email, então username e email são iguais
+        password = make_password(PASSWORD)
+        created = User.objects.bulk_create(
+            [User(username=e, email=e, password=password) for e in emails if e not in existing]
+        )
+        # bulk_create não dispara o signal que cria o "Outros" do usuário.
+        # Com sharding cada usuário é semeado no shard dele.
+        users = list(User.objects.filter(username__in=emails))
+        by_shard = defaultdict(list)
+        for u in users:
+            by_shard[shard_for_user_id(u.pk)].append(u)
+        created_ids = {u.pk for u in created}
+
+        today = date.today()
+        for alias, shard_users in by_shard.items():
+            with use_shard(alias):
+                Category.objects.bulk_create(
+                    [Category(user=u, name="Outros") for u in shard_users if u.pk in created_ids],
+                    ignore_conflicts=True,
+                )
+                if not tx_per_user:
+                    continue
+                seeded = set(
+                    Transaction.objects.filter(user_id__in=[u.pk for u in shard_users])
+                    .order_by().values_list("user_id", flat=True).distinct()
+                )
+                rows = [
+                    Transaction(
+                        user=u,
+                        type=Transaction.Type.INCOME if i % 5 == 0 else Transaction.Type.EXPENSE,
+                        amount=Decimal(random.randint(100, 50000)) / 100,
+                        date=today - timedelta(days=random.randrange(365)),
+                        description=f"seed {i}",
+                    )
+                    for u in shard_users if u.pk not in seeded
+                    for i in range(tx_per_user)
+                ]
+                Transaction.objects.bulk_create(rows, batch_size=5000)
+
+        self.stdout.write(f"{len(emails)} usuários de carga ({len(created)} novos)")
+        return emails
+
+    def start_server(self, kind: str, workers: int):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+
+        if kind == "wsgi":
+            cmd = [sys.executable, str(settings.BASE_DIR / "manage.py"), "runserver", f"127.0.0.1:{port}", "--noreload"]
+        else:
+            if importlib.util.find_spec("uvicorn") is None:
+                raise CommandError("--server asgi precisa do uvicorn instalado (ou use --url).")
+            cmd = [
+                sys.executable, "-m", "uvicorn", "backend.asgi:application",
+                "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+            ]
+
+        proc = subprocess.Popen(cmd, cwd=settings.BASE_DIR, env=os.environ.copy(),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise CommandError(f"Servidor {kind} saiu com código {proc.returncode}.")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    self.stdout.write(f"Servidor {kind} no ar em 127.0.0.1:{port}")
+                    return proc, port
+            except OSError:
+                time.sleep(0.2)
+        proc.kill()
+        raise CommandError(f"Servidor {kind} não subiu em 30s.")
+
+    def print_report(self, report: dict):
+        self.stdout.write(
+            f"\n{report['requests']} requests em {report['elapsed_s']:.1f}s "
+            f"= {report['rps']:.1f} req/s, {report['errors']} erros, "
+            f"{report['token_refreshes']} refreshes ({report['expired_401']} 401 por token vencido), "
+            f"{report['login_failures']} logins falharam\n"
+        )
+        header = f"{'rota':<10} {'reqs':>7} {'req/s':>8} {'erro%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for route, r in report["routes"].items():
+            self.stdout.write(
+                f"{route:<10} {r['requests']:>7} {r['rps']:>8.1f} {r['error_rate'] * 100:>5.1f}% "
+                f"{r['p50_ms']:>7.1f}ms {r['p90_ms']:>6.1f}ms {r['p99_ms']:>6.1f}ms {r['max_ms']:>6.1f}ms"
+            )
+            if r["status"]:
+                self.stdout.write(f"{'':<10} status: {r['status']}")
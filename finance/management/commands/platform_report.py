@@ -0,0 +1,32 @@
+'''finance/management/commands/platform_report.py'''
+"""
+Gera o relatório da plataforma (ver finance/platform_report.py) e guarda pro
+GET /api/platform/report/. Rodar no cron (ex: 1x por dia, fora do pico).
+
+    python manage.py platform_report
+    python manage.py platform_report --workers 8 --print
+"""
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from finance import platform_report
+
+
+class Command(BaseCommand):
+    help = "Gera o relatório agregado de todos os usuários (volume, categorias, percentis)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processos em paralelo (padrão: número de CPUs).")
+        parser.add_argument("--print", action="store_true", help="Mostra o relatório em JSON.")
+
+    def handle(self, *args, **opts):
+        log = self.stdout.write if opts["verbosity"] > 1 else None
+        report = platform_report.generate(max(1, opts["workers"]), log=log)
+        if opts["print"]:
+            self.stdout.write(json.dumps(report.data, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.data['rows']} transações em {report.elapsed_ms / 1000:.1f}s com {report.workers} processos."
+        ))
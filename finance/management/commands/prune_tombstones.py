@@ -0,0 +1,24 @@
+'''finance/management/commands/prune_tombstones.py'''
+"""
+Apaga registros de remoção antigos do delta-sync (ver finance/sync.py) e as
+chaves de idempotência vencidas do /transactions/batch/ (FINANCE_IDEMPOTENCY_DAYS,
+ver finance/batch.py).
+
+    python manage.py prune_tombstones              # FINANCE_SYNC_TOMBSTONE_DAYS
+    python manage.py prune_tombstones --days 30
+"""
+from django.core.management.base import BaseCommand
+
+from finance import batch, sync
+
+
+class Command(BaseCommand):
+    help = "Apaga tombstones do delta-sync e chaves de idempotência do batch mais antigos que o configurado."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Idade mínima em dias (padrão: FINANCE_SYNC_TOMBSTONE_DAYS).")
+
+    def handle(self, *args, **opts):
+        removed = sync.prune_tombstones(opts["days"])
+        keys = batch.prune_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(f"{removed} tombstones e {keys} chaves de idempotência apagados."))
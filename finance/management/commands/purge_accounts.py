@@ -0,0 +1,43 @@
+'''finance/management/commands/purge_accounts.py'''
+"""
+Exclusão de contas em lotes (ver finance/purge.py). Sem argumentos processa
+os pedidos em aberto, inclusive os que pararam no meio; com --user pede a
+exclusão antes (o usuário fica inativo na hora). Rodar no cron.
+
+    python manage.py purge_accounts
+    python manage.py purge_accounts --user john --user 42 --batch-size 2000
+    python manage.py purge_accounts --user john --request-only
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from finance import purge
+
+
+class Command(BaseCommand):
+    help = "Apaga em lotes as contas com exclusão pedida."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", default=[],
+                            help="Username ou id a excluir (pode repetir).")
+        parser.add_argument("--request-only", action="store_true",
+                            help="Só desativa e agenda; os dados saem na próxima execução.")
+        parser.add_argument("--batch-size", type=int, default=purge.BATCH_SIZE,
+                            help=f"Linhas por lote/transação (padrão: {purge.BATCH_SIZE}).")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        for ref in opts["user"]:
+            lookup = Q(username=ref) | Q(pk=int(ref)) if ref.isdigit() else Q(username=ref)
+            user = User.objects.filter(lookup).first()
+            if user is None:
+                raise CommandError(f"Usuário {ref} não encontrado.")
+            purge.request_purge(user)
+            self.stdout.write(f"{user.get_username()} desativado, exclusão agendada.")
+        if opts["request_only"]:
+            return
+
+        totals = purge.run_pending(max(1, opts["batch_size"]), log=self.stdout.write)
+        style = self.style.ERROR if totals["failed"] else self.style.SUCCESS
+        self.stdout.write(style(f"{totals['finished']} contas excluídas, {totals['failed']} com erro."))
@@ -0,0 +1,45 @@
+'''finance/management/commands/reconcile_budgets.py'''
+"""
+Recalcula os contadores de gasto dos orçamentos (SpendingCounter) a partir das
+transações e dos totais arquivados e mostra as diferenças (ver
+finance/budgets.py). Com --fix grava os valores recalculados.
+
+    python manage.py reconcile_budgets
+    python manage.py reconcile_budgets --fix
+    python manage.py reconcile_budgets --user john --fix
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from finance import budgets
+
+
+class Command(BaseCommand):
+    help = "Confere (e com --fix corrige) os contadores de gasto dos orçamentos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Grava os valores recalculados.")
+        parser.add_argument("--user", help="Username ou id (padrão: todos).")
+
+    def handle(self, *args, **opts):
+        user_id = None
+        if opts["user"]:
+            ref = opts["user"]
+            lookup = Q(username=ref) | Q(pk=int(ref)) if ref.isdigit() else Q(username=ref)
+            user_id = get_user_model().objects.filter(lookup).values_list("pk", flat=True).first()
+            if user_id is None:
+                raise CommandError(f"Usuário {ref} não encontrado.")
+
+        drift = budgets.reconcile(fix=opts["fix"], user_id=user_id, log=self.stdout.write)
+        for row in drift:
+            self.stdout.write(
+                f"usuário {row['user']} categoria {row['category']} {row['month']}: "
+                f"contador {row['counter']}, transações {row['expected']}"
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Contadores conferem."))
+        elif opts["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"{len(drift)} contadores corrigidos."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} contadores divergentes (rode com --fix)."))
@@ -0,0 +1,22 @@
+'''finance/management/commands/restore_transactions.py'''
+"""
+Devolve transações arquivadas de um usuário pra tabela de transações.
+
+    python manage.py restore_transactions --user 42
+    python manage.py restore_transactions --user 42 --year 2019
+"""
+from django.core.management.base import BaseCommand
+
+from finance import archive
+
+
+class Command(BaseCommand):
+    help = "Restaura transações arquivadas de um usuário (todas ou de um ano)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, required=True, help="Id do usuário.")
+        parser.add_argument("--year", type=int, help="Só esse ano.")
+
+    def handle(self, *args, **opts):
+        restored = archive.restore_user(opts["user"], year=opts["year"])
+        self.stdout.write(self.style.SUCCESS(f"{restored} transações restauradas."))
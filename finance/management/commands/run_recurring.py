@@ -0,0 +1,38 @@
+'''finance/management/commands/run_recurring.py'''
+"""
+Cria as transações dos lançamentos recorrentes que venceram (ver
+finance/recurring.py), inclusive os períodos perdidos. Rodar no cron (ex: de
+hora em hora); mais de um ao mesmo tempo divide o trabalho (SKIP LOCKED).
+
+    python manage.py run_recurring
+    python manage.py run_recurring --date 2026-03-01 --chunk-size 5000
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from finance import recurring
+
+
+class Command(BaseCommand):
+    help = "Cria as transações vencidas dos lançamentos recorrentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Cria o que venceu até esta data, YYYY-MM-DD (padrão: hoje).")
+        parser.add_argument("--chunk-size", type=int, default=recurring.CHUNK_SIZE,
+                            help=f"Recorrências por transação do banco (padrão: {recurring.CHUNK_SIZE}).")
+
+    def handle(self, *args, **opts):
+        today = None
+        if opts["date"]:
+            today = parse_date(opts["date"])
+            if today is None:
+                raise CommandError("--date precisa ser YYYY-MM-DD.")
+        log = self.stdout.write if opts["verbosity"] > 1 else None
+        started = time.perf_counter()
+        totals = recurring.run_due(today, max(1, opts["chunk_size"]), log=log)
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['recurring']} recorrências processadas, {totals['created']} transações criadas "
+            f"em {time.perf_counter() - started:.1f}s."
+        ))
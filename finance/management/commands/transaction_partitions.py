@@ -0,0 +1,73 @@
+'''finance/management/commands/transaction_partitions.py'''
+"""
+Gerencia o particionamento por data da tabela de transações (só Postgres).
+
+    python manage.py transaction_partitions list
+    python manage.py transaction_partitions convert --interval year
+    python manage.py transaction_partitions maintain --ahead 2
+    python manage.py transaction_partitions maintain --retain 10 --drop
+
+`maintain` é idempotente e feito pra rodar no cron: cria as partições futuras
+antes que os lançamentos cheguem nelas e, com --retain, desanexa (ou apaga com
+--drop) as partições antigas.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from finance import partitioning
+
+
+class Command(BaseCommand):
+    help = "Converte e mantém o particionamento por data de finance_transaction (Postgres)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["list", "convert", "maintain"])
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--interval", choices=partitioning.INTERVALS,
+                            help="Tamanho das partições (padrão: FINANCE_PARTITION_INTERVAL).")
+        parser.add_argument("--ahead", type=int, default=1,
+                            help="Quantos períodos futuros manter criados além do atual.")
+        parser.add_argument("--retain", type=int,
+                            help="maintain: desanexa partições que terminam antes de N períodos atrás.")
+        parser.add_argument("--drop", action="store_true",
+                            help="maintain: apaga as partições antigas em vez de só desanexar.")
+        parser.add_argument("--batch-size", type=int, default=50_000, help="convert: linhas copiadas por lote.")
+        parser.add_argument("--drop-legacy", action="store_true",
+                            help="convert: apaga a tabela antiga no fim em vez de mantê-la como _legacy.")
+
+    def handle(self, *args, **opts):
+        using = opts["database"]
+        try:
+            if opts["action"] == "list":
+                self.list(using)
+            elif opts["action"] == "convert":
+                result = partitioning.convert_table(
+                    interval=opts["interval"], batch_size=opts["batch_size"], drop_legacy=opts["drop_legacy"],
+                    ahead=opts["ahead"], using=using, log=self.stdout.write,
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f"{partitioning.TABLE} particionada por {result['interval']}: "
+                    f"{result['rows']} linhas em {result['partitions']} partições."
+                ))
+                if not opts["drop_legacy"]:
+                    self.stdout.write(f"Tabela antiga mantida como {partitioning.LEGACY_TABLE}.")
+            else:
+                result = partitioning.maintain(
+                    ahead=opts["ahead"], retain=opts["retain"], drop=opts["drop"],
+                    interval=opts["interval"], using=using,
+                )
+                self.stdout.write(f"Criadas: {', '.join(result['created']) or 'nenhuma'}")
+                if opts["retain"] is not None:
+                    verb = "Apagadas" if opts["drop"] else "Desanexadas"
+                    self.stdout.write(f"{verb}: {', '.join(result['removed']) or 'nenhuma'}")
+        except (NotSupportedError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+    def list(self, using):
+        if not partitioning.is_partitioned(using):
+            self.stdout.write(f"{partitioning.TABLE} não está particionada.")
+            return
+        for name in partitioning.list_partitions(using):
+            bounds = partitioning.partition_bounds(name)
+            span = f"[{bounds[0]}, {bounds[1]})" if bounds else "DEFAULT"
+            self.stdout.write(f"{name:<40} {span}")
@@ -2,11 +2,12 @@ from django.db import migrations
 
 def create_default_category(apps, schema_editor):
     Category = apps.get_model("finance", "Category")
-    Category.objects.get_or_create(name="Outros")
+    # roda em cada banco migrado (default e shards), cada um com o seu "Outros" global
+    Category.objects.using(schema_editor.connection.alias).get_or_create(name="Outros")
 
 def reverse(apps, schema_editor):
     Category = apps.get_model("finance", "Category")
-    Category.objects.filter(name="Outros").delete()
+    Category.objects.using(schema_editor.connection.alias).filter(name="Outros").delete()
 
 class Migration(migrations.Migration):
     dependencies = [
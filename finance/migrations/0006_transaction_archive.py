@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0005_transaction_user_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedMonthTotal",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField()),
+                ("type", models.CharField(choices=[("IN", "Entrada"), ("OUT", "Saída")], max_length=3)),
+                ("total", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("count", models.PositiveIntegerField()),
+                ("category", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="archived_totals", to="finance.category")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="archived_totals", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["user", "month"],
+                "indexes": [models.Index(fields=["user", "month"], name="archived_total_user_month_idx")],
+            },
+        ),
+        migrations.CreateModel(
+            name="TransactionArchive",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("year", models.PositiveSmallIntegerField()),
+                ("row_count", models.PositiveIntegerField(default=0)),
+                ("first_date", models.DateField()),
+                ("last_date", models.DateField()),
+                ("payload", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="transaction_archives", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["user", "year"],
+                "constraints": [models.UniqueConstraint(fields=("user", "year"), name="uniq_archive_per_user_year")],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0008_sync_tracking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synccounter",
+            name="epoch",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
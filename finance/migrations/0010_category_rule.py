@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0009_sync_counter_epoch"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategoryRule",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("keyword", "Palavra-chave"), ("prefix", "Começa com"), ("regex", "Expressão regular"), ("amount", "Faixa de valor")], max_length=8)),
+                ("pattern", models.CharField(blank=True, max_length=200)),
+                ("min_amount", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ("max_amount", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ("priority", models.PositiveIntegerField(default=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("category", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="rules", to="finance.category")),
+                ("user", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name="category_rules", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["priority", "id"],
+                "indexes": [models.Index(fields=["user", "priority"], name="category_rule_user_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# busca do admin: UPPER(description) LIKE 'TERMO%' (istartswith) pelo índice; só Postgres
+def create_description_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS tx_description_prefix_idx "
+            "ON finance_transaction (UPPER(description::text) text_pattern_ops)"
+        )
+
+
+def drop_description_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS tx_description_prefix_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0011_idempotency_key"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["-date", "-id"], name="tx_date_idx"),
+        ),
+        migrations.RunPython(create_description_prefix_index, drop_description_prefix_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0012_admin_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecurringTransaction",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("type", models.CharField(choices=[("IN", "Entrada"), ("OUT", "Saída")], max_length=3)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("description", models.CharField(blank=True, max_length=200)),
+                ("frequency", models.CharField(choices=[("daily", "Diária"), ("weekly", "Semanal"), ("monthly", "Mensal"), ("yearly", "Anual")], default="monthly", max_length=7)),
+                ("interval", models.PositiveSmallIntegerField(default=1)),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField(blank=True, null=True)),
+                ("count", models.PositiveIntegerField(blank=True, null=True)),
+                ("active", models.BooleanField(default=True)),
+                ("next_run", models.DateField(blank=True, null=True)),
+                ("position", models.PositiveIntegerField(default=0, editable=False)),
+                ("last_run", models.DateField(blank=True, editable=False, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("category", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="recurring_transactions", to="finance.category")),
+                ("user", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name="recurring_transactions", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["next_run", "id"],
+                "indexes": [models.Index(condition=models.Q(("active", True), ("next_run__isnull", False)), fields=["next_run", "id"], name="recurring_next_run_idx"), models.Index(fields=["user", "next_run"], name="recurring_user_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0013_recurring_transaction"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountPurge",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("user_id", models.BigIntegerField(unique=True)),
+                ("username", models.CharField(max_length=150)),
+                ("requested_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("deleted", models.JSONField(blank=True, default=dict)),
+                ("batches", models.PositiveIntegerField(default=0)),
+                ("max_batch_ms", models.FloatField(default=0)),
+                ("error", models.TextField(blank=True)),
+            ],
+            options={
+                "ordering": ["requested_at", "id"],
+                "indexes": [models.Index(condition=models.Q(("finished_at__isnull", True)), fields=["requested_at", "id"], name="account_purge_pending_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0014_account_purge"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlatformReport",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("generated_at", models.DateTimeField(auto_now_add=True)),
+                ("workers", models.PositiveSmallIntegerField()),
+                ("elapsed_ms", models.FloatField()),
+                ("data", models.JSONField()),
+            ],
+            options={
+                "ordering": ["-generated_at", "-id"],
+            },
+        ),
+    ]
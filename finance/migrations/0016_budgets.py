@@ -0,0 +1,80 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0015_platform_report"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Budget",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField(blank=True, null=True)),
+                ("limit", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("category", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="budgets", to="finance.category")),
+                ("user", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name="budgets", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["category", "month", "id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="BudgetEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField()),
+                ("threshold", models.PositiveSmallIntegerField()),
+                ("spent", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("limit", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("budget", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="events", to="finance.budget")),
+                ("user", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name="budget_events", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["-created_at", "-id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SpendingCounter",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField()),
+                ("spent", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ("count", models.IntegerField(default=0)),
+                ("category", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="spending_counters", to="finance.category")),
+                ("user", models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name="spending_counters", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["user", "month", "category"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="budget",
+            constraint=models.UniqueConstraint(condition=models.Q(("month__isnull", False)), fields=("user", "category", "month"), name="uniq_budget_per_month"),
+        ),
+        migrations.AddConstraint(
+            model_name="budget",
+            constraint=models.UniqueConstraint(condition=models.Q(("month__isnull", True)), fields=("user", "category"), name="uniq_recurring_budget"),
+        ),
+        migrations.AddIndex(
+            model_name="budgetevent",
+            index=models.Index(fields=["user", "-created_at"], name="budget_event_user_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="budgetevent",
+            constraint=models.UniqueConstraint(fields=("budget", "month", "threshold"), name="uniq_budget_event"),
+        ),
+        migrations.AddConstraint(
+            model_name="spendingcounter",
+            constraint=models.UniqueConstraint(fields=("user", "category", "month"), name="uniq_spending_counter"),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:02
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+# arquivos que já existem: a faixa de ids sai do próprio payload (o id é a 1ª coluna)
+def fill_id_range(apps, schema_editor):
+    TransactionArchive = apps.get_model("finance", "TransactionArchive")
+    archives = TransactionArchive.objects.using(schema_editor.connection.alias)
+    for archive in archives.only("id", "payload").iterator():
+        ids = [values[0] for values in json.loads(zlib.decompress(bytes(archive.payload)))]
+        archives.filter(id=archive.id).update(first_id=min(ids, default=0), last_id=max(ids, default=0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0016_budgets"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transactionarchive",
+            name="first_id",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="transactionarchive",
+            name="last_id",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_id_range, migrations.RunPython.noop),
+    ]
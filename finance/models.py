@@ -9,8 +9,11 @@ class Category(models.Model):
     '''
     name = models.CharField(max_length=80)
     created_at = models.DateTimeField(auto_now_add=True)
+    # sem constraint no banco: com sharding o usuário fica no default e a categoria no shard
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True,
-        blank=True, related_name="categories")
+        blank=True, related_name="categories", db_constraint=False)
+    # posição na sequência de mudanças do usuário (ver finance/sync.py)
+    sync_seq = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         '''
@@ -18,6 +21,9 @@ class Category(models.Model):
         '''
         ordering = ["name"]
         unique_together = ("user", "name")
+        indexes = [
+            models.Index(fields=["user", "sync_seq", "id"], name="category_user_sync_idx"),
+        ]
 
         constraints = [
             models.UniqueConstraint(
@@ -45,10 +51,368 @@ class Transaction(models.Model):
         Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions"
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name="transactions")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE,
+        related_name="transactions", db_constraint=False)
+    sync_seq = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["-date", "-id"]
+        indexes = [
+            # listagem/summary sempre filtram por usuário e ordenam por data
+            models.Index(fields=["user", "-date", "-id"], name="tx_user_date_idx"),
+            models.Index(fields=["user", "category", "-date"], name="tx_user_category_date_idx"),
+            models.Index(fields=["user", "sync_seq", "id"], name="tx_user_sync_idx"),
+            # admin: lista sem filtro de usuário, date_hierarchy e cursor por (date, id)
+            models.Index(fields=["-date", "-id"], name="tx_date_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_type_display()} R$ {self.amount} em {self.date}"
+
+class CategoryRule(models.Model):
+    '''
+    Regra de categorização automática do usuário: descrição com a palavra
+    (keyword), começando com (prefix) ou casando com a regex, e/ou valor na
+    faixa [min_amount, max_amount] -> categoria. Vale a de menor `priority`
+    (ver finance/categorize.py).
+    '''
+    class Kind(models.TextChoices):
+        KEYWORD = "keyword", "Palavra-chave"
+        PREFIX = "prefix", "Começa com"
+        REGEX = "regex", "Expressão regular"
+        AMOUNT = "amount", "Faixa de valor"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="category_rules",
+        db_constraint=False)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="rules")
+    kind = models.CharField(max_length=8, choices=Kind.choices)
+    pattern = models.CharField(max_length=200, blank=True)
+    # faixa opcional (inclusiva); numa regra "amount" é o critério todo
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    priority = models.PositiveIntegerField(default=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["priority", "id"]
+        indexes = [
+            models.Index(fields=["user", "priority"], name="category_rule_user_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} {self.pattern!r} -> {self.category_id}"
+
+
+class RecurringTransaction(models.Model):
+    '''
+    Lançamento recorrente (aluguel, salário, assinatura): a cada `interval`
+    dias/semanas/meses/anos a partir de `start_date`, até `end_date` e/ou
+    `count` ocorrências, como um RRULE. O `manage.py run_recurring` cria as
+    transações vencidas (ver finance/recurring.py).
+    '''
+    class Frequency(models.TextChoices):
+        DAILY = "daily", "Diária"
+        WEEKLY = "weekly", "Semanal"
+        MONTHLY = "monthly", "Mensal"
+        YEARLY = "yearly", "Anual"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name="recurring_transactions", db_constraint=False)
+    type = models.CharField(max_length=3, choices=Transaction.Type.choices)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.CharField(max_length=200, blank=True)
+    # sem categoria (ou categoria apagada) cai no "Outros" do usuário
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="recurring_transactions")
+    frequency = models.CharField(max_length=7, choices=Frequency.choices, default=Frequency.MONTHLY)
+    interval = models.PositiveSmallIntegerField(default=1)
+    # mensal/anual usa o dia de start_date (31 vira o último dia nos meses mais curtos)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    count = models.PositiveIntegerField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+    # próxima ocorrência e a posição dela na regra (0 = start_date); None quando acabou
+    next_run = models.DateField(null=True, blank=True)
+    position = models.PositiveIntegerField(default=0, editable=False)
+    last_run = models.DateField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["next_run", "id"]
+        indexes = [
+            # o scheduler pega as vencidas de todos os usuários por aqui
+            models.Index(fields=["next_run", "id"], name="recurring_next_run_idx",
+                condition=Q(active=True, next_run__isnull=False)),
+            models.Index(fields=["user", "next_run"], name="recurring_user_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_frequency_display()} {self.description or self.get_type_display()} R$ {self.amount}"
+
+
+class Budget(models.Model):
+    '''
+    Limite de gasto do usuário numa categoria: num mês (`month`, dia 1) ou em
+    todo mês (month vazio). O do mês vale no lugar do recorrente. O gasto vem
+    do SpendingCounter (ver finance/budgets.py).
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="budgets",
+        db_constraint=False)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="budgets")
+    month = models.DateField(null=True, blank=True)
+    limit = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["category", "month", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category", "month"], condition=Q(month__isnull=False),
+                name="uniq_budget_per_month"),
+            models.UniqueConstraint(fields=["user", "category"], condition=Q(month__isnull=True),
+                name="uniq_recurring_budget"),
+        ]
+
+    def __str__(self) -> str:
+        when = f"{self.month:%Y-%m}" if self.month else "todo mês"
+        return f"{self.category_id} ({when}): R$ {self.limit}"
+
+
+class SpendingCounter(models.Model):
+    '''
+    Total das saídas do usuário numa categoria num mês (transações + arquivadas),
+    mantido na mesma transação do banco que cada escrita de Transaction. É o
+    que o orçamento lê, no lugar de um Sum por categoria (ver finance/budgets.py).
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="spending_counters",
+        db_constraint=False)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="spending_counters")
+    month = models.DateField()  # primeiro dia do mês
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["user", "month", "category"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category", "month"], name="uniq_spending_counter"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.category_id} {self.month:%Y-%m}: R$ {self.spent}"
+
+
+class BudgetEvent(models.Model):
+    '''
+    Orçamento que passou de um limiar (50/80/100% do limite) num mês. Uma vez
+    por limiar e mês; também vai pro stream SSE.
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="budget_events",
+        db_constraint=False)
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="events")
+    month = models.DateField()
+    threshold = models.PositiveSmallIntegerField()
+    spent = models.DecimalField(max_digits=14, decimal_places=2)
+    limit = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        constraints = [
+            models.UniqueConstraint(fields=["budget", "month", "threshold"], name="uniq_budget_event"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="budget_event_user_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.budget_id} {self.month:%Y-%m}: {self.threshold}%"
+
+
+class TransactionArchive(models.Model):
+    '''
+    Transações antigas de um usuário num ano, fora da tabela quente.
+    As linhas ficam em `payload` como JSON compactado com zlib (ver finance/archive.py).
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="transaction_archives",
+        db_constraint=False)
+    year = models.PositiveSmallIntegerField()
+    row_count = models.PositiveIntegerField(default=0)
+    first_date = models.DateField()
+    last_date = models.DateField()
+    # menor/maior id arquivado: o retrieve acha o ano sem descompactar os outros
+    first_id = models.BigIntegerField(default=0)
+    last_id = models.BigIntegerField(default=0)
+    payload = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["user", "year"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year"], name="uniq_archive_per_user_year"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Arquivo {self.year} de {self.user_id} ({self.row_count} transações)"
+
+
+class ArchivedMonthTotal(models.Model):
+    '''
+    Snapshot agregado das transações arquivadas: soma e quantidade por
+    usuário / mês / tipo / categoria. É o que mantém o SummaryView certo
+    depois que as linhas saem da tabela de transações.
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="archived_totals",
+        db_constraint=False)
+    month = models.DateField()  # primeiro dia do mês
+    type = models.CharField(max_length=3, choices=Transaction.Type.choices)
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="archived_totals"
+    )
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["user", "month"]
+        indexes = [
+            models.Index(fields=["user", "month"], name="archived_total_user_month_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.month:%Y-%m} {self.type} R$ {self.total}"
+
+
+class SyncCounter(models.Model):
+    '''
+    Última posição da sequência de mudanças do usuário. Toda escrita em
+    Transaction/Category (e toda remoção) pega o próximo número daqui, na mesma
+    transação do banco (ver finance/sync.py).
+    '''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="sync_counter",
+        db_constraint=False,
+    )
+    seq = models.BigIntegerField(default=0)
+    # tombstones até aqui já foram apagados: token mais antigo que isso precisa de sync completo
+    pruned_seq = models.BigIntegerField(default=0)
+    # muda quando linhas saem/voltam sem passar pela sequência (arquivamento,
+    # restauração, snapshots remapeados): quem guarda cópia (finance/ledger.py) recarrega
+    epoch = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.user_id}: {self.seq}"
+
+
+class Tombstone(models.Model):
+    '''
+    Registro de remoção de uma transação/categoria, pro delta-sync avisar os clientes.
+    '''
+    class Kind(models.TextChoices):
+        TRANSACTION = "transaction", "Transação"
+        CATEGORY = "category", "Categoria"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tombstones",
+        db_constraint=False)
+    kind = models.CharField(max_length=12, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    sync_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["user", "sync_seq"]
+        indexes = [
+            models.Index(fields=["user", "sync_seq", "id"], name="tombstone_user_sync_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.object_id} removida (seq {self.sync_seq})"
+
+
+class IdempotencyKey(models.Model):
+    '''
+    Resultado de uma operação do POST /api/transactions/batch/ pela chave que o
+    cliente mandou: reenviar o lote devolve o mesmo resultado em vez de aplicar
+    de novo (ver finance/batch.py).
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="idempotency_keys",
+        db_constraint=False)
+    key = models.CharField(max_length=64)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="uniq_idempotency_key_per_user"),
+        ]
+        indexes = [
+            models.Index(fields=["created_at"], name="idempotency_key_created_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id}: {self.key}"
+
+
+class UserShard(models.Model):
+    '''
+    Diretório de sharding: em qual banco (alias de FINANCE_SHARDS) ficam os
+    dados do finance do usuário. Sempre lido/escrito no default (ver finance/sharding.py).
+    '''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="finance_shard"
+    )
+    alias = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["alias"], name="user_shard_alias_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} -> {self.alias}"
+
+
+class AccountPurge(models.Model):
+    '''
+    Pedido de exclusão de conta. O usuário fica inativo na hora e os dados
+    saem em lotes pelo `manage.py purge_accounts` (ver finance/purge.py).
+    Fica no banco do diretório e sobrevive ao usuário (por isso sem FK).
+    '''
+    user_id = models.BigIntegerField(unique=True)
+    username = models.CharField(max_length=150)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # linhas apagadas por model ({"finance.Transaction": 120000, ...})
+    deleted = models.JSONField(default=dict, blank=True)
+    batches = models.PositiveIntegerField(default=0)
+    # lote mais demorado, em ms: é o tempo máximo que os locks ficaram presos
+    max_batch_ms = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["requested_at", "id"]
+        indexes = [
+            models.Index(fields=["requested_at", "id"], name="account_purge_pending_idx",
+                condition=Q(finished_at__isnull=True)),
+        ]
+
+    def __str__(self) -> str:
+        return f"Exclusão de {self.username} ({self.user_id})"
+
+
+class PlatformReport(models.Model):
+    '''
+    Relatório agregado de todos os usuários (volume por mês, categorias,
+    percentis de gasto), gerado pelo `manage.py platform_report` e servido pro
+    staff em /api/platform/report/ (ver finance/platform_report.py).
+    '''
+    generated_at = models.DateTimeField(auto_now_add=True)
+    workers = models.PositiveSmallIntegerField()
+    elapsed_ms = models.FloatField()
+    data = models.JSONField()
+
+    class Meta:
+        ordering = ["-generated_at", "-id"]
 
     def __str__(self) -> str:
-        return f"{self.get_type_display()} R$ {self.amount} em {self.date}"
\ No newline at end of file
+        return f"Relatório de {self.generated_at:%Y-%m-%d %H:%M}"
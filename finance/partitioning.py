@@ -0,0 +1,372 @@
+'''finance/partitioning.py'''
+"""
+Particionamento declarativo (Postgres) da tabela de transações por `date`.
+
+O model continua o mesmo: o Django enxerga `finance_transaction` como uma tabela
+comum. No Postgres ela pode virar uma tabela particionada por RANGE (date), com
+partições anuais (`finance_transaction_y2025`) ou mensais
+(`finance_transaction_m2025_03`) e uma partição DEFAULT pra datas sem partição.
+
+Como o Postgres exige que a PK de uma tabela particionada contenha a chave de
+partição, a PK física vira (id, date); `id` continua vindo de uma sequence e é
+único na prática. Por isso nenhuma outra tabela deve ter FK pra Transaction.
+
+Em SQLite (e qualquer banco que não seja Postgres) nada disso se aplica e a
+tabela fica no layout normal.
+"""
+import re
+from datetime import date
+
+from django.conf import settings
+from django.db import NotSupportedError, connections, transaction
+
+from .models import Transaction
+
+TABLE = Transaction._meta.db_table
+LEGACY_TABLE = f"{TABLE}_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+INTERVALS = ("year", "month")
+
+_NAME_RE = re.compile(rf"^{TABLE}_(?:y(?P<year>\d{{4}})|m(?P<myear>\d{{4}})_(?P<month>\d{{2}}))$")
+
+
+def partition_interval() -> str:
+    return getattr(settings, "FINANCE_PARTITION_INTERVAL", "year")
+
+
+def period_start(d: date, interval: str) -> date:
+    if interval == "year":
+        return date(d.year, 1, 1)
+    return date(d.year, d.month, 1)
+
+
+def next_period(start: date, interval: str) -> date:
+    if interval == "year":
+        return date(start.year + 1, 1, 1)
+    if start.month == 12:
+        return date(start.year + 1, 1, 1)
+    return date(start.year, start.month + 1, 1)
+
+
+def shift_period(start: date, interval: str, n: int) -> date:
+    ''' Anda n períodos pra frente (ou pra trás, se n < 0) '''
+    if interval == "year":
+        return date(start.year + n, 1, 1)
+    months = start.year * 12 + (start.month - 1) + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(start: date, interval: str) -> str:
+    if interval == "year":
+        return f"{TABLE}_y{start.year:04d}"
+    return f"{TABLE}_m{start.year:04d}_{start.month:02d}"
+
+
+def partition_bounds(name: str) -> tuple[date, date] | None:
+    '''
+    Devolve [início, fim) de uma partição a partir do nome
+    (None pra DEFAULT ou nomes fora do padrão).
+    '''
+    match = _NAME_RE.match(name)
+    if not match:
+        return None
+    if match["year"]:
+        start = date(int(match["year"]), 1, 1)
+        return start, next_period(start, "year")
+    start = date(int(match["myear"]), int(match["month"]), 1)
+    return start, next_period(start, "month")
+
+
+def periods_between(first: date, last: date, interval: str) -> list[date]:
+    ''' Inícios de período cobrindo [first, last] '''
+    current = period_start(first, interval)
+    periods = []
+    while current <= last:
+        periods.append(current)
+        current = next_period(current, interval)
+    return periods
+
+
+def detect_interval(using: str = "default") -> str | None:
+    ''' Intervalo usado pelas partições que já existem (None se não houver nenhuma) '''
+    for name in list_partitions(using):
+        match = _NAME_RE.match(name)
+        if match:
+            return "year" if match["year"] else "month"
+    return None
+
+
+def _require_postgres(using: str):
+    if connections[using].vendor != "postgresql":
+        raise NotSupportedError("Particionamento de transações só é suportado em Postgres.")
+
+
+def is_partitioned(using: str = "default") -> bool:
+    _require_postgres(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+            [TABLE],
+        )
+        row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions(using: str = "default") -> list[str]:
+    _require_postgres(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE pg_inherits.inhparent = to_regclass(%s)
+             ORDER BY child.relname
+            """,
+            [TABLE],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def estimated_rows(using: str = "default") -> int | None:
+    '''
+    Linhas da tabela pelas estatísticas do Postgres (pg_class.reltuples), somando
+    as partições se ela for particionada. None fora do Postgres ou se ainda não
+    teve ANALYZE (reltuples = -1).
+    '''
+    if connections[using].vendor != "postgresql":
+        return None
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT SUM(reltuples), MIN(reltuples)
+              FROM pg_class
+             WHERE (oid = to_regclass(%s) AND relkind = 'r')
+                OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))
+            """,
+            [TABLE, TABLE],
+        )
+        total, lowest = cursor.fetchone()
+    if total is None or lowest < 0:
+        return None
+    return int(total)
+
+
+def _quote(using: str, name: str) -> str:
+    return connections[using].ops.quote_name(name)
+
+
+def ensure_default_partition(using: str = "default") -> bool:
+    if DEFAULT_PARTITION in list_partitions(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {_quote(using, DEFAULT_PARTITION)} PARTITION OF {_quote(using, TABLE)} DEFAULT")
+    return True
+
+
+def create_partition(start: date, interval: str, using: str = "default") -> bool:
+    '''
+    Cria a partição do período que começa em `start`. Se a DEFAULT já tiver linhas
+    desse período (alguém lançou uma data sem partição), elas são movidas pra nova
+    partição. Devolve False se a partição já existia.
+    '''
+    name = partition_name(start, interval)
+    existing = list_partitions(using)
+    if name in existing:
+        return False
+
+    end = next_period(start, interval)
+    table, part = _quote(using, TABLE), _quote(using, name)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        moved = False
+        if DEFAULT_PARTITION in existing:
+            default = _quote(using, DEFAULT_PARTITION)
+            cursor.execute(f"SELECT 1 FROM {default} WHERE date >= %s AND date < %s LIMIT 1", [start, end])
+            moved = cursor.fetchone() is not None
+            if moved:
+                # com linhas do período na DEFAULT o Postgres recusa criar a partição:
+                # tira a DEFAULT, cria a partição, move as linhas e devolve a DEFAULT
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+
+        cursor.execute(f"CREATE TABLE {part} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", [start, end])
+
+        if moved:
+            cursor.execute(f"INSERT INTO {part} SELECT * FROM {default} WHERE date >= %s AND date < %s", [start, end])
+            cursor.execute(f"DELETE FROM {default} WHERE date >= %s AND date < %s", [start, end])
+            cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+    return True
+
+
+def detach_partition(name: str, drop: bool = False, using: str = "default"):
+    ''' Desanexa (e opcionalmente apaga) uma partição '''
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {_quote(using, TABLE)} DETACH PARTITION {_quote(using, name)}")
+        if drop:
+            cursor.execute(f"DROP TABLE {_quote(using, name)}")
+
+
+def maintain(ahead: int, retain: int | None = None, drop: bool = False,
+             interval: str | None = None, today: date | None = None, using: str = "default") -> dict:
+    '''
+    Cria as partições do período atual até `ahead` períodos à frente e, se `retain`
+    for passado, desanexa (ou apaga, com drop=True) as partições que terminam antes
+    de `retain` períodos atrás.
+    '''
+    if not is_partitioned(using):
+        raise NotSupportedError(f"{TABLE} não está particionada; rode o convert antes.")
+    interval = interval or detect_interval(using) or partition_interval()
+
+    current = period_start(today or date.today(), interval)
+    created = [
+        partition_name(start, interval)
+        for start in (shift_period(current, interval, n) for n in range(ahead + 1))
+        if create_partition(start, interval, using)
+    ]
+    if ensure_default_partition(using):
+        created.append(DEFAULT_PARTITION)
+
+    removed = []
+    if retain is not None:
+        cutoff = shift_period(current, interval, -retain)
+        for name in list_partitions(using):
+            bounds = partition_bounds(name)
+            if bounds and bounds[1] <= cutoff:
+                detach_partition(name, drop=drop, using=using)
+                removed.append(name)
+    return {"created": created, "removed": removed}
+
+
+def convert_table(interval: str | None = None, batch_size: int = 50_000, drop_legacy: bool = False,
+                  ahead: int = 1, using: str = "default", log=None) -> dict:
+    '''
+    Migra a tabela comum pra tabela particionada, numa transação só:
+
+      1. renomeia a tabela atual pra `finance_transaction_legacy` (e seus índices);
+      2. cria a tabela particionada com as mesmas colunas, PK (id, date), os mesmos
+         índices e FKs, uma partição por período que tem dados (+ `ahead` à frente)
+         e a DEFAULT;
+      3. copia as linhas em lotes de `batch_size` por id;
+      4. passa a sequence do id pra nova tabela.
+
+    A tabela antiga fica como `_legacy` (sem FKs) pra conferência, a não ser com drop_legacy.
+    Escritas na tabela ficam bloqueadas enquanto a conversão roda.
+    '''
+    interval = interval or partition_interval()
+    if interval not in INTERVALS:
+        raise ValueError(f"Intervalo inválido: {interval!r}")
+    if is_partitioned(using):
+        raise NotSupportedError(f"{TABLE} já está particionada.")
+    log = log or (lambda msg: None)
+    q = lambda name: _quote(using, name)  # noqa: E731
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # checa agora as FKs deferidas pendentes; com eventos pendentes o ALTER TABLE falha
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {q(TABLE)} IN ACCESS EXCLUSIVE MODE")
+
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'", [TABLE])
+        pkey = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+            [TABLE],
+        )
+        indexes = [(name, ddl) for name, ddl in cursor.fetchall() if name != pkey]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+            [TABLE],
+        )
+        identity = cursor.fetchone()[0]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        old_sequence = cursor.fetchone()[0]
+        next_id = 1
+        if old_sequence:
+            # continua de onde a sequence antiga parou (ids apagados não voltam)
+            cursor.execute(f"SELECT last_value + 1 FROM {old_sequence}")
+            next_id = cursor.fetchone()[0]
+        cursor.execute(f"SELECT MIN(date), MAX(date) FROM {q(TABLE)}")
+        first, last = cursor.fetchone()
+
+        # 1. tira a tabela atual do caminho, liberando os nomes de índices/PK
+        cursor.execute(f"ALTER TABLE {q(TABLE)} RENAME TO {q(LEGACY_TABLE)}")
+        cursor.execute(f"ALTER TABLE {q(LEGACY_TABLE)} RENAME CONSTRAINT {q(pkey)} TO {q(f'{LEGACY_TABLE}_pkey')}")
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {q(name)} RENAME TO {q(('legacy_' + name)[:63])}")
+        # a _legacy fica só pra conferência: sem as FKs, senão apagar uma categoria
+        # (SET NULL/"Outros" só mexem na tabela nova) esbarra nas linhas antigas
+        for name, _ in foreign_keys:
+            cursor.execute(f"ALTER TABLE {q(LEGACY_TABLE)} DROP CONSTRAINT {q(name)}")
+
+        # 2. tabela particionada com as mesmas colunas
+        cursor.execute(
+            f"CREATE TABLE {q(TABLE)} (LIKE {q(LEGACY_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (date)"
+        )
+        cursor.execute(f"ALTER TABLE {q(TABLE)} ADD CONSTRAINT {q(pkey)} PRIMARY KEY (id, date)")
+
+        today = date.today()
+        periods = set(periods_between(first, last, interval)) if first else set()
+        current = period_start(today, interval)
+        periods.update(shift_period(current, interval, n) for n in range(ahead + 1))
+        for start in sorted(periods):
+            cursor.execute(
+                f"CREATE TABLE {q(partition_name(start, interval))} PARTITION OF {q(TABLE)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [start, next_period(start, interval)],
+            )
+        cursor.execute(f"CREATE TABLE {q(DEFAULT_PARTITION)} PARTITION OF {q(TABLE)} DEFAULT")
+        log(f"{len(periods)} partições ({interval}) + DEFAULT criadas")
+
+        # os DDLs guardados ainda apontam pra finance_transaction, que agora é a nova tabela
+        for _, ddl in indexes:
+            cursor.execute(ddl)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {q(TABLE)} ADD CONSTRAINT {q(name)} {definition}")
+
+        # 3. cópia em lotes por id
+        cursor.execute(
+            "SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) FROM pg_attribute "
+            "WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped",
+            [LEGACY_TABLE],
+        )
+        columns = cursor.fetchone()[0]
+        copied, last_id = 0, 0
+        while True:
+            cursor.execute(
+                f"""
+                WITH batch AS (
+                    SELECT {columns} FROM {q(LEGACY_TABLE)} WHERE id > %s ORDER BY id LIMIT %s
+                ), ins AS (
+                    INSERT INTO {q(TABLE)} ({columns}) SELECT {columns} FROM batch
+                )
+                SELECT COUNT(*), MAX(id) FROM batch
+                """,
+                [last_id, batch_size],
+            )
+            count, max_id = cursor.fetchone()
+            if not count:
+                break
+            copied += count
+            last_id = max_id
+            log(f"{copied} linhas copiadas")
+
+        # 4. a sequence do id passa pra nova tabela
+        if identity:
+            cursor.execute(f"ALTER TABLE {q(LEGACY_TABLE)} ALTER COLUMN id DROP IDENTITY")
+        elif old_sequence:
+            cursor.execute(f"ALTER TABLE {q(LEGACY_TABLE)} ALTER COLUMN id DROP DEFAULT")
+            cursor.execute(f"DROP SEQUENCE {old_sequence}")
+        sequence = f"{TABLE}_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {q(sequence)} OWNED BY {q(TABLE)}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [sequence, max(next_id, last_id + 1)])
+        cursor.execute(f"ALTER TABLE {q(TABLE)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)", [sequence])
+
+        if drop_legacy:
+            cursor.execute(f"DROP TABLE {q(LEGACY_TABLE)}")
+
+    return {"rows": copied, "partitions": len(periods) + 1, "interval": interval}
@@ -0,0 +1,381 @@
+'''finance/platform_report.py'''
+"""
+Relatório da plataforma inteira pra operação (`manage.py platform_report`,
+GET /api/platform/report/ pra staff): volume de entradas/saídas e usuários
+ativos por mês, popularidade das categorias entre usuários e percentis de
+gasto (por transação e por usuário/mês).
+
+Uma consulta agrupada na tabela toda não termina, então o trabalho é dividido
+em faixas de user_id (PARTITIONS_PER_WORKER por worker, em cada shard) e as
+faixas rodam num pool de processos. Cada processo tem a sua conexão e lê a
+faixa num cursor do lado do servidor (named cursor no Postgres), em blocos de
+FETCH_SIZE linhas ordenadas por usuário, agregando em NumPy. Como um usuário
+nunca fica em duas faixas, contagens de usuários distintos somam direto; os
+percentis saem de QuantileSketch (histograma logarítmico, estilo DDSketch),
+que junta somando os contadores.
+
+O resultado fica em PlatformReport com a hora em que foi gerado; o endpoint
+só lê o último. Meses arquivados entram no volume (pelos snapshots), não nos
+usuários ativos nem nos percentis.
+"""
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import connections, router
+from django.db.models import BooleanField, ExpressionWrapper, F, IntegerField, Max, Min, Q, Sum
+from django.db.models.functions import Cast, Coalesce, ExtractMonth, ExtractYear
+from rest_framework.utils.encoders import JSONEncoder
+
+from .analytics import _month_label, cents, money
+from .models import ArchivedMonthTotal, Category, PlatformReport, Transaction
+from .sharding import DIRECTORY_DB, shard_aliases
+
+PARTITIONS_PER_WORKER = 4
+FETCH_SIZE = 50_000
+# ids por `pk__in` ao buscar nomes de categorias
+IN_BATCH = 1000
+SKETCH_ACCURACY = 0.01
+QUANTILES = (0.5, 0.75, 0.9, 0.95, 0.99)
+TOP_CATEGORIES = 50
+# chave (usuário, mês) num int64: mês desde 1970 deslocado pra caber em 16 bits
+_MONTH_BITS = 16
+_MONTH_OFFSET = 1 << (_MONTH_BITS - 1)
+
+
+class QuantileSketch:
+    '''
+    Quantis aproximados com erro relativo de `accuracy`: cada valor positivo
+    cai no balde ceil(log_gamma(x)). Dois sketches juntam somando os baldes,
+    então as faixas podem ser processadas em qualquer ordem.
+    '''
+
+    def __init__(self, accuracy: float = SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.bins: dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+        if len(positive):
+            index, counts = np.unique(np.ceil(np.log(positive) / math.log(self.gamma)), return_counts=True)
+            for i, n in zip(index.astype(np.int64).tolist(), counts.tolist()):
+                self.bins[i] = self.bins.get(i, 0) + n
+
+    def merge(self, other: "QuantileSketch"):
+        self.zeros += other.zeros
+        self.count += other.count
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                # meio do balde (gamma^(i-1), gamma^i] com o mesmo erro relativo dos dois lados
+                return 2 * self.gamma ** i / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+
+class Partial:
+    ''' Agregados de uma ou mais faixas; `merge` junta duas '''
+
+    def __init__(self):
+        # mês -> [entradas, saídas, transações, usuários ativos] (centavos / contagens)
+        self.months: dict[int, list[int]] = defaultdict(lambda: [0, 0, 0, 0])
+        # nome da categoria -> [usuários, transações, saídas em centavos]
+        self.categories: dict[str, list[int]] = defaultdict(lambda: [0, 0, 0])
+        self.amounts = QuantileSketch()
+        self.user_months = QuantileSketch()
+        self.rows = 0
+
+    def __getstate__(self):
+        # defaultdict com lambda não vai pro pickle do pool
+        state = self.__dict__.copy()
+        state["months"], state["categories"] = dict(self.months), dict(self.categories)
+        return state
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.months.update(state.pop("months"))
+        self.categories.update(state.pop("categories"))
+        self.__dict__.update(state)
+
+    def merge(self, other: "Partial"):
+        for month, values in other.months.items():
+            self.months[month] = [a + b for a, b in zip(self.months[month], values)]
+        for name, values in other.categories.items():
+            self.categories[name] = [a + b for a, b in zip(self.categories[name], values)]
+        self.amounts.merge(other.amounts)
+        self.user_months.merge(other.user_months)
+        self.rows += other.rows
+
+
+def _sums(index: np.ndarray, size: int, values: np.ndarray) -> np.ndarray:
+    out = np.zeros(size, dtype=np.int64)
+    np.add.at(out, index, values)
+    return out
+
+
+class _OpenUser:
+    '''
+    Usuário que pode continuar no próximo bloco: guarda só os somatórios dele
+    por mês e por categoria, não as linhas (um usuário com histórico enorme
+    ocupa o mesmo que um pequeno).
+    '''
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.months: dict[int, int] = defaultdict(int)  # mês -> saídas
+        self.pairs: dict[int, list[int]] = defaultdict(lambda: [0, 0])  # categoria -> [transações, saídas]
+
+    def fold(self, months: np.ndarray, spent: np.ndarray, pair_rows: np.ndarray):
+        for month, value in zip(months.tolist(), spent.tolist()):
+            self.months[month] += value
+        for category, _, n, value in pair_rows.tolist():
+            self.pairs[category][0] += n
+            self.pairs[category][1] += value
+
+    def finish(self, partial: Partial, pairs: list):
+        for month in self.months:
+            partial.months[month][3] += 1
+        partial.user_months.add(np.array([v for v in self.months.values() if v > 0]))
+        pairs.append(np.array(
+            [[category, self.user_id, n, value] for category, (n, value) in self.pairs.items()], dtype=np.int64,
+        ).reshape(-1, 4))
+
+
+def _aggregate_block(partial: Partial, block: np.ndarray, pairs: list, pending: _OpenUser | None) -> _OpenUser:
+    '''
+    Um bloco de linhas ordenadas por usuário: colunas user, mês, saída (0/1),
+    centavos, categoria. Totais por mês e valores das saídas somam direto; o que
+    conta usuários (ativos, gasto por usuário/mês, usuários por categoria) só
+    fecha quando o usuário acaba. O primeiro usuário do bloco pode ser o
+    `pending` do bloco anterior e o último fica aberto pro próximo (devolvido).
+    '''
+    users, months, expense, amounts, categories = block.T
+    spent = amounts * expense
+    partial.rows += len(block)
+
+    month_ids, inverse = np.unique(months, return_inverse=True)
+    income_sum = _sums(inverse, len(month_ids), amounts - spent)
+    expense_sum = _sums(inverse, len(month_ids), spent)
+    counts = np.bincount(inverse, minlength=len(month_ids))
+    for i, month in enumerate(month_ids.tolist()):
+        row = partial.months[month]
+        row[0] += int(income_sum[i])
+        row[1] += int(expense_sum[i])
+        row[2] += int(counts[i])
+    partial.amounts.add(amounts[expense == 1])
+
+    keys, inverse = np.unique((users << _MONTH_BITS) + months + _MONTH_OFFSET, return_inverse=True)
+    key_spent = _sums(inverse, len(keys), spent)
+    key_users = keys >> _MONTH_BITS
+    key_months = (keys & ((1 << _MONTH_BITS) - 1)) - _MONTH_OFFSET
+    # (categoria, usuário, transações, saídas) por par; os nomes vêm no fim da faixa
+    pair_ids, inverse = np.unique(np.stack([categories, users], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    pair_rows = np.column_stack([
+        pair_ids, np.bincount(inverse, minlength=len(pair_ids)), _sums(inverse, len(pair_ids), spent),
+    ])
+
+    last = int(users[-1])
+    if pending is not None and pending.user_id != last:
+        # o usuário que vinha do bloco anterior acabou aqui
+        pending.fold(key_months[key_users == pending.user_id], key_spent[key_users == pending.user_id],
+                     pair_rows[pair_rows[:, 1] == pending.user_id])
+        pending.finish(partial, pairs)
+        closed = pending.user_id
+        pending = None
+    else:
+        closed = last
+    pending = pending or _OpenUser(last)
+    pending.fold(key_months[key_users == last], key_spent[key_users == last], pair_rows[pair_rows[:, 1] == last])
+
+    done = (key_users != last) & (key_users != closed)
+    active_months, active = np.unique(key_months[done], return_counts=True)
+    for month, n in zip(active_months.tolist(), active.tolist()):
+        partial.months[month][3] += n
+    done_spent = key_spent[done]
+    partial.user_months.add(done_spent[done_spent > 0])
+    pairs.append(pair_rows[(pair_rows[:, 1] != last) & (pair_rows[:, 1] != closed)])
+    return pending
+
+
+def _category_totals(partial: Partial, pairs: list, using: str):
+    ''' Junta os pares por nome (o "Mercado" de cada usuário é uma categoria diferente) '''
+    if not pairs:
+        return
+    pairs = np.concatenate(pairs)
+    ids = np.unique(pairs[:, 0])
+    names = {}
+    for i in range(0, len(ids), IN_BATCH):
+        chunk = ids[i:i + IN_BATCH].tolist()
+        names.update(Category.objects.using(using).filter(pk__in=chunk).values_list("id", "name"))
+    labels = np.array([names.get(i, "") for i in pairs[:, 0].tolist()], dtype=object)
+    label_ids, label_index = np.unique(labels, return_inverse=True)
+    users = np.unique(np.stack([label_index, pairs[:, 1]], axis=1), axis=0)[:, 0]
+    user_counts = np.bincount(users, minlength=len(label_ids))
+    transactions = _sums(label_index, len(label_ids), pairs[:, 2])
+    spent = _sums(label_index, len(label_ids), pairs[:, 3])
+    for i, name in enumerate(label_ids.tolist()):
+        row = partial.categories[name or "(sem categoria)"]
+        row[0] += int(user_counts[i])
+        row[1] += int(transactions[i])
+        row[2] += int(spent[i])
+
+
+def run_partition(using: str, first_user: int, last_user: int) -> Partial:
+    ''' Agrega os usuários first_user <= id < last_user do banco `using` '''
+    partial = Partial()
+    rows = (
+        Transaction.objects.using(using)
+        .filter(user_id__gte=first_user, user_id__lt=last_user)
+        .order_by("user_id")
+        .values_list(
+            "user_id",
+            Cast(ExtractYear("date") * 12 + ExtractMonth("date") - (1970 * 12 + 1), IntegerField()),
+            Cast(ExpressionWrapper(Q(type=Transaction.Type.EXPENSE), output_field=BooleanField()), IntegerField()),
+            cents(F("amount")),
+            Coalesce("category_id", 0),
+        )
+    )
+    sql, params = rows.query.sql_with_params()
+    pairs, pending = [], None
+    # cursor do lado do servidor: a faixa nunca vem inteira pra memória, nem as
+    # linhas de um usuário só (o que continua no próximo bloco vira somatório)
+    with connections[using].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while chunk := cursor.fetchmany(FETCH_SIZE):
+            pending = _aggregate_block(partial, np.array(chunk, dtype=np.int64), pairs, pending)
+    if pending is not None:
+        pending.finish(partial, pairs)
+    _category_totals(partial, pairs, using)
+
+    archived = (
+        ArchivedMonthTotal.objects.using(using)
+        .filter(user_id__gte=first_user, user_id__lt=last_user)
+        .values_list("month", "type")
+        .annotate(total=cents(Sum("total")), count=Sum("count"))
+        .order_by()
+    )
+    for month, tx_type, total, count in archived:
+        row = partial.months[(month.year - 1970) * 12 + month.month - 1]
+        row[0 if tx_type == Transaction.Type.INCOME else 1] += total
+        row[2] += count
+    return partial
+
+
+def partitions(workers: int) -> list[tuple[str, int, int]]:
+    ''' Faixas (banco, primeiro id, fim exclusivo) cobrindo os usuários com transações '''
+    pieces = max(1, workers * PARTITIONS_PER_WORKER)
+    result = []
+    for using in shard_aliases() or [router.db_for_read(Transaction)]:
+        bounds = Transaction.objects.using(using).filter(user__isnull=False).aggregate(
+            first=Min("user_id"), last=Max("user_id")
+        )
+        if bounds["first"] is None:
+            continue
+        step = -(-(bounds["last"] - bounds["first"] + 1) // pieces)
+        result += [
+            (using, start, min(start + step, bounds["last"] + 1))
+            for start in range(bounds["first"], bounds["last"] + 1, step)
+        ]
+    return result
+
+
+def _init_worker():
+    # com spawn/forkserver o processo novo começa sem o Django carregado
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _context():
+    # fork herda as settings já resolvidas (inclusive o banco de teste)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("fork" if "fork" in methods else methods[0])
+
+
+def collect(workers: int | None = None, log=None) -> Partial:
+    ''' Roda as faixas (no pool se workers > 1) e junta os agregados '''
+    workers = workers or os.cpu_count() or 1
+    log = log or (lambda msg: None)
+    parts = partitions(workers)
+    total = Partial()
+    if workers == 1 or len(parts) <= 1:
+        for n, part in enumerate(parts, start=1):
+            total.merge(run_partition(*part))
+            log(f"faixa {n}/{len(parts)}")
+        return total
+    # os filhos abrem as próprias conexões; nenhuma herdada do pai
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_context(), initializer=_init_worker) as pool:
+        for n, partial in enumerate(pool.map(run_partition, *zip(*parts)), start=1):
+            total.merge(partial)
+            log(f"faixa {n}/{len(parts)}")
+    return total
+
+
+def _percentiles(sketch: QuantileSketch) -> dict:
+    return {
+        f"p{round(q * 100)}": None if (value := sketch.quantile(q)) is None else money(round(value))
+        for q in QUANTILES
+    }
+
+
+def build_report(total: Partial) -> dict:
+    categories = sorted(total.categories.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+    return {
+        "rows": total.rows,
+        "months": [
+            {
+                "month": _month_label(month), "income": money(income), "expense": money(expense),
+                "transactions": count, "active_users": users,
+            }
+            for month, (income, expense, count, users) in sorted(total.months.items())
+        ],
+        "categories": [
+            {"name": name, "users": users, "transactions": count, "expense": money(spent)}
+            for name, (users, count, spent) in categories[:TOP_CATEGORIES]
+        ],
+        "spending": {
+            "accuracy": SKETCH_ACCURACY,
+            "per_transaction": _percentiles(total.amounts),
+            "per_user_month": _percentiles(total.user_months),
+        },
+    }
+
+
+def generate(workers: int | None = None, log=None) -> PlatformReport:
+    ''' Gera e guarda um relatório novo (o endpoint serve o último) '''
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    total = collect(workers, log)
+    data = build_report(total)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    # Decimal vira número, como no resto da API
+    return PlatformReport.objects.using(DIRECTORY_DB).create(
+        workers=workers, elapsed_ms=elapsed_ms, data=json.loads(json.dumps(data, cls=JSONEncoder)),
+    )
+
+
+def latest() -> PlatformReport | None:
+    return PlatformReport.objects.using(DIRECTORY_DB).order_by("-generated_at", "-id").first()
@@ -0,0 +1,104 @@
+'''finance/purge.py'''
+"""
+Exclusão de conta em segundo plano, no lugar do `user.delete()` que monta o
+cascade inteiro na memória (collector + signals por linha) e segura os locks
+de todas as tabelas numa transação só.
+
+- `request_purge` só desativa o usuário (CookieJWTAuthentication e o refresh
+  recusam inativos na hora), pausa as recorrências e registra o pedido
+  (AccountPurge, no banco do diretório);
+- `run_purge` (via `manage.py purge_accounts`, no cron ou num worker) apaga
+  os dados do finance em lotes de BATCH_SIZE linhas, filhos antes dos pais.
+  Cada lote é uma transação curta: pega os ids pelo índice de usuário e faz o
+  DELETE direto (`_raw_delete`), sem collector nem signals;
+- o progresso fica no AccountPurge depois de cada lote. Se o processo cair no
+  meio, rodar de novo continua de onde parou (o que já saiu não volta);
+- no fim sobra o usuário e o pouco que é dele no default (diretório, tokens),
+  apagados com o delete normal.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import AccountPurge, RecurringTransaction
+from .sharding import DIRECTORY_DB, db_for_user, user_models
+
+BATCH_SIZE = 5000
+
+
+def request_purge(user) -> AccountPurge:
+    ''' Desativa o usuário e agenda a exclusão (pode chamar de novo: devolve o pedido que já existe) '''
+    User = get_user_model()
+    with transaction.atomic(using=router.db_for_write(User)):
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        purge, _ = AccountPurge.objects.using(DIRECTORY_DB).get_or_create(
+            user_id=user.pk, defaults={"username": user.get_username()}
+        )
+    user.is_active = False
+    # o scheduler de recorrentes não cria mais nada enquanto os dados saem
+    using = db_for_user(user.pk)
+    RecurringTransaction.objects.using(using).filter(user_id=user.pk, active=True).update(active=False)
+    return purge
+
+
+def _delete_batch(model, user_id: int, using: str, batch_size: int) -> int:
+    ''' Um lote numa transação curta; 0 quando o model já está limpo '''
+    qs = model.objects.using(using).filter(user_id=user_id)
+    with transaction.atomic(using=using):
+        ids = list(qs.order_by().values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return 0
+        return qs.filter(pk__in=ids)._raw_delete(using)
+
+
+def run_purge(purge: AccountPurge, batch_size: int = BATCH_SIZE, log=None) -> AccountPurge:
+    ''' Apaga tudo do usuário do pedido, lote a lote; retomável '''
+    log = log or (lambda msg: None)
+    if purge.finished_at:
+        return purge
+    if purge.started_at is None:
+        purge.started_at = timezone.now()
+        purge.save(update_fields=["started_at"])
+    using = db_for_user(purge.user_id)
+
+    # filhos antes dos pais: categorias por último
+    for model in reversed(user_models()):
+        label = model._meta.label
+        while True:
+            started = time.perf_counter()
+            deleted = _delete_batch(model, purge.user_id, using, batch_size)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if not deleted:
+                break
+            purge.deleted[label] = purge.deleted.get(label, 0) + deleted
+            purge.batches += 1
+            purge.max_batch_ms = max(purge.max_batch_ms, elapsed_ms)
+            purge.save(update_fields=["deleted", "batches", "max_batch_ms"])
+            log(f"{purge.username}: {label} {purge.deleted[label]} linhas ({elapsed_ms:.0f} ms)")
+
+    get_user_model().objects.filter(pk=purge.user_id).delete()
+    purge.finished_at = timezone.now()
+    purge.error = ""
+    purge.save(update_fields=["finished_at", "error"])
+    log(f"{purge.username}: concluída em {purge.batches} lotes")
+    return purge
+
+
+def run_pending(batch_size: int = BATCH_SIZE, log=None) -> dict[str, int]:
+    ''' Processa os pedidos em aberto; um que falha fica com o erro e volta na próxima passada '''
+    totals = {"finished": 0, "failed": 0}
+    pending = AccountPurge.objects.using(DIRECTORY_DB).filter(finished_at__isnull=True).order_by("requested_at", "id")
+    for purge in pending:
+        try:
+            run_purge(purge, batch_size, log)
+        except Exception as exc:
+            purge.error = f"{type(exc).__name__}: {exc}"
+            purge.save(update_fields=["error"])
+            totals["failed"] += 1
+            if log:
+                log(f"{purge.username}: erro ({purge.error})")
+        else:
+            totals["finished"] += 1
+    return totals
@@ -0,0 +1,195 @@
+'''finance/recurring.py'''
+"""
+Lançamentos recorrentes (RecurringTransaction) e o scheduler que cria as
+transações vencidas (`manage.py run_recurring`, no cron).
+
+A regra é a de um RRULE simples: a ocorrência n é start_date + n * interval
+dias/semanas/meses/anos (mensal/anual no dia de start_date, limitado ao último
+dia do mês), até end_date e/ou `count` ocorrências. Cada recorrência guarda a
+próxima data (`next_run`) e a posição dela na regra (`position`).
+
+O scheduler anda em lotes de CHUNK_SIZE recorrências vencidas, de todos os
+usuários, pelo índice parcial em (next_run, id):
+
+- SELECT ... FOR UPDATE SKIP LOCKED: vários schedulers rodam juntos sem pegar a
+  mesma recorrência (e sem esperar um pelo outro);
+- as transações entram num bulk_create e as recorrências avançam num UPDATE
+  em lote, na mesma transação do banco: ou o lote todo vale ou nada;
+- período perdido (scheduler parado, recorrência criada com start_date no
+  passado) é criado também, até MAX_CATCH_UP por recorrência a cada passada;
+- como no batch.py, cada transação criada ganha o seu número da sequência do
+  delta-sync (next_seqs, uma ida ao banco pro lote) e o seu evento no stream;
+  os contadores de gasto dos orçamentos (finance/budgets.py) mudam juntos.
+"""
+from calendar import monthrange
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from .budgets import add_spending, record_spending, spending_row
+from .events import publish_on_commit
+from .models import Category, RecurringTransaction, Tombstone, Transaction
+from .sharding import shard_aliases, use_shard
+from .sync import next_seqs
+
+CHUNK_SIZE = 1000
+BATCH_SIZE = 1000
+# ocorrências por recorrência numa passada (uma diária parada há anos termina nas próximas)
+MAX_CATCH_UP = 400
+
+Frequency = RecurringTransaction.Frequency
+
+
+def occurrence(start: date, frequency: str, interval: int, n: int) -> date | None:
+    ''' n-ésima data da regra (0 = start), ou None se passar do fim do calendário '''
+    try:
+        if frequency == Frequency.DAILY:
+            return start + timedelta(days=n * interval)
+        if frequency == Frequency.WEEKLY:
+            return start + timedelta(weeks=n * interval)
+        months = n * interval * (12 if frequency == Frequency.YEARLY else 1)
+        year, month = divmod(start.year * 12 + start.month - 1 + months, 12)
+        return date(year, month + 1, min(start.day, monthrange(year, month + 1)[1]))
+    except (OverflowError, ValueError):
+        return None
+
+
+def first_position(start: date, frequency: str, interval: int, target: date) -> int:
+    ''' Menor n com occurrence(n) >= target '''
+    if target <= start:
+        return 0
+    if frequency in (Frequency.DAILY, Frequency.WEEKLY):
+        step = interval * (7 if frequency == Frequency.WEEKLY else 1)
+        return -(-(target - start).days // step)
+    step = interval * (12 if frequency == Frequency.YEARLY else 1)
+    n = max(0, ((target.year - start.year) * 12 + target.month - start.month) // step)
+    while (day := occurrence(start, frequency, interval, n)) is not None and day < target:
+        n += 1
+    return n
+
+
+def set_position(recurring: RecurringTransaction, n: int):
+    ''' Aponta next_run pra ocorrência n (None se a regra acabou) '''
+    day = occurrence(recurring.start_date, recurring.frequency, recurring.interval, n)
+    finished = (
+        day is None
+        or (recurring.count is not None and n >= recurring.count)
+        or (recurring.end_date is not None and day > recurring.end_date)
+    )
+    recurring.position = n
+    recurring.next_run = None if finished else day
+
+
+def reschedule(recurring: RecurringTransaction, not_before: date | None = None):
+    '''
+    Recalcula a próxima ocorrência depois de mudar a regra: a primeira depois da
+    última criada (e não antes de `not_before`, ao reativar uma pausada).
+    '''
+    target = recurring.start_date
+    if recurring.last_run:
+        target = max(target, recurring.last_run + timedelta(days=1))
+    if not_before:
+        target = max(target, not_before)
+    set_position(recurring, first_position(recurring.start_date, recurring.frequency, recurring.interval, target))
+
+
+def _fallback_categories(user_ids: set, using: str) -> dict:
+    ''' "Outros" do usuário, ou o global, pra quem está sem categoria '''
+    if not user_ids:
+        return {}
+    found = dict(
+        Category.objects.using(using)
+        .filter(Q(user_id__in=user_ids) | Q(user__isnull=True), name="Outros")
+        .values_list("user_id", "id")
+    )
+    default = found.get(None)
+    return {user_id: found.get(user_id, default) for user_id in user_ids}
+
+
+def _save_progress(due: list[RecurringTransaction], using: str):
+    ''' Grava next_run/position/last_run do lote '''
+    fields = ["next_run", "position", "last_run"]
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        RecurringTransaction.objects.using(using).bulk_update(due, fields, batch_size=BATCH_SIZE)
+        return
+    # UPDATE ... FROM (VALUES) direto: o bulk_update monta um CASE por linha e gasta mais CPU que o banco
+    q = connection.ops.quote_name
+    columns = ", ".join(f"{q(name)} = v.{q(name)}" for name in fields)
+    with connection.cursor() as cursor:
+        for i in range(0, len(due), BATCH_SIZE):
+            part = due[i:i + BATCH_SIZE]
+            cursor.execute(
+                f"UPDATE {q(RecurringTransaction._meta.db_table)} AS r SET {columns} "
+                f"FROM (VALUES {', '.join(['(%s, %s::date, %s, %s::date)'] * len(part))}) "
+                f"AS v(id, {', '.join(q(name) for name in fields)}) WHERE r.id = v.id",
+                [value for r in part for value in (r.pk, r.next_run, r.position, r.last_run)],
+            )
+
+
+def materialize_due(today: date, using: str, chunk_size: int = CHUNK_SIZE) -> tuple[int, int]:
+    ''' Um lote: (recorrências processadas, transações criadas); (0, 0) quando não tem mais nada livre '''
+    with transaction.atomic(using=using):
+        due = list(
+            RecurringTransaction.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(active=True, next_run__lte=today)
+            .order_by("next_run", "id")[:chunk_size]
+        )
+        if not due:
+            return 0, 0
+
+        occurrences = []
+        for recurring in due:
+            for _ in range(MAX_CATCH_UP):
+                if recurring.next_run is None or recurring.next_run > today:
+                    break
+                occurrences.append((recurring, recurring.next_run))
+                recurring.last_run = recurring.next_run
+                set_position(recurring, recurring.position + 1)
+
+        fallback = _fallback_categories({r.user_id for r in due if r.category_id is None}, using)
+        per_user = Counter(recurring.user_id for recurring, _ in occurrences)
+        last = next_seqs(per_user, using)
+        seq = {user_id: last[user_id] - n for user_id, n in per_user.items()}
+        created = []
+        for recurring, day in occurrences:
+            seq[recurring.user_id] += 1
+            created.append(Transaction(
+                user_id=recurring.user_id, type=recurring.type, amount=recurring.amount, date=day,
+                description=recurring.description,
+                category_id=recurring.category_id or fallback.get(recurring.user_id),
+                sync_seq=seq[recurring.user_id],
+            ))
+        Transaction.objects.using(using).bulk_create(created, batch_size=BATCH_SIZE)
+        _save_progress(due, using)
+        spending = {}
+        for tx in created:
+            add_spending(spending, *spending_row(tx))
+        record_spending(spending, using)
+        for tx in created:
+            publish_on_commit(
+                tx.user_id, Tombstone.Kind.TRANSACTION, tx.sync_seq,
+                {"id": tx.pk, "deleted": False, "months": [f"{tx.date:%Y-%m}"]}, using,
+            )
+    return len(due), len(created)
+
+
+def run_due(today: date | None = None, chunk_size: int = CHUNK_SIZE, log=None) -> dict[str, int]:
+    ''' Cria tudo que venceu até `today` (padrão: hoje) em todos os bancos '''
+    today = today or date.today()
+    log = log or (lambda msg: None)
+    totals = {"recurring": 0, "created": 0}
+    for alias in shard_aliases() or [None]:
+        with use_shard(alias):
+            using = router.db_for_write(RecurringTransaction)
+            while True:
+                processed, created = materialize_due(today, using, chunk_size)
+                if not processed:
+                    break
+                totals["recurring"] += processed
+                totals["created"] += created
+                log(f"{using}: {processed} recorrências, {created} transações")
+    return totals
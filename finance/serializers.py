@@ -1,6 +1,14 @@
 '''finance/serializers.py'''
+from datetime import date
+
+from django.db import models, transaction
+from django.db.models import Q
 from rest_framework import serializers
-from .models import Category, Transaction
+
+from .budgets import ZERO, month_start, percent_of, spent_in, usage
+from .categorize import check_regex, default_category, matcher_for
+from .models import Budget, BudgetEvent, Category, CategoryRule, RecurringTransaction, Transaction
+from .recurring import reschedule
 
 class CategorySerializer(serializers.ModelSerializer):
     ''' Category Serializer '''
@@ -16,8 +24,30 @@ class CategorySerializer(serializers.ModelSerializer):
     
     
 
+class TransactionListSerializer(serializers.ListSerializer):
+    ''' Com context["budgets"], busca o uso dos orçamentos da página inteira de uma vez '''
+
+    def to_representation(self, data):
+        if not self.context.get("budgets"):
+            return super().to_representation(data)
+        rows = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.context["budget_usage"] = _budget_usage(rows)
+        return super().to_representation(rows)
+
+
+def _budget_usage(rows) -> dict:
+    ''' Uso dos orçamentos nos meses/categorias das saídas em `rows` (todas do mesmo usuário) '''
+    spending = [tx for tx in rows if tx.type == Transaction.Type.EXPENSE and tx.category_id]
+    if not spending:
+        return {}
+    return usage(spending[0].user_id, {(tx.category_id, tx.date) for tx in spending})
+
+
 class TransactionSerializer(serializers.ModelSerializer):
-    ''' Transaction Serializer '''
+    '''
+    Transaction Serializer. Com context["budgets"] cada saída leva também o uso
+    do orçamento da categoria no mês (`budget`), lido dos contadores.
+    '''
     category_name = serializers.CharField(source="category.name", read_only=True)
 
     class Meta:
@@ -33,6 +63,22 @@ class TransactionSerializer(serializers.ModelSerializer):
             "created_at",
         ]
         read_only_fields = ["id", "created_at", "category_name"]
+        list_serializer_class = TransactionListSerializer
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get("budgets"):
+            found = self.context.get("budget_usage")
+            if found is None:  # uma transação só (retrieve/create/update)
+                found = _budget_usage([instance])
+            current = found.get((instance.category_id, month_start(instance.date)))
+            data["budget"] = current and {
+                "id": current["budget"],
+                "limit": f"{current['limit']:.2f}",
+                "spent": f"{current['spent']:.2f}",
+                "percent": current["percent"],
+            }
+        return data
 
     def validate_amount(self, value):
         ''' Valida se o valor é maior que zero '''
@@ -40,26 +86,303 @@ class TransactionSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("O valor deve ser maior que zero.")
         return value
 
+    def _request_user(self):
+        request = self.context.get("request")
+        user = getattr(request, "user", None)
+        return user if user is not None and user.is_authenticated else None
+
     def _get_default_category(self):
-        # Garante fallback "Outros"
-        cat, _ = Category.objects.get_or_create(name="Outros")
-        return cat
+        # Garante fallback "Outros" (o do usuário; cada um ganha o seu no cadastro, além do global)
+        return default_category(self._request_user())
+
+    def _categorize(self, attrs):
+        ''' Categoria pelas regras do usuário (finance/categorize.py), ou None '''
+        user = self._request_user()
+        matcher = matcher_for(user.pk) if user else None
+        if matcher is None:
+            return None
+        description = attrs.get("description", getattr(self.instance, "description", ""))
+        amount = attrs.get("amount", getattr(self.instance, "amount", None))
+        category_id = matcher.match(description, amount)
+        return Category.objects.filter(pk=category_id).first() if category_id else None
 
     def validate(self, attrs):
         """
-        Se category vier null (ou não vier), define "Outros".
+        Se category vier null (ou não vier), aplica as regras do usuário e, se
+        nenhuma casar, define "Outros".
         IMPORTANTE: em PATCH, attrs pode não ter 'category', então só aplica fallback
         quando:
           - é create (self.instance is None), ou
           - o cliente explicitamente enviou category=null
         """
         if self.instance is None:
-            # CREATE: se não mandou category, ou mandou null => "Outros"
+            # CREATE: se não mandou category, ou mandou null => regras / "Outros"
             if attrs.get("category", None) is None:
-                attrs["category"] = self._get_default_category()
+                attrs["category"] = self._categorize(attrs) or self._get_default_category()
         else:
-            # UPDATE/PATCH: só troca pra "Outros" se o cliente mandou explicitamente category=null
+            # UPDATE/PATCH: só troca se o cliente mandou explicitamente category=null
             if "category" in attrs and attrs["category"] is None:
-                attrs["category"] = self._get_default_category()
+                attrs["category"] = self._categorize(attrs) or self._get_default_category()
+
+        return attrs
+
+
+class CategoryRuleSerializer(serializers.ModelSerializer):
+    ''' Regra de categorização automática '''
+    category_name = serializers.CharField(source="category.name", read_only=True)
+
+    class Meta:
+        model = CategoryRule
+        fields = [
+            "id",
+            "kind",
+            "pattern",
+            "min_amount",
+            "max_amount",
+            "category",
+            "category_name",
+            "priority",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "category_name", "created_at", "updated_at"]
+
+    def validate_category(self, value):
+        request = self.context.get("request")
+        if value.user_id is not None and value.user_id != request.user.pk:
+            raise serializers.ValidationError("Categoria inválida.")
+        return value
+
+    def validate(self, attrs):
+        kind = attrs.get("kind", getattr(self.instance, "kind", None))
+        pattern = attrs.get("pattern", getattr(self.instance, "pattern", ""))
+        low = attrs.get("min_amount", getattr(self.instance, "min_amount", None))
+        high = attrs.get("max_amount", getattr(self.instance, "max_amount", None))
+
+        if kind == CategoryRule.Kind.AMOUNT:
+            if low is None and high is None:
+                raise serializers.ValidationError("Informe min_amount e/ou max_amount.")
+            pattern = ""
+        elif not pattern.strip():
+            raise serializers.ValidationError({"pattern": "Informe o texto da regra."})
+        elif kind == CategoryRule.Kind.REGEX:
+            # espaço nas pontas faz parte da regex
+            try:
+                check_regex(pattern)
+            except ValueError as exc:
+                raise serializers.ValidationError({"pattern": str(exc)})
+        else:
+            pattern = pattern.strip()
+        if low is not None and high is not None and low > high:
+            raise serializers.ValidationError("min_amount não pode ser maior que max_amount.")
+
+        attrs["pattern"] = pattern
+        return attrs
+
+
+class RecurringTransactionSerializer(serializers.ModelSerializer):
+    ''' Lançamento recorrente (ver finance/recurring.py) '''
+    category_name = serializers.CharField(source="category.name", read_only=True)
+
+    # mudar qualquer um destes recalcula a próxima ocorrência
+    SCHEDULE_FIELDS = ("frequency", "interval", "start_date", "end_date", "count")
+
+    class Meta:
+        model = RecurringTransaction
+        fields = [
+            "id",
+            "type",
+            "amount",
+            "description",
+            "category",
+            "category_name",
+            "frequency",
+            "interval",
+            "start_date",
+            "end_date",
+            "count",
+            "active",
+            "next_run",
+            "last_run",
+            "created_at",
+        ]
+        read_only_fields = ["id", "category_name", "next_run", "last_run", "created_at"]
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("O valor deve ser maior que zero.")
+        return value
+
+    def validate_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("O intervalo deve ser pelo menos 1.")
+        return value
+
+    def validate_category(self, value):
+        request = self.context.get("request")
+        if value is not None and value.user_id is not None and value.user_id != request.user.pk:
+            raise serializers.ValidationError("Categoria inválida.")
+        return value
+
+    def validate(self, attrs):
+        start = attrs.get("start_date", getattr(self.instance, "start_date", None))
+        end = attrs.get("end_date", getattr(self.instance, "end_date", None))
+        if start and end and end < start:
+            raise serializers.ValidationError({"end_date": "end_date não pode ser antes de start_date."})
+        return attrs
+
+    def create(self, validated_data):
+        # start_date no passado: o scheduler cria as ocorrências que já venceram
+        instance = RecurringTransaction(**validated_data)
+        reschedule(instance)
+        instance.save()
+        return instance
+
+    def update(self, instance, validated_data):
+        using = instance._state.db
+        with transaction.atomic(using=using):
+            # parte do estado atual, travado: o scheduler pode ter acabado de avançar esta recorrência
+            current = RecurringTransaction.objects.using(using).select_for_update().get(pk=instance.pk)
+            instance.next_run, instance.position, instance.last_run = current.next_run, current.position, current.last_run
+            changed = any(
+                name in validated_data and validated_data[name] != getattr(instance, name)
+                for name in self.SCHEDULE_FIELDS
+            )
+            resumed = validated_data.get("active") and not instance.active
+            for name, value in validated_data.items():
+                setattr(instance, name, value)
+            if changed or resumed:
+                # o que venceu enquanto estava pausada não é criado
+                reschedule(instance, not_before=date.today() if resumed else None)
+            instance.save()
+        return instance
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    ''' Uma operação do POST /api/transactions/batch/ (ver finance/batch.py) '''
+    op = serializers.ChoiceField(choices=["create", "update", "delete"])
+    key = serializers.CharField(max_length=64, required=False)
+    id = serializers.IntegerField(min_value=1, required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs["op"] != "create" and "id" not in attrs:
+            raise serializers.ValidationError({"id": "Obrigatório em update/delete."})
+        if attrs["op"] != "delete" and not attrs.get("data"):
+            raise serializers.ValidationError({"data": "Informe os campos da transação."})
+        return attrs
+
+
+class BatchTransactionListSerializer(serializers.ListSerializer):
+    ''' Resolve numa consulta só todas as categorias citadas no lote '''
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            # só ints/strings de dígitos: lista/dict na categoria vira o 400 do item, não um TypeError aqui
+            ids = {
+                int(pk) for pk in (item.get("category") for item in data if isinstance(item, dict))
+                if (isinstance(pk, int) and not isinstance(pk, bool)) or (isinstance(pk, str) and pk.isdigit())
+            }
+            user = self.context["request"].user
+            self.context["categories"] = (
+                Category.objects.filter(Q(user=user) | Q(user__isnull=True)).in_bulk(ids)
+            )
+        return super().to_internal_value(data)
+
+
+class BatchTransactionSerializer(TransactionSerializer):
+    '''
+    Campos de uma transação do lote. A categoria vem do dicionário montado pelo
+    BatchTransactionListSerializer; regras/"Outros" são aplicados no lote todo.
+    '''
+    category = serializers.IntegerField(allow_null=True, required=False)
+
+    class Meta(TransactionSerializer.Meta):
+        list_serializer_class = BatchTransactionListSerializer
+
+    def validate_category(self, value):
+        if value is None:
+            return None
+        category = self.context["categories"].get(value)
+        if category is None:
+            raise serializers.ValidationError("Categoria inválida.")
+        return category
 
-        return attrs
\ No newline at end of file
+    def validate(self, attrs):
+        return attrs
+
+
+class MonthField(serializers.Field):
+    ''' Mês como "YYYY-MM" (aceita também uma data); guardado como o dia 1 '''
+    default_error_messages = {"invalid": "Use o formato YYYY-MM."}
+
+    def to_representation(self, value):
+        return f"{value:%Y-%m}"
+
+    def to_internal_value(self, data):
+        try:
+            return month_start(date.fromisoformat(data if len(str(data)) > 7 else f"{data}-01"))
+        except (TypeError, ValueError):
+            self.fail("invalid")
+
+
+class BudgetSerializer(serializers.ModelSerializer):
+    '''
+    Orçamento (month vazio = todo mês). Na saída vai o uso no mês consultado
+    (context["month"], ou o do orçamento, ou o atual), lido do SpendingCounter;
+    context["spent"] ({categoria: gasto}) evita uma consulta por orçamento na lista.
+    '''
+    category_name = serializers.CharField(source="category.name", read_only=True)
+    month = MonthField(allow_null=True, required=False)
+
+    class Meta:
+        model = Budget
+        fields = ["id", "category", "category_name", "month", "limit", "created_at"]
+        read_only_fields = ["id", "category_name", "created_at"]
+
+    def validate_category(self, value):
+        request = self.context.get("request")
+        if value.user_id is not None and value.user_id != request.user.pk:
+            raise serializers.ValidationError("Categoria inválida.")
+        return value
+
+    def validate_limit(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("O limite deve ser maior que zero.")
+        return value
+
+    def validate(self, attrs):
+        category = attrs.get("category", getattr(self.instance, "category", None))
+        month = attrs.get("month", getattr(self.instance, "month", None))
+        taken = Budget.objects.filter(user=self.context["request"].user, category=category, month=month)
+        if self.instance is not None:
+            taken = taken.exclude(pk=self.instance.pk)
+        if taken.exists():
+            raise serializers.ValidationError("Já existe um orçamento pra essa categoria nesse mês.")
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        month = self.context.get("month") or instance.month or month_start(date.today())
+        spent = self.context.get("spent")
+        if spent is None:
+            spent = spent_in(instance.user_id, [instance.category_id], month)
+        value = spent.get(instance.category_id, ZERO)
+        data.update({
+            "period": f"{month:%Y-%m}",
+            "spent": f"{value:.2f}",
+            "remaining": f"{instance.limit - value:.2f}",
+            "percent": percent_of(value, instance.limit),
+        })
+        return data
+
+
+class BudgetEventSerializer(serializers.ModelSerializer):
+    ''' Limiar (50/80/100%) cruzado por um orçamento num mês '''
+    category = serializers.IntegerField(source="budget.category_id", read_only=True)
+    month = MonthField(read_only=True)
+
+    class Meta:
+        model = BudgetEvent
+        fields = ["id", "budget", "category", "month", "threshold", "spent", "limit", "created_at"]
+        read_only_fields = fields
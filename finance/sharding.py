@@ -0,0 +1,361 @@
+'''finance/sharding.py'''
+"""
+Sharding por usuário dos dados do app `finance`.
+
+Cada usuário mora em um shard (alias de DATABASES listado em FINANCE_SHARDS).
+O mapeamento fica numa tabela-diretório (UserShard) no banco `default`, junto
+com auth/sessões: no primeiro acesso o usuário recebe o shard de `stable_shard`
+(crc32 do id) e a partir daí só muda com `manage.py finance_shards move`.
+
+Roteamento (ShardRouter, primeiro de DATABASE_ROUTERS):
+- instância já carregada fica no banco de onde veio (`_state.db`);
+- dentro de `use_shard(alias)` (os views entram nele pelo UserShardMixin) tudo
+  do finance vai pro shard do bloco;
+- instância nova fora de bloco vai pro shard do `user_id` dela;
+- sem nada disso, o router devolve None e vale o default / réplicas.
+
+Categorias globais (user=None) existem em todos os shards, casadas pelo nome:
+a migration cria o "Outros" em cada banco e os signals replicam criação/remoção.
+
+Ids: cada shard gera ids numa faixa própria (`prepare_shard`), então mover um
+usuário de shard mantém os ids das transações e categorias dele.
+
+Sem FINANCE_SHARDS configurado nada disso faz efeito.
+"""
+import zlib
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# banco da tabela-diretório (mesmo dos usuários)
+DIRECTORY_DB = DEFAULT_DB_ALIAS
+# models do finance que ficam no banco do diretório, não nos shards
+DIRECTORY_MODELS = ("usershard", "accountpurge", "platformreport")
+# tamanho da faixa de ids de cada shard (o shard N gera ids a partir de N * ID_SPACE)
+ID_SPACE = 1 << 40
+COPY_BATCH = 1000
+
+# shard em uso no request / bloco atual
+_current_shard: ContextVar[str | None] = ContextVar("finance_shard", default=None)
+
+
+def shard_aliases() -> list[str]:
+    return list(getattr(settings, "FINANCE_SHARDS", []))
+
+
+def sharding_enabled() -> bool:
+    return bool(shard_aliases())
+
+
+def is_sharded(model) -> bool:
+    return model._meta.app_label == "finance" and model._meta.model_name not in DIRECTORY_MODELS
+
+
+def stable_shard(user_id: int) -> str:
+    ''' Shard "natural" do usuário, usado só na primeira atribuição '''
+    aliases = shard_aliases()
+    return aliases[zlib.crc32(str(user_id).encode()) % len(aliases)]
+
+
+def shard_for_user_id(user_id: int | None) -> str | None:
+    '''
+    Shard do usuário segundo o diretório (atribui um se ainda não tiver).
+    None quando o sharding está desligado.
+    '''
+    if not sharding_enabled() or user_id is None:
+        return None
+    from .models import UserShard
+
+    alias = (
+        UserShard.objects.using(DIRECTORY_DB)
+        .filter(user_id=user_id).values_list("alias", flat=True).first()
+    )
+    if alias is None:
+        entry, _ = UserShard.objects.using(DIRECTORY_DB).get_or_create(
+            user_id=user_id, defaults={"alias": stable_shard(user_id)}
+        )
+        alias = entry.alias
+    return alias
+
+
+def current_shard() -> str | None:
+    return _current_shard.get()
+
+
+def db_for_user(user_or_id) -> str:
+    ''' Alias pra usar em `transaction.atomic(using=...)` / `.using()` com dados do usuário '''
+    user_id = getattr(user_or_id, "pk", user_or_id)
+    return shard_for_user_id(user_id) or DEFAULT_DB_ALIAS
+
+
+class use_shard:
+    '''
+    Manda as queries do finance pro shard `alias` dentro do bloco.
+    Aceita None (sharding desligado): aí não faz nada.
+
+        with use_shard(shard_for_user_id(user.pk)):
+            ...
+    '''
+
+    def __init__(self, alias: str | None):
+        self.alias = alias
+
+    def __enter__(self):
+        self._token = _current_shard.set(self.alias) if self.alias else None
+        return self
+
+    def __exit__(self, *exc):
+        if self._token is not None:
+            _current_shard.reset(self._token)
+
+
+class ShardRouter:
+    '''
+    Router de DATABASE_ROUTERS pros models do finance (ver docstring do módulo).
+    '''
+
+    def _route(self, model, hints):
+        if not sharding_enabled() or model._meta.app_label != "finance":
+            return None
+        if not is_sharded(model):
+            return DIRECTORY_DB
+        instance = hints.get("instance")
+        if instance is not None and not is_sharded(type(instance)):
+            # related manager de um usuário (user.categories...): vale o bloco atual
+            instance = None
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        alias = _current_shard.get()
+        if alias:
+            return alias
+        if instance is not None and getattr(instance, "user_id", None) is not None:
+            return shard_for_user_id(instance.user_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # usuário (default) <-> dados do finance (shard): as FKs pra user não têm
+        # constraint no banco, então a relação é permitida
+        if sharding_enabled() and (is_sharded(type(obj1)) or is_sharded(type(obj2))):
+            return True
+        return None
+
+
+class UserShardMixin:
+    '''
+    Mixin de view do DRF: depois da autenticação roda o resto do request dentro
+    do shard do usuário logado.
+    '''
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if user and user.is_authenticated:
+            self._shard_token = _current_shard.set(shard_for_user_id(user.pk))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_shard_token", None)
+        if token is not None:
+            _current_shard.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# --- manutenção (manage.py finance_shards) ---------------------------------
+
+def user_models():
+    ''' Models do finance com dados de usuário, em ordem de inserção (categorias primeiro) '''
+    from django.apps import apps
+
+    from .models import Category
+
+    models = [
+        m for m in apps.get_app_config("finance").get_models()
+        if is_sharded(m) and any(f.name == "user" for f in m._meta.concrete_fields)
+    ]
+    return sorted(models, key=lambda m: m is not Category)
+
+
+def _sequence_value(alias: str, table: str) -> int:
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f"SELECT last_value FROM {sequence}")
+        else:
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _set_sequence(alias: str, table: str, value: int):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, value])
+        else:
+            cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [value, table])
+            if cursor.rowcount == 0:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, value])
+
+
+def prepare_shard(alias: str) -> list[str]:
+    '''
+    Coloca as sequências de id das tabelas do finance no shard na faixa dele
+    (posição em FINANCE_SHARDS * ID_SPACE). Idempotente. Devolve as tabelas ajustadas.
+    '''
+    aliases = shard_aliases()
+    if alias not in aliases:
+        raise ValueError(f"{alias} não está em FINANCE_SHARDS.")
+    floor = aliases.index(alias) * ID_SPACE
+    changed = []
+    if not floor:
+        return changed
+    from django.apps import apps
+    from django.db import models
+
+    for model in apps.get_app_config("finance").get_models():
+        # só tabelas com id autoincremento (SyncCounter usa o user como pk)
+        if not is_sharded(model) or not isinstance(model._meta.pk, models.AutoField):
+            continue
+        table = model._meta.db_table
+        if _sequence_value(alias, table) < floor:
+            _set_sequence(alias, table, floor)
+            changed.append(table)
+    return changed
+
+
+def sync_global_categories(source: str = DEFAULT_DB_ALIAS) -> dict[str, int]:
+    ''' Cria em cada shard as categorias globais do `source` que faltam (por nome) '''
+    from .models import Category
+
+    names = set(Category.objects.using(source).filter(user__isnull=True).values_list("name", flat=True))
+    created = {}
+    for alias in shard_aliases():
+        if alias == source:
+            continue
+        existing = set(Category.objects.using(alias).filter(user__isnull=True).values_list("name", flat=True))
+        missing = sorted(names - existing)
+        Category.objects.using(alias).bulk_create([Category(user=None, name=n) for n in missing])
+        created[alias] = len(missing)
+    return created
+
+
+def _global_category_map(source: str, target: str) -> dict[int, int]:
+    ''' id da categoria global no source -> id da global de mesmo nome no target '''
+    from .models import Category
+
+    mapping = {}
+    for category in Category.objects.using(source).filter(user__isnull=True):
+        match, _ = Category.objects.using(target).get_or_create(user=None, name=category.name)
+        mapping[category.pk] = match.pk
+    return mapping
+
+
+def _remap_categories(obj, mapping: dict[int, int]):
+    from .archive import decode_rows, encode_rows
+    from .models import Category, TransactionArchive
+
+    for field in obj._meta.concrete_fields:
+        if field.is_relation and field.related_model is Category:
+            value = getattr(obj, field.attname)
+            if value in mapping:
+                setattr(obj, field.attname, mapping[value])
+    if isinstance(obj, TransactionArchive):
+        rows = decode_rows(obj.payload)
+        for r in rows:
+            r["category_id"] = mapping.get(r["category_id"], r["category_id"])
+        obj.payload = encode_rows(rows)
+
+
+def _raw_delete_user(alias: str, user_id: int):
+    # filhos antes dos pais; DELETE direto, sem collector nem signals
+    for model in reversed(user_models()):
+        qs = model.objects.using(alias).filter(user_id=user_id)
+        qs._raw_delete(alias)
+
+
+def move_user(user_id: int, target: str, log=None) -> dict[str, int]:
+    '''
+    Move todos os dados do usuário pro shard `target`, mantendo os ids.
+    Trava o SyncCounter do usuário na origem (toda escrita passa por next_seq,
+    então as escritas dele esperam o fim), copia, confere, atualiza o diretório
+    e só então apaga na origem.
+
+    Os commits saem na ordem destino, diretório, origem: se algo falhar no meio,
+    ou o diretório ainda aponta pra origem intacta (e uma nova tentativa refaz a
+    cópia), ou já aponta pro destino completo (e sobra só lixo na origem).
+    '''
+    from .models import SyncCounter, UserShard
+    from .sync import bump_epoch
+
+    log = log or (lambda msg: None)
+    if target not in shard_aliases():
+        raise ValueError(f"{target} não está em FINANCE_SHARDS.")
+    source = shard_for_user_id(user_id)
+    if source == target:
+        return {}
+
+    copied = {}
+    with transaction.atomic(using=source), transaction.atomic(using=DIRECTORY_DB), transaction.atomic(using=target):
+        SyncCounter.objects.using(source).get_or_create(user_id=user_id)
+        list(SyncCounter.objects.using(source).select_for_update().filter(user_id=user_id))
+        # restos de uma tentativa anterior que parou no meio
+        _raw_delete_user(target, user_id)
+        mapping = _global_category_map(source, target)
+
+        for model in user_models():
+            qs = model.objects.using(source).filter(user_id=user_id).order_by("pk")
+            ids = list(qs.values_list("pk", flat=True))
+            for i in range(0, len(ids), COPY_BATCH):
+                chunk = ids[i:i + COPY_BATCH]
+                if model.objects.using(target).filter(pk__in=chunk).exists():
+                    raise ValueError(
+                        f"Ids de {model._meta.label} já usados em {target}: rode `finance_shards prepare` antes."
+                    )
+                objs = list(model.objects.using(source).filter(pk__in=chunk))
+                for obj in objs:
+                    _remap_categories(obj, mapping)
+                model.objects.using(target).bulk_create(objs)
+            if qs.count() != len(ids):
+                raise RuntimeError(f"{model._meta.label} do usuário {user_id} mudou durante a cópia.")
+            copied[model._meta.label] = len(ids)
+            log(f"{model._meta.label}: {len(ids)} linhas copiadas pra {target}")
+
+        # categorias globais têm outros ids no destino: caches do razão recarregam
+        bump_epoch(user_id, using=target)
+        UserShard.objects.using(DIRECTORY_DB).update_or_create(user_id=user_id, defaults={"alias": target})
+        _raw_delete_user(source, user_id)
+    return copied
+
+
+def rebalance_plan(max_moves: int | None = None) -> list[tuple[int, str, str]]:
+    '''
+    Movimentos (user_id, origem, destino) que deixam a quantidade de usuários
+    por shard o mais parecida possível. Tira os usuários mais recentes primeiro.
+    '''
+    from .models import UserShard
+
+    aliases = shard_aliases()
+    members = {alias: [] for alias in aliases}
+    for user_id, alias in UserShard.objects.using(DIRECTORY_DB).order_by("user_id").values_list("user_id", "alias"):
+        if alias in members:
+            members[alias].append(user_id)
+
+    plan = []
+    while max_moves is None or len(plan) < max_moves:
+        fullest = max(aliases, key=lambda a: len(members[a]))
+        emptiest = min(aliases, key=lambda a: len(members[a]))
+        if len(members[fullest]) - len(members[emptiest]) <= 1:
+            break
+        user_id = members[fullest].pop()
+        members[emptiest].append(user_id)
+        plan.append((user_id, fullest, emptiest))
+    return plan
@@ -1,11 +1,108 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import Category
+from .budgets import add_spending, record_spending, spending_row
+from .events import publish_on_commit
+from .models import ArchivedMonthTotal, Category, Tombstone, Transaction
+from .sharding import shard_aliases, shard_for_user_id, use_shard
+from .sync import bump_epoch, next_seq, record_deletion, touch
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_default_categories(sender, instance, created, **kwargs):
     if not created:
         return
-    Category.objects.get_or_create(user=instance, name="Outros")
+    with use_shard(shard_for_user_id(instance.pk)):
+        Category.objects.get_or_create(user=instance, name="Outros")
+
+def _other_databases(alias):
+    return [a for a in dict.fromkeys([DEFAULT_DB_ALIAS, *shard_aliases()]) if a != alias]
+
+@receiver(post_save, sender=Category)
+def replicate_global_category(sender, instance, created, raw=False, **kwargs):
+    ''' Categoria global nova vai pra todos os shards (casada pelo nome) '''
+    if not created or raw or instance.user_id is not None or not shard_aliases():
+        return
+    for alias in _other_databases(instance._state.db):
+        Category.objects.using(alias).get_or_create(user=None, name=instance.name)
+
+@receiver(post_delete, sender=Category)
+def remove_global_category(sender, instance, **kwargs):
+    if instance.user_id is not None or not shard_aliases():
+        return
+    for alias in _other_databases(instance._state.db):
+        Category.objects.using(alias).filter(user=None, name=instance.name).delete()
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_save, sender=Category)
+def bump_sync_seq(sender, instance, raw=False, using=None, **kwargs):
+    ''' Marca a linha como alterada pro delta-sync (ver finance/sync.py) '''
+    if raw or instance.user_id is None:
+        return
+    instance.sync_seq = next_seq(instance.user_id, using=using)
+    if sender is Transaction and instance.pk:
+        # como estava antes: mês antigo no aviso do stream SSE e o que sai do contador de gasto
+        instance._previous = (
+            Transaction.objects.using(using).filter(pk=instance.pk)
+            .values_list("user_id", "category_id", "type", "amount", "date").first()
+        )
+
+def _months(*dates):
+    return sorted({f"{d:%Y-%m}" for d in dates if d})
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Category)
+def publish_change(sender, instance, raw=False, using=None, **kwargs):
+    ''' Avisa os streams SSE do usuário (finance/events.py) '''
+    if raw or instance.user_id is None:
+        return
+    data = {"id": instance.pk, "deleted": False}
+    if sender is Transaction:
+        previous = getattr(instance, "_previous", None)
+        data["months"] = _months(instance.date, previous[4] if previous else None)
+    publish_on_commit(instance.user_id, sender._meta.model_name, instance.sync_seq, data, using)
+
+@receiver(post_save, sender=Transaction)
+def update_spending(sender, instance, raw=False, using=None, **kwargs):
+    ''' Contador de gasto do orçamento (finance/budgets.py), na transação do save '''
+    if raw:
+        return
+    deltas = {}
+    previous = getattr(instance, "_previous", None)
+    if previous:
+        add_spending(deltas, *previous, sign=-1)
+    add_spending(deltas, *spending_row(instance))
+    record_spending(deltas, using)
+
+@receiver(pre_delete, sender=Category)
+def touch_orphaned_transactions(sender, instance, using, **kwargs):
+    # o SET_NULL do delete atualiza as transações sem passar pelo save()
+    affected = Transaction.objects.using(using).filter(category=instance)
+    for user_id in set(affected.order_by().values_list("user_id", flat=True).distinct()) - {None}:
+        touch(affected.filter(user_id=user_id), user_id)
+    # snapshots arquivados também perdem a categoria (SET_NULL), fora da sequência
+    archived = ArchivedMonthTotal.objects.using(using).filter(category=instance)
+    for user_id in set(archived.order_by().values_list("user_id", flat=True).distinct()):
+        bump_epoch(user_id, using=using)
+
+def _deleting_user(origin) -> bool:
+    User = get_user_model()
+    return isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User)
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Category)
+def create_tombstone(sender, instance, using, origin=None, **kwargs):
+    if instance.user_id is None or _deleting_user(origin):
+        return
+    kind = Tombstone.Kind.TRANSACTION if sender is Transaction else Tombstone.Kind.CATEGORY
+    seq = record_deletion(kind, instance.user_id, [instance.pk], using=using)
+    data = {"id": instance.pk, "deleted": True}
+    if sender is Transaction:
+        data["months"] = _months(instance.date)
+        deltas = {}
+        add_spending(deltas, *spending_row(instance), sign=-1)
+        record_spending(deltas, using)
+    publish_on_commit(instance.user_id, kind, seq, data, using)
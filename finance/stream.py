@@ -0,0 +1,170 @@
+'''finance/stream.py'''
+"""
+Stream SSE (GET /api/stream/) com as atualizações de saldo/resumo do usuário.
+
+View assíncrona: roda sem thread presa quando servida pelo ASGI
+(`uvicorn backend.asgi:application`). Autentica com o cookie `access_token`
+e fecha a conexão quando o token expira; o EventSource do navegador reconecta
+sozinho (depois do refresh do cookie) mandando o `Last-Event-ID`.
+
+Eventos:
+- `snapshot`: resumo do mês atual + balance_total (na conexão, quando o replay
+  não cobre o Last-Event-ID ou quando o cliente ficou pra trás);
+- `transaction` / `category`: delta da mudança, com a transação (ou só o id,
+  se removida), os totais dos meses afetados e o balance_total;
+- `budget`: um orçamento passou de 50/80/100% do limite no mês (ver
+  finance/budgets.py), com gasto e limite.
+Entre eventos vai um comentário `: ping` a cada FINANCE_EVENTS_HEARTBEAT segundos.
+"""
+import asyncio
+import time
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from login.auth_cookie import CookieJWTAuthentication
+
+from .events import OVERFLOW, get_broker
+from .models import Category, SyncCounter, Transaction
+from .serializers import CategorySerializer, TransactionSerializer
+from .sharding import shard_for_user_id, use_shard
+from .summary import balance_total, build_summary, month_totals, month_range
+
+RETRY_MS = 3000
+
+
+def heartbeat_seconds() -> float:
+    return getattr(settings, "FINANCE_EVENTS_HEARTBEAT", 15)
+
+
+def format_event(event_id: int | None, kind: str, data: dict) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append("data: " + JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def authenticate(request):
+    ''' (usuário, expiração do token em epoch) pelo cookie access_token, ou (None, None) '''
+    auth = CookieJWTAuthentication()
+    try:
+        result = auth.authenticate(request)
+    except (InvalidToken, TokenError):
+        return None, None
+    if result is None:
+        return None, None
+    user, token = result
+    return user, token["exp"]
+
+
+def _release_connections():
+    # mesmo critério do close_old_connections do fim de request (CONN_MAX_AGE),
+    # sem mexer em conexão dentro de transação
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+
+def _with_db(func):
+    ''' Roda no banco do usuário e devolve a conexão logo depois (stream fica aberto por muito tempo) '''
+    def wrapper(user, *args):
+        try:
+            with use_shard(shard_for_user_id(user.pk)):
+                return func(user, *args)
+        finally:
+            _release_connections()
+    return sync_to_async(wrapper)
+
+
+@_with_db
+def snapshot(user) -> tuple[int, dict]:
+    today = date.today()
+    seq = SyncCounter.objects.filter(user=user).values_list("seq", flat=True).first() or 0
+    return seq, build_summary(user, today.year, today.month)
+
+
+@_with_db
+def build_delta(user, event) -> dict:
+    data = event.data
+    delta = {"deleted": data.get("deleted", False), "balance_total": balance_total(user)}
+    if event.kind == "transaction":
+        tx = None if delta["deleted"] else (
+            Transaction.objects.select_related("category").filter(user=user, pk=data["id"]).first()
+        )
+        delta["transaction"] = TransactionSerializer(tx).data if tx else {"id": data["id"]}
+        delta["months"] = []
+        for month in data.get("months", []):
+            year, m = (int(part) for part in month.split("-"))
+            income, expense, _ = month_totals(user, *month_range(year, m))
+            delta["months"].append(
+                {"month": month, "income": income, "expense": expense, "balance_month": income - expense}
+            )
+    elif event.kind == "budget":
+        delta["budget"] = data
+    else:
+        category = None if delta["deleted"] else Category.objects.filter(user=user, pk=data["id"]).first()
+        delta["category"] = CategorySerializer(category).data if category else {"id": data["id"]}
+    return delta
+
+
+async def event_stream(user, last_event_id: int | None, expires_at: float, broker=None, heartbeat=None):
+    broker = broker or get_broker()
+    heartbeat = heartbeat or heartbeat_seconds()
+    # assina antes do replay/snapshot pra não perder nada no meio
+    subscription = broker.subscribe(user.pk)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        backlog = broker.replay(user.pk, last_event_id) if last_event_id is not None else None
+        seen = last_event_id or 0
+        if backlog is None:
+            seen, summary = await snapshot(user)
+            yield format_event(seen, "snapshot", summary)
+            backlog = []
+        for event in backlog:
+            yield format_event(event.id, event.kind, await build_delta(user, event))
+            seen = max(seen, event.id)
+
+        while True:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                break
+            try:
+                event = await subscription.get(min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is OVERFLOW:
+                seen, summary = await snapshot(user)
+                yield format_event(seen, "snapshot", summary)
+                continue
+            if event.id <= seen:
+                continue
+            yield format_event(event.id, event.kind, await build_delta(user, event))
+            seen = event.id
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def stream(request):
+    if not hasattr(request, "scope"):
+        # no WSGI o Django juntaria o stream inteiro em memória e prenderia o worker
+        return JsonResponse({"detail": "O stream precisa de servidor ASGI."}, status=501)
+    user, expires_at = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "As credenciais de autenticação não foram fornecidas."}, status=401)
+
+    raw_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    last_event_id = int(raw_id) if raw_id and raw_id.isdigit() else None
+    response = StreamingHttpResponse(
+        event_stream(user, last_event_id, expires_at), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx não segura os eventos
+    return response
@@ -0,0 +1,99 @@
+'''finance/summary.py'''
+"""
+Cálculo do resumo (entradas, saídas, saldo e totais por categoria) de um usuário.
+
+Soma as transações da tabela com os snapshots de meses arquivados
+(ArchivedMonthTotal), pra que o saldo não mude quando o histórico antigo
+sai da tabela quente.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import ArchivedMonthTotal, Transaction
+
+ZERO = Decimal("0.00")
+
+
+def month_range(year: int, month: int) -> tuple[date, date]:
+    """
+    [primeiro dia do mês, primeiro dia do mês seguinte)
+    Filtrar por intervalo de `date` (em vez de __year/__month) usa o índice e deixa
+    o Postgres podar as partições da tabela de transações.
+    """
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def _sum(qs, field="amount") -> Decimal:
+    return qs.aggregate(v=Coalesce(Sum(field), ZERO))["v"]
+
+
+def balance_total(user) -> Decimal:
+    ''' Saldo de todo o histórico (tabela + arquivados) '''
+    base_qs = Transaction.objects.filter(user=user)
+    total_income = _sum(base_qs.filter(type=Transaction.Type.INCOME))
+    total_expense = _sum(base_qs.filter(type=Transaction.Type.EXPENSE))
+
+    for row in ArchivedMonthTotal.objects.filter(user=user).values("type").annotate(v=Sum("total")):
+        if row["type"] == Transaction.Type.INCOME:
+            total_income += row["v"]
+        else:
+            total_expense += row["v"]
+    return total_income - total_expense
+
+
+def month_totals(user, start: date, end: date) -> tuple[Decimal, Decimal, list[dict]]:
+    '''
+    Entradas, saídas e totais por categoria/tipo do intervalo [start, end).
+    '''
+    month_qs = Transaction.objects.filter(user=user, date__gte=start, date__lt=end)
+
+    income = _sum(month_qs.filter(type=Transaction.Type.INCOME))
+    expense = _sum(month_qs.filter(type=Transaction.Type.EXPENSE))
+    by_category = list(
+        month_qs.values("category__id", "category__name", "type")
+        .annotate(total=Coalesce(Sum("amount"), ZERO))
+        .order_by("type", "category__name")
+    )
+
+    archived = list(
+        ArchivedMonthTotal.objects.filter(user=user, month__gte=start, month__lt=end)
+        .values("category__id", "category__name", "type")
+        .annotate(total=Sum("total"))
+    )
+    if archived:
+        merged = {(r["category__id"], r["type"]): r for r in by_category}
+        for row in archived:
+            if row["type"] == Transaction.Type.INCOME:
+                income += row["total"]
+            else:
+                expense += row["total"]
+            key = (row["category__id"], row["type"])
+            if key in merged:
+                merged[key]["total"] += row["total"]
+            else:
+                merged[key] = row
+        by_category = sorted(
+            merged.values(),
+            key=lambda r: (r["type"], r["category__name"] is None, r["category__name"] or ""),
+        )
+
+    return income, expense, by_category
+
+
+def build_summary(user, year: int, month: int) -> dict:
+    ''' Payload do SummaryView '''
+    start, end = month_range(year, month)
+    income, expense, by_category = month_totals(user, start, end)
+    return {
+        "month": f"{year:04d}-{month:02d}",
+        "income": income,
+        "expense": expense,
+        "balance_month": income - expense,
+        "balance_total": balance_total(user),
+        "by_category": by_category,
+    }
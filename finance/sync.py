@@ -0,0 +1,214 @@
+'''finance/sync.py'''
+"""
+Delta-sync pros clientes offline/mobile.
+
+Cada usuário tem uma sequência de mudanças (SyncCounter). Toda escrita em
+Transaction/Category grava em `sync_seq` o próximo número dela, e toda remoção
+deixa um Tombstone com o seu número. Como o contador é atualizado na mesma
+transação do banco que a escrita (e a linha do contador fica travada até o
+commit), um valor de contador visível garante que tudo até ele também está;
+por isso cada sync lê o contador primeiro e só entrega linhas até ele.
+
+O token do cliente é a última posição que ele recebeu:
+- "<seq>": recebeu tudo até `seq`;
+- "<seq>.<tipo>.<id>": parou no meio dos itens de `seq` (um UPDATE em lote,
+  como a reatribuição do CategoryViewSet.destroy, usa o mesmo seq pra todas as
+  linhas), com tipo 0=categoria, 1=transação, 2=remoção.
+
+Sem token é o sync completo (inclui as categorias globais). Cliente com token
+mais antigo que os tombstones já apagados recebe `reset: true` e deve refazer o
+sync completo.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import BigIntegerField, Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Category, SyncCounter, Tombstone, Transaction
+from .sharding import shard_aliases, use_shard
+
+KINDS = ("category", "transaction", "deleted")
+# posição "depois de todos os tipos" de um seq
+END = len(KINDS)
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+def next_seq(user_id: int, count: int = 1, using: str | None = None) -> int:
+    '''
+    Reserva `count` números da sequência do usuário e devolve o maior deles.
+    Precisa rodar na mesma transação da escrita que vai usar o número.
+    '''
+    using = using or router.db_for_write(SyncCounter, instance=SyncCounter(user_id=user_id))
+    counters = SyncCounter.objects.using(using).filter(user_id=user_id)
+    with transaction.atomic(using=using):
+        if not counters.update(seq=F("seq") + count):
+            SyncCounter.objects.using(using).get_or_create(user_id=user_id)
+            counters.update(seq=F("seq") + count)
+        return counters.values_list("seq", flat=True).get()
+
+
+def next_seqs(counts: dict[int, int], using: str) -> dict[int, int]:
+    '''
+    next_seq pra vários usuários numa ida ao banco ({user_id: quantos} ->
+    {user_id: maior número reservado}), pros lotes que escrevem de muitos
+    usuários de uma vez (finance/recurring.py). Mesma regra: na transação da escrita.
+    '''
+    if not counts:
+        return {}
+    counters = SyncCounter.objects.using(using).filter(user_id__in=counts)
+    with transaction.atomic(using=using):
+        lock_counters(counts, using)
+        connection = connections[using]
+        if connection.vendor != "postgresql":
+            counters.update(seq=F("seq") + Case(
+                *[When(user_id=user_id, then=Value(n)) for user_id, n in counts.items()],
+                output_field=BigIntegerField(),
+            ))
+            return dict(counters.values_list("user_id", "seq"))
+        # no Postgres um UPDATE ... FROM (VALUES) só; o Case/When do ORM pesa com milhares de usuários
+        table = connection.ops.quote_name(SyncCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} AS c SET seq = c.seq + v.n "
+                f"FROM (VALUES {', '.join(['(%s, %s)'] * len(counts))}) AS v(user_id, n) "
+                "WHERE c.user_id = v.user_id RETURNING c.user_id, c.seq",
+                [value for item in counts.items() for value in item],
+            )
+            return dict(cursor.fetchall())
+
+
+def lock_counters(user_ids, using: str):
+    '''
+    Trava (criando se faltar) os contadores dos usuários até o fim da transação
+    em curso: o mesmo lock que toda escrita pega no next_seq, então quem lê pra
+    depois escrever não vê as linhas desses usuários mudarem no meio.
+    Precisa rodar dentro de um transaction.atomic(using=using).
+    '''
+    SyncCounter.objects.using(using).bulk_create(
+        [SyncCounter(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+    # trava em ordem de user_id: dois lotes com usuários em comum não se travam um ao outro
+    counters = SyncCounter.objects.using(using).filter(user_id__in=user_ids)
+    list(counters.select_for_update().order_by("user_id").values_list("user_id", flat=True))
+
+
+def bump_epoch(user_id: int, using: str | None = None):
+    ''' Avisa os caches do razão que os dados do usuário mudaram fora da sequência '''
+    using = using or router.db_for_write(SyncCounter, instance=SyncCounter(user_id=user_id))
+    counters = SyncCounter.objects.using(using).filter(user_id=user_id)
+    if not counters.update(epoch=F("epoch") + 1):
+        SyncCounter.objects.using(using).get_or_create(user_id=user_id, defaults={"epoch": 1})
+
+
+def touch(queryset, user_id: int, **values) -> int:
+    ''' UPDATE em lote que também marca as linhas como alteradas (um seq pro lote todo) '''
+    seq = next_seq(user_id, using=queryset.db)
+    return queryset.update(sync_seq=seq, **values)
+
+
+def record_deletion(kind: str, user_id: int, object_ids, using: str) -> int:
+    seq = next_seq(user_id, using=using)
+    Tombstone.objects.using(using).bulk_create(
+        [Tombstone(user_id=user_id, kind=kind, object_id=pk, sync_seq=seq) for pk in object_ids]
+    )
+    return seq
+
+
+def parse_token(token: str | None) -> tuple[int, int, int]:
+    ''' Token -> (seq, tipo, id). ValueError se for inválido '''
+    if not token:
+        return -1, END, 0
+    parts = token.split(".")
+    if len(parts) == 1:
+        return int(parts[0]), END, 0
+    if len(parts) == 3 and 0 <= int(parts[1]) < END:
+        return int(parts[0]), int(parts[1]), int(parts[2])
+    raise ValueError(token)
+
+
+def make_token(seq: int, kind: int = END, pk: int = 0) -> str:
+    return str(seq) if kind == END else f"{seq}.{kind}.{pk}"
+
+
+def _after(kind: int, position: tuple[int, int, int]) -> Q:
+    ''' Filtro das linhas do `kind` que vêm depois da posição do token '''
+    seq, last_kind, pk = position
+    if kind > last_kind:
+        return Q(sync_seq__gte=seq)
+    if kind == last_kind:
+        return Q(sync_seq__gt=seq) | Q(sync_seq=seq, id__gt=pk)
+    return Q(sync_seq__gt=seq)
+
+
+def changes_since(user, token: str | None, limit: int = DEFAULT_LIMIT) -> dict:
+    '''
+    Mudanças do usuário depois do `token`, no máximo `limit` itens, em ordem de seq.
+    Devolve objetos (o view serializa): categories, transactions, deleted, next, has_more, reset.
+    '''
+    position = parse_token(token)
+    limit = max(1, min(limit, MAX_LIMIT))
+    seq, pruned = SyncCounter.objects.filter(user=user).values_list("seq", "pruned_seq").first() or (0, 0)
+
+    result = {"categories": [], "transactions": [], "deleted": [], "has_more": False, "reset": False}
+    if token and position[0] < pruned:
+        result.update(reset=True, next=None)
+        return result
+    if token and position[1] == END and position[0] >= seq:
+        # já está em dia: só a consulta do contador
+        result["next"] = token
+        return result
+
+    # só até o `seq` lido: o que passou dele pode ter buracos ainda sem commit
+    # (e as três consultas não veem o mesmo snapshot), fica pro próximo sync
+    sources = (
+        Category.objects.filter(user=user, sync_seq__lte=seq),
+        Transaction.objects.select_related("category").filter(user=user, sync_seq__lte=seq),
+        Tombstone.objects.filter(user=user, sync_seq__lte=seq),
+    )
+    items = []
+    for kind, qs in enumerate(sources):
+        rows = qs.filter(_after(kind, position)).order_by("sync_seq", "id")[:limit + 1]
+        items.extend((row.sync_seq, kind, row.pk, row) for row in rows)
+    items.sort(key=lambda item: item[:3])
+
+    page, result["has_more"] = items[:limit], len(items) > limit
+    for _, kind, _, row in page:
+        result[("categories", "transactions", "deleted")[kind]].append(row)
+
+    if result["has_more"]:
+        last_seq, last_kind, last_pk, _ = page[-1]
+        result["next"] = make_token(last_seq, last_kind, last_pk)
+    else:
+        result["next"] = make_token(max(seq, position[0], 0))
+
+    if not token:
+        result["categories"] = list(Category.objects.filter(user__isnull=True)) + result["categories"]
+    return result
+
+
+def tombstone_retention_days() -> int:
+    return getattr(settings, "FINANCE_SYNC_TOMBSTONE_DAYS", 90)
+
+
+def prune_tombstones(days: int | None = None) -> int:
+    '''
+    Apaga tombstones mais antigos que `days` e marca, por usuário, até onde
+    foi apagado (tokens anteriores a isso recebem reset).
+    '''
+    days = tombstone_retention_days() if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+
+    removed = 0
+    for alias in shard_aliases() or [None]:
+        with use_shard(alias):
+            old = Tombstone.objects.filter(deleted_at__lt=cutoff)
+            for user_id in set(old.order_by().values_list("user_id", flat=True).distinct()):
+                user_old = old.filter(user_id=user_id)
+                with transaction.atomic(using=user_old.db):
+                    last = max(user_old.values_list("sync_seq", flat=True), default=0)
+                    SyncCounter.objects.filter(user_id=user_id, pruned_seq__lt=last).update(pruned_seq=last)
+                    removed += Tombstone.objects.filter(user_id=user_id, sync_seq__lte=last)._raw_delete(user_old.db)
+    return removed
@@ -0,0 +1,57 @@
+'''finance/templatetags/finance_admin.py'''
+"""
+date_hierarchy do admin sem o SELECT DISTINCT date_trunc(...) na tabela toda:
+os anos/meses/dias oferecidos saem do MIN/MAX(date) do changelist, que o
+Postgres resolve nas pontas do índice de data. Pode aparecer um período sem
+lançamento no meio; clicar nele só dá uma lista vazia.
+"""
+from datetime import date, timedelta
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.db.models import Max, Min
+
+register = template.Library()
+
+
+def periods(first: date, last: date, kind: str) -> list[date]:
+    if kind == "day":
+        return [first + timedelta(days=n) for n in range((last - first).days + 1)]
+    if kind == "month":
+        months = range(first.year * 12 + first.month - 1, last.year * 12 + last.month)
+        return [date(m // 12, m % 12 + 1, 1) for m in months]
+    return [date(year, 1, 1) for year in range(first.year, last.year + 1)]
+
+
+class _RangeQuerySet:
+    ''' O pedaço do queryset que o date_hierarchy usa, com um MIN/MAX só por página '''
+
+    def __init__(self, queryset):
+        self._queryset = queryset
+        self._range = {}
+
+    def aggregate(self, first, last):
+        key = (first.source_expressions[0].name, last.source_expressions[0].name)
+        if key not in self._range:
+            self._range[key] = self._queryset.aggregate(first=first, last=last)
+        return self._range[key]
+
+    def dates(self, field_name: str, kind: str) -> list[date]:
+        bounds = self.aggregate(Min(field_name), Max(field_name))
+        if not (bounds["first"] and bounds["last"]):
+            return []
+        return periods(bounds["first"], bounds["last"], kind)
+
+
+class _ChangeList:
+    def __init__(self, cl):
+        self._cl = cl
+        self.queryset = _RangeQuerySet(cl.queryset)
+
+    def __getattr__(self, name):
+        return getattr(self._cl, name)
+
+
+@register.inclusion_tag("admin/date_hierarchy.html")
+def indexed_date_hierarchy(cl):
+    return date_hierarchy(_ChangeList(cl))
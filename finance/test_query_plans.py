@@ -0,0 +1,245 @@
+# finance/test_query_plans.py
+"""
+Guardrails de plano de execução para a tabela finance_transaction.
+
+Regressões de índice só aparecem quando a tabela fica grande, então aqui a gente
+popula o Postgres com bastante linha, captura o SQL que cada endpoint importante
+emite e roda `EXPLAIN (FORMAT JSON)` em cada query que toca a tabela de transações.
+O teste falha (imprimindo o plano) se aparecer Seq Scan na tabela ou um Sort
+explícito sobre muitas linhas dela.
+
+Só roda em Postgres; em outros bancos é pulado.
+"""
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from finance.models import Category, Transaction
+
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        connection.vendor != "postgresql",
+        reason="EXPLAIN (FORMAT JSON) guardrails só rodam em Postgres",
+    ),
+]
+
+TABLE = "finance_transaction"
+
+# massa de dados: SEED_USERS usuários com SEED_ROWS_PER_USER transações cada
+SEED_USERS = 40
+SEED_ROWS_PER_USER = 1000
+
+# um Sort sobre transações acima disso é considerado regressão
+SORT_ROW_THRESHOLD = 500
+
+
+def _is_transaction_relation(name: str | None) -> bool:
+    # inclui as partições (finance_transaction_y2025, finance_transaction_default, ...)
+    return bool(name) and (name == TABLE or name.startswith(TABLE + "_"))
+
+
+def _touches_transactions(node: dict) -> bool:
+    if _is_transaction_relation(node.get("Relation Name")):
+        return True
+    return any(_touches_transactions(child) for child in node.get("Plans", []))
+
+
+def offending_nodes(plan: dict, sort_threshold: int = SORT_ROW_THRESHOLD) -> list[str]:
+    """
+    Percorre um plano (formato JSON do EXPLAIN) e devolve a descrição dos nós
+    problemáticos: Seq Scan na tabela de transações ou Sort sobre ela acima do limite.
+    """
+    found = []
+
+    def walk(node):
+        kind = node.get("Node Type")
+        rows = node.get("Plan Rows", 0)
+        if kind == "Seq Scan" and _is_transaction_relation(node.get("Relation Name")):
+            found.append(f"Seq Scan em {node['Relation Name']} (~{rows} linhas)")
+        if kind in ("Sort", "Incremental Sort") and rows >= sort_threshold and _touches_transactions(node):
+            found.append(f"{kind} sobre {TABLE} (~{rows} linhas, chave {node.get('Sort Key')})")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan)
+    return found
+
+
+def explain(sql: str) -> dict:
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        raw = cursor.fetchone()[0]
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    return data[0]["Plan"]
+
+
+def assert_index_friendly(captured: CaptureQueriesContext, label: str):
+    """
+    Roda EXPLAIN em toda query capturada que toca finance_transaction e falha
+    mostrando o plano de quem fizer Seq Scan / Sort grande.
+    """
+    checked = 0
+    problems = []
+    for query in captured.captured_queries:
+        sql = query["sql"]
+        if TABLE not in sql:
+            continue
+        if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            continue
+        plan = explain(sql)
+        checked += 1
+        bad = offending_nodes(plan)
+        if bad:
+            problems.append(
+                f"{'; '.join(bad)}\nSQL: {sql}\nPlano:\n{json.dumps(plan, indent=2)}"
+            )
+
+    assert checked, f"{label}: nenhuma query em {TABLE} foi capturada"
+    if problems:
+        pytest.fail(f"{label}: plano com regressão de índice\n\n" + "\n\n".join(problems))
+
+
+@pytest.fixture
+def seeded():
+    """
+    Popula a tabela com SEED_USERS * SEED_ROWS_PER_USER linhas espalhadas em ~3 anos
+    e roda ANALYZE pra o planner enxergar o tamanho real.
+    """
+    User = get_user_model()
+    # bulk_create: sem hash de senha nem signals, senão o seed fica lento demais
+    users = User.objects.bulk_create(
+        [User(username=f"plan{i}", email=f"plan{i}@test.com") for i in range(SEED_USERS)]
+    )
+    outros, _ = Category.objects.get_or_create(user=None, name="Outros")
+    Category.objects.bulk_create(
+        [Category(user=u, name=f"Cat {j}") for u in users for j in range(5)]
+    )
+    categories = {u.id: [] for u in users}
+    for cat in Category.objects.filter(user__in=users).order_by("id"):
+        categories[cat.user_id].append(cat)
+
+    start = date(2023, 1, 1)
+    rows = []
+    for u in users:
+        cats = categories[u.id] + [outros]
+        for i in range(SEED_ROWS_PER_USER):
+            rows.append(Transaction(
+                user=u,
+                type=Transaction.Type.INCOME if i % 4 == 0 else Transaction.Type.EXPENSE,
+                amount=Decimal(i % 300 + 1),
+                date=start + timedelta(days=i % 1095),
+                description=f"Lançamento {i}",
+                category=cats[i % len(cats)],
+            ))
+    Transaction.objects.bulk_create(rows, batch_size=5000)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {TABLE}")
+        cursor.execute(f"ANALYZE {Category._meta.db_table}")
+
+    user = users[0]
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return {"client": client, "user": user, "category": categories[user.id][0]}
+
+
+LIST_FILTERS = [
+    {},
+    {"month": "2024-03"},
+    {"type": "OUT"},
+    {"category": "__cat__"},
+    {"month": "2024-03", "type": "IN"},
+    {"month": "2024-03", "category": "__cat__"},
+    {"type": "OUT", "category": "__cat__"},
+    {"month": "2024-03", "type": "OUT", "category": "__cat__"},
+]
+
+
+@pytest.mark.parametrize("params", LIST_FILTERS, ids=lambda p: "-".join(p) or "no-filter")
+def test_transaction_list_plans(seeded, params):
+    params = {k: (str(seeded["category"].id) if v == "__cat__" else v) for k, v in params.items()}
+    with CaptureQueriesContext(connection) as captured:
+        resp = seeded["client"].get(reverse("transaction-list"), params)
+    assert resp.status_code == 200
+    assert_index_friendly(captured, f"TransactionViewSet.list {params}")
+
+
+def test_recent_plan(seeded):
+    with CaptureQueriesContext(connection) as captured:
+        resp = seeded["client"].get(reverse("transaction-recent"), {"limit": 50})
+    assert resp.status_code == 200
+    assert_index_friendly(captured, "TransactionViewSet.recent")
+
+
+def test_summary_plan(seeded):
+    with CaptureQueriesContext(connection) as captured:
+        resp = seeded["client"].get(reverse("summary"), {"month": "2024-03"})
+    assert resp.status_code == 200
+    assert_index_friendly(captured, "SummaryView")
+
+
+def test_category_destroy_reassignment_plan(seeded):
+    with CaptureQueriesContext(connection) as captured:
+        resp = seeded["client"].delete(reverse("category-detail", kwargs={"pk": seeded["category"].id}))
+    assert resp.status_code == 204
+    assert_index_friendly(captured, "CategoryViewSet.destroy")
+
+
+def test_sync_delta_plan(seeded):
+    # delta depois de poucas mudanças: tem que ser range no índice (user, sync_seq, id)
+    from finance.sync import touch
+
+    user = seeded["user"]
+    touch(Transaction.objects.filter(user=user, date=date(2024, 3, 1)), user.id)
+    with CaptureQueriesContext(connection) as captured:
+        resp = seeded["client"].get(reverse("sync"), {"since": "0"})
+    assert resp.status_code == 200 and resp.json()["transactions"]
+    assert_index_friendly(captured, "SyncView")
+
+
+ADMIN_PAGES = [
+    {},
+    {"p": "3"},
+    {"after": "2024-03-01.1"},
+    {"date__year": "2024"},
+    {"date__year": "2024", "date__month": "3"},
+    {"user__id__exact": "__user__"},
+    {"category__id__exact": "__cat__"},
+    {"q": "Lançamento 12"},
+]
+
+
+@pytest.mark.parametrize("params", ADMIN_PAGES, ids=lambda p: "-".join(p) or "no-filter")
+def test_admin_changelist_plans(seeded, admin_client, params):
+    values = {"__user__": str(seeded["user"].id), "__cat__": str(seeded["category"].id)}
+    params = {k: values.get(v, v) for k, v in params.items()}
+    with CaptureQueriesContext(connection) as captured:
+        resp = admin_client.get(reverse("admin:finance_transaction_changelist"), params)
+    assert resp.status_code == 200
+    assert_index_friendly(captured, f"TransactionAdmin changelist {params}")
+
+
+def test_offending_nodes_flags_seq_scan_and_big_sort():
+    plan = {
+        "Node Type": "Sort",
+        "Plan Rows": 5000,
+        "Sort Key": ["date DESC"],
+        "Plans": [{"Node Type": "Seq Scan", "Relation Name": TABLE, "Plan Rows": 5000}],
+    }
+    assert len(offending_nodes(plan)) == 2
+
+    small_sort = {
+        "Node Type": "Sort",
+        "Plan Rows": 12,
+        "Plans": [{"Node Type": "Index Scan", "Relation Name": TABLE, "Plan Rows": 12}],
+    }
+    assert offending_nodes(small_sort) == []
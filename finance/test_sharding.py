@@ -0,0 +1,233 @@
+# finance/test_sharding.py
+"""
+Sharding por usuário (finance/sharding.py).
+
+Precisa de pelo menos dois shards configurados, por exemplo:
+
+    FINANCE_SHARD_DATABASES=/tmp/shard1.sqlite3,/tmp/shard2.sqlite3 pytest finance/test_sharding.py
+
+Sem isso os testes são pulados.
+"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from finance import archive, budgets, platform_report, purge, sharding
+from finance.models import (
+    AccountPurge, ArchivedMonthTotal, BudgetEvent, Category, SpendingCounter, Transaction, TransactionArchive, UserShard,
+)
+
+SHARDS = list(getattr(settings, "FINANCE_SHARDS", []))
+
+pytestmark = [
+    pytest.mark.skipif(len(SHARDS) < 2, reason="precisa de FINANCE_SHARD_DATABASES com 2+ shards"),
+    pytest.mark.django_db(databases=["default", *SHARDS]),
+]
+
+
+def _user(username, alias=None):
+    User = get_user_model()
+    user = User(username=username, email=f"{username}@test.com")
+    user.set_password("12345678")
+    if alias:
+        # fixa o shard antes do signal de criação atribuir um
+        user.save()
+        UserShard.objects.filter(user=user).update(alias=alias)
+        Category.objects.using(alias).get_or_create(user=user, name="Outros")
+        return user
+    user.save()
+    return user
+
+
+def _client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_user_data_lives_only_on_its_shard():
+    user = _user("john")
+    home = sharding.shard_for_user_id(user.pk)
+    other = next(a for a in SHARDS if a != home)
+    assert UserShard.objects.get(user=user).alias == home
+    assert Category.objects.using(home).filter(user=user, name="Outros").exists()
+    assert not Category.objects.using(other).filter(user=user).exists()
+
+    client = _client(user)
+    cat = client.post(reverse("category-list"), {"name": "Mercado"}, format="json").json()
+    res = client.post(reverse("transaction-list"), {
+        "type": "OUT", "amount": "10.00", "date": "2026-01-10", "description": "pão", "category": cat["id"],
+    }, format="json")
+    assert res.status_code == 201, res.content
+
+    assert Transaction.objects.using(home).filter(user=user).count() == 1
+    assert not Transaction.objects.using(other).exists()
+
+    data = client.get(reverse("transaction-list"), {"month": "2026-01"}).json()
+    assert [t["description"] for t in data["results"]] == ["pão"]
+    summary = client.get(reverse("summary"), {"month": "2026-01"}).json()
+    assert Decimal(str(summary["expense"])) == Decimal("10.00")
+
+
+def test_global_categories_are_replicated_and_used_by_destroy():
+    a, b = SHARDS[:2]
+    Category.objects.using(a).create(user=None, name="Mercado global")
+    for alias in SHARDS:
+        assert Category.objects.using(alias).filter(user=None, name="Mercado global").exists()
+        assert Category.objects.using(alias).filter(user=None, name="Outros").exists()
+
+    user = _user("mary", alias=b)
+    client = _client(user)
+    mine = client.post(reverse("category-list"), {"name": "Lazer"}, format="json").json()
+    client.post(reverse("transaction-list"), {
+        "type": "OUT", "amount": "5.00", "date": "2026-02-01", "category": mine["id"],
+    }, format="json")
+
+    assert client.delete(reverse("category-detail", args=[mine["id"]])).status_code == 204
+    tx = Transaction.objects.using(b).get(user=user)
+    assert tx.category.name == "Outros" and tx.category.user_id is None
+    assert tx.category._state.db == b
+
+    Category.objects.using(b).get(user=None, name="Mercado global").delete()
+    assert not Category.objects.using(a).filter(user=None, name="Mercado global").exists()
+
+
+def test_move_user_keeps_ids_and_remaps_global_categories():
+    a, b = SHARDS[:2]
+    for alias in SHARDS:
+        sharding.prepare_shard(alias)
+    user = _user("ana", alias=a)
+    global_cat = Category.objects.using(a).create(user=None, name="Só global")
+    mine = Category.objects.using(a).create(user=user, name="Casa")
+    Transaction.objects.using(a).bulk_create([
+        Transaction(user=user, type="OUT", amount=Decimal("7.00"), date=date(2020, 3, 1), category=global_cat),
+        Transaction(user=user, type="IN", amount=Decimal("100.00"), date=date(2026, 3, 1), category=mine),
+    ])
+    with sharding.use_shard(a):
+        archive.archive_all(date(2021, 1, 1))
+    assert TransactionArchive.objects.using(a).filter(user=user).exists()
+    live_ids = set(Transaction.objects.using(a).filter(user=user).values_list("id", flat=True))
+
+    copied = sharding.move_user(user.pk, b)
+
+    assert copied["finance.Transaction"] == 1
+    assert sharding.shard_for_user_id(user.pk) == b
+    for model in sharding.user_models():
+        assert not model.objects.using(a).filter(user=user).exists()
+    assert set(Transaction.objects.using(b).filter(user=user).values_list("id", flat=True)) == live_ids
+    assert Category.objects.using(b).get(pk=mine.pk).name == "Casa"
+
+    target_global = Category.objects.using(b).get(user=None, name="Só global")
+    snapshot = ArchivedMonthTotal.objects.using(b).get(user=user)
+    assert snapshot.category_id == target_global.pk
+    rows = archive.decode_rows(TransactionArchive.objects.using(b).get(user=user).payload)
+    assert [r["category_id"] for r in rows] == [target_global.pk]
+
+    # o usuário continua enxergando tudo pela API
+    summary = _client(user).get(reverse("summary"), {"month": "2026-03"}).json()
+    assert Decimal(str(summary["balance_total"])) == Decimal("93.00")
+
+    # ids novos no destino não colidem com os que vieram da origem
+    new = Transaction.objects.using(b).create(user=user, type="IN", amount=1, date=date(2026, 3, 2))
+    assert new.pk >= SHARDS.index(b) * sharding.ID_SPACE
+
+
+def test_move_user_locks_the_counter_and_repoints_before_deleting(monkeypatch):
+    a, b = SHARDS[:2]
+    for alias in SHARDS:
+        sharding.prepare_shard(alias)
+    user = _user("rui", alias=a)
+    Transaction.objects.using(a).create(user=user, type="OUT", amount=Decimal("3.00"), date=date(2026, 3, 1))
+
+    seen = []
+    raw_delete = sharding._raw_delete_user
+
+    def spy(alias, user_id):
+        directory = UserShard.objects.get(user_id=user_id).alias
+        seen.append((alias, directory, Transaction.objects.using(b).filter(user_id=user_id).count()))
+        raw_delete(alias, user_id)
+
+    monkeypatch.setattr(sharding, "_raw_delete_user", spy)
+    with CaptureQueriesContext(connections[a]) as queries:
+        sharding.move_user(user.pk, b)
+
+    # a origem só é apagada com a cópia feita e o diretório já no destino
+    assert seen == [(b, a, 0), (a, b, 1)]
+    if connections[a].features.has_select_for_update:
+        assert any("FOR UPDATE" in q["sql"] and "synccounter" in q["sql"] for q in queries.captured_queries)
+    # nova tentativa depois de tudo no destino não apaga nada
+    assert sharding.move_user(user.pk, b) == {}
+    assert Transaction.objects.using(b).filter(user=user).count() == 1
+
+
+def test_purge_deletes_on_the_users_shard_and_tracks_in_directory():
+    a, b = SHARDS[:2]
+    user = _user("bia", alias=b)
+    Transaction.objects.using(b).bulk_create([
+        Transaction(user=user, type="OUT", amount=Decimal("1.00"), date=date(2026, 3, 1)) for _ in range(30)
+    ])
+
+    request = purge.request_purge(user)
+    assert AccountPurge.objects.using(sharding.DIRECTORY_DB).filter(pk=request.pk).exists()
+    assert not AccountPurge.objects.using(b).exists()
+
+    purge.run_purge(request, batch_size=7)
+
+    assert request.deleted["finance.Transaction"] == 30
+    for model in sharding.user_models():
+        assert not model.objects.using(b).filter(user_id=user.pk).exists()
+    assert not get_user_model().objects.filter(pk=user.pk).exists()
+    assert Category.objects.using(a).filter(user=None, name="Outros").exists()
+
+
+def test_budget_counters_live_on_the_users_shard_and_move_with_it():
+    a, b = SHARDS[:2]
+    for alias in SHARDS:
+        sharding.prepare_shard(alias)
+    user = _user("lia", alias=b)
+    client = _client(user)
+    cat = client.post(reverse("category-list"), {"name": "Feira"}, format="json").json()
+    assert client.post(reverse("budget-list"), {"category": cat["id"], "limit": "20.00"}, format="json").status_code == 201
+    res = client.post(reverse("transaction-list"), {
+        "type": "OUT", "amount": "15.00", "date": "2026-05-03", "category": cat["id"],
+    }, format="json")
+    assert res.status_code == 201, res.content
+    assert res.json()["budget"]["percent"] == 75
+
+    assert SpendingCounter.objects.using(b).get(user=user).spent == Decimal("15.00")
+    assert BudgetEvent.objects.using(b).filter(user=user).count() == 1
+    assert not SpendingCounter.objects.using(a).exists()
+    assert budgets.reconcile() == []
+
+    sharding.move_user(user.pk, a)
+    assert client.get(reverse("budget-list"), {"month": "2026-05"}).json()[0]["percent"] == 75
+    assert BudgetEvent.objects.using(a).filter(user=user).count() == 1
+    assert budgets.reconcile() == []
+
+
+def test_platform_report_covers_every_shard():
+    a, b = SHARDS[:2]
+    for alias, username in ((a, "caio"), (b, "duda")):
+        user = _user(username, alias=alias)
+        Transaction.objects.using(alias).create(user=user, type="OUT", amount=Decimal("10.00"), date=date(2026, 3, 1))
+
+    assert {alias for alias, _, _ in platform_report.partitions(1)} == {a, b}
+    data = platform_report.build_report(platform_report.collect(1))
+    assert data["months"] == [{"month": "2026-03", "income": Decimal("0.00"), "expense": Decimal("20.00"),
+                               "transactions": 2, "active_users": 2}]
+
+
+def test_rebalance_plan_evens_out_users():
+    a, b = SHARDS[:2]
+    users = [_user(f"u{i}", alias=a) for i in range(5)]
+    plan = sharding.rebalance_plan()
+    assert len(plan) == 2
+    assert all(source == a and target != a for _, source, target in plan)
+    assert {uid for uid, _, _ in plan} <= {u.pk for u in users}
@@ -1,13 +1,44 @@
 # finance/tests.py
-import pytest
+import asyncio
+import base64
+import json
+import re
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
-from datetime import date
+from io import StringIO
+from itertools import count
+from urllib.parse import urlsplit
 
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from finance.models import Category, Transaction
+from finance import (
+    admin as finance_admin, archive, batch, budgets, categorize, events, ledger, partitioning, platform_report, purge,
+    stream, sync,
+)
+from finance.analytics import build_analytics
+from finance.events import Event, InMemoryBroker
+from finance.ledger import LedgerEngine
+from finance.management.commands.loadtest import EMAIL, LoadRunner, Session, jwt_exp, parse_mix, percentile
+from finance.models import (
+    AccountPurge, ArchivedMonthTotal, Budget, BudgetEvent, Category, CategoryRule, IdempotencyKey, RecurringTransaction,
+    SpendingCounter, SyncCounter, Tombstone, Transaction, TransactionArchive,
+)
+from finance.platform_report import QuantileSketch
+from finance.recurring import first_position, materialize_due, occurrence, run_due
 
 
 pytestmark = pytest.mark.django_db
@@ -114,4 +145,1293 @@ def test_destroy_outros_returns_409_and_does_not_delete(auth_client):
     resp = auth_client.delete(_category_detail_url(outros.id))
     assert resp.status_code == 409
 
-    assert Category.objects.filter(id=outros.id).exists()
\ No newline at end of file
+    assert Category.objects.filter(id=outros.id).exists()
+
+def test_loadtest_helpers():
+    values = sorted(float(v) for v in range(1, 101))
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 90) == 0.0
+
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": 1234}).encode()).decode().rstrip("=")
+    assert jwt_exp(f"header.{payload}.sig") == 1234.0
+    assert jwt_exp("lixo") == 0.0
+
+    assert parse_mix("dashboard=2,create") == {"dashboard": 2, "create": 1}
+
+
+@pytest.mark.django_db(transaction=True, databases="__all__")
+def test_loadtest_runs_against_live_server(live_server):
+    out = StringIO()
+    # um cliente por vez: o live_server em SQLite em memória divide a conexão entre as threads
+    call_command(
+        "loadtest", "--users", "2", "--duration", "1", "--concurrency", "1", "--seed-transactions", "5",
+        "--url", live_server.url, "--json", stdout=out,
+    )
+    output = out.getvalue()
+    assert output.startswith("2 usuários de carga (2 novos)")
+    report = json.loads(output[output.index("{"):])
+    assert report["requests"] > 0 and report["errors"] == 0 and report["login_failures"] == 0
+    assert set(report["routes"]) <= {"summary", "recent", "list", "create"}
+    for route in report["routes"].values():
+        assert route["requests"] > 0 and 0 < route["p50_ms"] <= route["p99_ms"] <= route["max_ms"]
+
+    users = get_user_model().objects.filter(username__in=[EMAIL.format(i) for i in range(2)])
+    assert users.count() == 2
+    for loaded in users:
+        assert Category.objects.filter(user=loaded, name="Outros").exists()
+        assert Transaction.objects.filter(user=loaded, description__startswith="seed ").count() == 5
+
+    # re-login que falha no meio da carga vira erro no relatório, não derruba a execução
+    server = urlsplit(live_server.url)
+    runner = LoadRunner(server.hostname, server.port, [], {"list": 1}, 1, 0, 0, 5)
+    session = Session("ninguem@caixinha.local", cookies={"refresh_token": "vencido"})
+    asyncio.run(runner.refresh(session))
+    assert runner.login_failures == 1 and runner.errors["login"] == {401: 1}
+    assert runner.report()["login_failures"] == 1
+
+
+def test_transaction_list_month_filter_uses_date_range(auth_client, user):
+    for d in (date(2026, 1, 31), date(2026, 2, 1), date(2026, 2, 28), date(2026, 3, 1)):
+        Transaction.objects.create(user=user, type="OUT", amount=Decimal("1.00"), date=d)
+
+    resp = auth_client.get(reverse("transaction-list"), {"month": "2026-02"})
+    assert resp.status_code == 200
+    assert sorted(t["date"] for t in resp.json()["results"]) == ["2026-02-01", "2026-02-28"]
+
+    resp = auth_client.get(reverse("transaction-list"), {"month": "2026-13"})
+    assert resp.json()["results"] == []
+
+
+def test_partition_helpers():
+    assert partitioning.partition_name(date(2025, 1, 1), "year") == "finance_transaction_y2025"
+    assert partitioning.partition_name(date(2025, 3, 1), "month") == "finance_transaction_m2025_03"
+    assert partitioning.partition_bounds("finance_transaction_m2025_12") == (date(2025, 12, 1), date(2026, 1, 1))
+    assert partitioning.partition_bounds("finance_transaction_default") is None
+    assert partitioning.shift_period(date(2025, 1, 1), "month", -1) == date(2024, 12, 1)
+    assert partitioning.periods_between(date(2024, 11, 20), date(2025, 1, 5), "month") == [
+        date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1),
+    ]
+
+
+@pytest.mark.skipif(connection.vendor == "postgresql", reason="testa o erro fora do Postgres")
+def test_transaction_partitions_command_requires_postgres():
+    with pytest.raises(CommandError):
+        call_command("transaction_partitions", "maintain")
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="particionamento só existe em Postgres")
+def test_convert_to_partitioned_table_keeps_rows_and_prunes(auth_client, user):
+    feira = Category.objects.create(user=user, name="Feira")
+    for d in (date(2024, 5, 10), date(2025, 2, 3), date(2025, 2, 20)):
+        Transaction.objects.create(user=user, type="OUT", amount=Decimal("5.00"), date=d, category=feira)
+
+    result = partitioning.convert_table(interval="year", batch_size=2)
+    assert result["rows"] == 3
+    # a _legacy fica sem FKs: apagar categoria usada pelas linhas antigas continua valendo
+    assert auth_client.delete(_category_detail_url(feira.pk)).status_code == 204
+    with connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(
+            "SELECT COUNT(*) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [partitioning.LEGACY_TABLE],
+        )
+        assert cursor.fetchone()[0] == 0
+    assert partitioning.is_partitioned()
+    assert "finance_transaction_y2024" in partitioning.list_partitions()
+
+    resp = auth_client.post(
+        reverse("transaction-list"),
+        {"type": "IN", "amount": "10.00", "date": "2025-02-21", "category": Category.objects.create(user=user, name="Sal").id},
+        format="json",
+    )
+    assert resp.status_code == 201
+    assert resp.json()["id"] > max(Transaction.objects.exclude(id=resp.json()["id"]).values_list("id", flat=True))
+
+    resp = auth_client.get(reverse("transaction-list"), {"month": "2025-02"})
+    assert len(resp.json()["results"]) == 3
+
+    plan = Transaction.objects.filter(user=user, date__gte=date(2025, 2, 1), date__lt=date(2025, 3, 1)).explain()
+    assert "finance_transaction_y2025" in plan
+    assert "finance_transaction_y2024" not in plan
+
+    result = partitioning.maintain(ahead=1, today=date(2030, 6, 1))
+    assert result["created"] == ["finance_transaction_y2030", "finance_transaction_y2031"]
+
+
+def test_archive_keeps_summary_and_reads_through(auth_client, user, monkeypatch):
+    lazer = Category.objects.create(user=user, name="Lazer")
+    Transaction.objects.create(user=user, type="IN", amount=Decimal("100.00"), date=date(2020, 3, 5), category=lazer)
+    Transaction.objects.create(user=user, type="OUT", amount=Decimal("30.00"), date=date(2020, 3, 9), category=lazer,
+                               description="Feira do bairro")
+    Transaction.objects.create(user=user, type="OUT", amount=Decimal("5.50"), date=date(2021, 7, 1), category=lazer)
+    Transaction.objects.create(user=user, type="OUT", amount=Decimal("10.00"), date=date(2026, 1, 2), category=lazer)
+
+    def summary(month):
+        return auth_client.get(reverse("summary"), {"month": month}).json()
+
+    before_march, before_now = summary("2020-03"), summary("2026-01")
+    # restaurar devolve a linha como era, created_at inclusive
+    entered = datetime(2020, 3, 10, 12, 0, tzinfo=dt_timezone.utc)
+    Transaction.objects.filter(user=user, date__year=2020).update(created_at=entered)
+
+    result = archive.archive_all(date(2025, 1, 1))
+    assert result == {"users": 1, "transactions": 3}
+    assert Transaction.objects.filter(user=user).count() == 1
+    assert TransactionArchive.objects.filter(user=user).count() == 2
+    assert ArchivedMonthTotal.objects.filter(user=user).count() == 3
+
+    assert summary("2020-03") == before_march
+    assert summary("2026-01") == before_now
+
+    resp = auth_client.get(reverse("transaction-list"), {"month": "2020-03"})
+    rows = resp.json()["results"]
+    assert [r["amount"] for r in rows] == ["30.00", "100.00"]
+    assert rows[0]["category_name"] == "Lazer"
+
+    resp = auth_client.get(reverse("transaction-list"), {"month": "2020-03", "type": "IN"})
+    assert [r["amount"] for r in resp.json()["results"]] == ["100.00"]
+
+    # sem mês: a lista inteira (paginada, ordenada, filtrada) inclui o arquivo
+    url = reverse("transaction-list")
+    resp = auth_client.get(url).json()
+    assert resp["count"] == 4
+    assert [r["date"] for r in resp["results"]] == ["2026-01-02", "2021-07-01", "2020-03-09", "2020-03-05"]
+    resp = auth_client.get(url, {"ordering": "amount"}).json()
+    assert [r["amount"] for r in resp["results"]] == ["5.50", "10.00", "30.00", "100.00"]
+    merged = archive.MergedRows(Transaction.objects.filter(user=user), archive.archived_transactions(user), ["amount"])
+    assert len(merged) == 4 and [tx.amount for tx in merged[1:3]] == [Decimal("10.00"), Decimal("30.00")]
+    assert [r["amount"] for r in auth_client.get(url, {"type": "OUT", "ordering": "-amount"}).json()["results"]] == [
+        "30.00", "10.00", "5.50",
+    ]
+    # busca por termo, como o SearchFilter faz na tabela
+    assert [r["amount"] for r in auth_client.get(url, {"search": "bairro feira"}).json()["results"]] == ["30.00"]
+    assert auth_client.get(url, {"search": "bairro mercado"}).json()["count"] == 0
+
+    decoded = []
+    decode_rows = archive.decode_rows
+    monkeypatch.setattr(archive, "decode_rows", lambda payload: decoded.append(payload) or decode_rows(payload))
+    # retrieve: só descompacta o ano cuja faixa de ids tem o pk
+    archived_id = next(r["id"] for r in resp["results"] if r["amount"] == "30.00")
+    resp = auth_client.get(reverse("transaction-detail", args=[archived_id]))
+    assert resp.status_code == 200 and resp.json()["date"] == "2020-03-09"
+    assert len(decoded) == 1
+    assert auth_client.get(reverse("transaction-detail", args=[archived_id + 1000])).status_code == 404
+    assert len(decoded) == 1
+
+    assert archive.restore_user(user.id, year=2020) == 2
+    assert Transaction.objects.filter(user=user, date__year=2020).count() == 2
+    assert set(Transaction.objects.filter(user=user, date__year=2020).values_list("created_at", flat=True)) == {entered}
+    assert not ArchivedMonthTotal.objects.filter(user=user, month__year=2020).exists()
+    assert summary("2020-03") == before_march
+    assert summary("2026-01") == before_now
+
+    # lista sem mês: a 1ª página cabe nas linhas mais novas que o arquivo, nada é descompactado
+    Transaction.objects.bulk_create(
+        [Transaction(user=user, type="OUT", amount=Decimal("1.00"), date=date(2026, 2, 1)) for _ in range(50)]
+    )
+    decoded.clear()
+    assert auth_client.get(url).json()["count"] == 54
+    assert auth_client.get(url, {"type": "OUT"}).json()["count"] == 53
+    assert auth_client.get(url, {"type": "IN"}).json()["count"] == 1
+    assert decoded == []
+    # a página que passa das linhas da tabela lê o arquivo
+    page = auth_client.get(url, {"page": 2}).json()["results"]
+    assert [r["date"] for r in page] == ["2026-01-02", "2021-07-01", "2020-03-09", "2020-03-05"] and len(decoded) == 1
+
+
+def _monthly_history(user):
+    mercado = Category.objects.create(user=user, name="Mercado")
+    rows = [Transaction(user=user, type="OUT", amount=Decimal("80.00"), date=date(2023, 3, 7), category=mercado)]
+    for i in range(14):  # 2025-01 .. 2026-02
+        y, m = 2025 + i // 12, i % 12 + 1
+        rows += [
+            Transaction(user=user, type="IN", amount=Decimal("1000.00"), date=date(y, m, 1)),
+            Transaction(user=user, type="OUT", amount=Decimal("100.00"), date=date(y, m, 5), category=mercado),
+            Transaction(user=user, type="OUT", amount=Decimal("50.00"), date=date(y, m, 20), category=mercado),
+        ]
+    rows += [
+        Transaction(user=user, type="IN", amount=Decimal("1000.00"), date=date(2026, 3, 1)),
+        Transaction(user=user, type="OUT", amount=Decimal("120.00"), date=date(2026, 3, 5), category=mercado),
+    ]
+    Transaction.objects.bulk_create(rows)
+    return mercado
+
+
+def test_analytics_matches_summary_and_rolls_averages(auth_client, user, django_assert_num_queries):
+    _monthly_history(user)
+    archive.archive_all(date(2024, 1, 1))
+    assert not Transaction.objects.filter(user=user, date__year=2023).exists()
+
+    with django_assert_num_queries(3):
+        data = auth_client.get(reverse("analytics"), {"month": "2026-03", "months": 40}).json()
+
+    assert [s["month"] for s in data["series"]][:2] == ["2022-12", "2023-01"]
+    for item in data["series"]:
+        summary = auth_client.get(reverse("summary"), {"month": item["month"]}).json()
+        assert (item["income"], item["expense"]) == (summary["income"], summary["expense"])
+        assert data["balance_total"] == summary["balance_total"]
+
+    feb = next(s for s in data["series"] if s["month"] == "2026-02")
+    assert feb["expense_avg_3"] == 150 and feb["income_avg_12"] == 1000
+    assert data["series"][3]["expense_avg_12"] == 80  # 2023-03: só conta meses desde o primeiro
+
+    (mercado,) = [c for c in data["by_category"] if c["category__name"] == "Mercado"]
+    assert mercado["total"] == 120 and mercado["avg_3"] == 150
+    assert (mercado["previous_year"], mercado["yoy_delta"], mercado["yoy_pct"]) == (150, -30, -20.0)
+    assert mercado["trend"][-3:] == [150, 150, 120]
+    assert data["forecast"] is None
+
+
+def test_analytics_forecast_uses_month_to_date_and_history(user):
+    _monthly_history(user)
+    data = build_analytics(user, 2026, 3, today=date(2026, 3, 10))
+
+    (mercado,) = [c for c in data["by_category"] if c["category__name"] == "Mercado"]
+    # até o dia 10: 120 agora contra 100 em março/2025
+    assert (mercado["previous_year"], mercado["yoy_delta"]) == (Decimal("100.00"), Decimal("20.00"))
+    assert data["forecast"] == {
+        "days_elapsed": 10,
+        "days_in_month": 31,
+        "income": Decimal("1000.00"),
+        "expense": Decimal("120.00"),
+        "projected_income": Decimal("1000.00"),
+        "projected_expense": Decimal("170.00"),  # + os 50 que costumam sair depois do dia 10
+        "projected_balance_month": Decimal("830.00"),
+        "projected_balance_total": data["balance_total"] - Decimal("50.00"),
+    }
+
+
+@pytest.fixture
+def ledger_engine(settings):
+    settings.FINANCE_LEDGER_ENGINE = True
+    engine = ledger.get_engine()
+    engine.clear()
+    yield engine
+    engine.clear()
+
+
+def test_ledger_engine_matches_db_and_follows_changes(auth_client, user, ledger_engine, django_assert_num_queries):
+    mercado = Category.objects.create(user=user, name="Mercado")
+    lazer = Category.objects.create(user=user, name="Lazer")
+    for tx_type, amount, day, category in [
+        ("IN", "1000.00", date(2020, 3, 1), None),
+        ("OUT", "30.10", date(2020, 3, 9), lazer),
+        ("OUT", "12.35", date(2026, 1, 2), mercado),
+        ("OUT", "7.65", date(2026, 1, 2), mercado),
+        ("IN", "50.00", date(2026, 1, 20), lazer),
+    ]:
+        Transaction.objects.create(user=user, type=tx_type, amount=Decimal(amount), date=day, category=category)
+
+    def by_key(rows):
+        return sorted(rows, key=lambda r: (r["type"], str(r["category__id"])))
+
+    def check(month):
+        memory = auth_client.get(reverse("summary"), {"month": month}).json()
+        db = auth_client.get(reverse("summary"), {"month": month, "source": "db"}).json()
+        assert by_key(memory.pop("by_category")) == by_key(db.pop("by_category"))
+        assert memory == db
+        for params in ({}, {"month": month}, {"type": "OUT"}, {"category": mercado.pk}):
+            url = reverse("transaction-recent")
+            assert auth_client.get(url, params).json() == auth_client.get(url, {**params, "source": "db"}).json()
+        url = reverse("analytics")
+        assert auth_client.get(url, {"month": month}).json() == auth_client.get(url, {"month": month, "source": "db"}).json()
+
+    check("2026-01")
+    check("2020-03")
+    assert ledger_engine.stats["loads"] == 1
+    with django_assert_num_queries(2):  # contador + nomes das categorias
+        auth_client.get(reverse("summary"), {"month": "2026-01"})
+
+    # mudanças pela API entram como delta, sem recarregar
+    created = auth_client.post(reverse("transaction-list"), {
+        "type": "OUT", "amount": "99.99", "date": "2026-01-15", "category": lazer.pk,
+    }, format="json").json()
+    first = Transaction.objects.filter(user=user, date=date(2026, 1, 2)).first()
+    auth_client.patch(reverse("transaction-detail", args=[first.pk]), {"amount": "1.01", "date": "2026-01-31"}, format="json")
+    check("2026-01")
+    auth_client.delete(reverse("transaction-detail", args=[created["id"]]))
+    auth_client.delete(reverse("category-detail", args=[mercado.pk]))
+    check("2026-01")
+    assert ledger_engine.stats["loads"] == 1 and ledger_engine.stats["updates"] == 2
+
+    # arquivamento não passa pela sequência: epoch muda e o razão recarrega
+    archive.archive_all(date(2025, 1, 1))
+    check("2020-03")
+    assert ledger_engine.stats["loads"] == 2
+
+
+def test_ledger_engine_evicts_least_recently_read_users(user, other_user):
+    for owner in (user, other_user):
+        Transaction.objects.create(user=owner, type="OUT", amount=Decimal("1.00"), date=date(2026, 1, 1))
+    size = LedgerEngine().ledger(user.pk).nbytes
+
+    engine = LedgerEngine(memory_bytes=size + size // 2)
+    engine.ledger(user.pk)
+    engine.ledger(other_user.pk)
+    assert user.pk not in engine and other_user.pk in engine
+    assert engine.stats["evictions"] == 1 and engine.used_bytes == size
+
+
+def _sync(client, since=None, limit=None):
+    params = {k: v for k, v in {"since": since, "limit": limit}.items() if v is not None}
+    resp = client.get(reverse("sync"), params)
+    assert resp.status_code == 200, resp.content
+    return resp.json()
+
+
+def test_sync_returns_only_changes_and_deletions(auth_client, user, other_user, django_assert_num_queries):
+    Transaction.objects.create(user=other_user, type="IN", amount=Decimal("1.00"), date=date(2026, 1, 1))
+    full = _sync(auth_client)
+    assert {c["name"] for c in full["categories"]} == {"Outros"}
+    assert full["transactions"] == [] and not full["has_more"]
+
+    lazer = auth_client.post(_category_list_url(), {"name": "Lazer"}, format="json").json()
+    tx_url = reverse("transaction-list")
+    a = auth_client.post(tx_url, {"type": "OUT", "amount": "10.00", "date": "2026-01-05", "category": lazer["id"]}, format="json").json()
+    b = auth_client.post(tx_url, {"type": "IN", "amount": "50.00", "date": "2026-01-06", "category": lazer["id"]}, format="json").json()
+    c = auth_client.post(tx_url, {"type": "OUT", "amount": "3.00", "date": "2026-01-07", "category": lazer["id"]}, format="json").json()
+
+    delta = _sync(auth_client, full["next"])
+    assert [t["id"] for t in delta["transactions"]] == [a["id"], b["id"], c["id"]]
+    assert [x["name"] for x in delta["categories"]] == ["Lazer"]
+
+    # em dia: responde só com a consulta do contador
+    with django_assert_num_queries(1):
+        same = _sync(auth_client, delta["next"])
+    assert same["next"] == delta["next"] and same["transactions"] == []
+
+    auth_client.patch(reverse("transaction-detail", args=[a["id"]]), {"amount": "11.00"}, format="json")
+    auth_client.delete(reverse("transaction-detail", args=[b["id"]]))
+    delta2 = _sync(auth_client, delta["next"])
+    assert [(t["id"], t["amount"]) for t in delta2["transactions"]] == [(a["id"], "11.00")]
+    assert delta2["deleted"] == [{"type": "transaction", "id": b["id"]}]
+
+    # destroy da categoria: reatribuição em lote + tombstone da categoria,
+    # entregues em lotes de 1 com token de continuação
+    auth_client.delete(reverse("category-detail", args=[lazer["id"]]))
+    seen, token, pages = [], delta2["next"], 0
+    while True:
+        page = _sync(auth_client, token, limit=1)
+        seen += [("tx", t["id"], t["category_name"]) for t in page["transactions"]]
+        seen += [(d["type"], d["id"]) for d in page["deleted"]]
+        token, pages = page["next"], pages + 1
+        if not page["has_more"]:
+            break
+    assert sorted(seen, key=str) == sorted(
+        [("tx", a["id"], "Outros"), ("tx", c["id"], "Outros"), ("category", lazer["id"])], key=str
+    )
+    assert pages >= 3
+    assert _sync(auth_client, token)["transactions"] == []
+
+
+def test_sync_stops_at_the_counter_read_before_the_queries(monkeypatch, user):
+    token = sync.changes_since(user, None)["next"]
+    lazer = Category.objects.create(user=user, name="Lazer")
+    after = sync._after
+
+    # outros dois writers commitam entre a leitura do contador e a consulta das transações
+    def interleave(kind, position):
+        if kind == 1 and not Category.objects.filter(user=user, name="Feira").exists():
+            Category.objects.create(user=user, name="Feira")
+            Transaction.objects.create(user=user, type="OUT", amount=Decimal("5.00"), date=date(2026, 1, 2), category=lazer)
+        return after(kind, position)
+
+    monkeypatch.setattr(sync, "_after", interleave)
+    first = sync.changes_since(user, token)
+    assert [c.name for c in first["categories"]] == ["Lazer"] and first["transactions"] == []
+    assert first["next"] == str(lazer.sync_seq)
+
+    monkeypatch.setattr(sync, "_after", after)
+    second = sync.changes_since(user, first["next"])
+    assert [c.name for c in second["categories"]] == ["Feira"]
+    assert [t.amount for t in second["transactions"]] == [Decimal("5.00")]
+
+
+def test_sync_rejects_bad_token_and_resets_after_prune(auth_client, user):
+    assert auth_client.get(reverse("sync"), {"since": "abc"}).status_code == 400
+
+    tx = Transaction.objects.create(user=user, type="IN", amount=Decimal("1.00"), date=date(2026, 1, 1))
+    token = _sync(auth_client)["next"]
+    tx.delete()
+    Tombstone.objects.filter(user=user).update(deleted_at=timezone.now() - timedelta(days=365))
+    Transaction.objects.create(user=user, type="IN", amount=Decimal("2.00"), date=date(2026, 1, 1))
+
+    assert sync.prune_tombstones(days=30) == 1
+    assert SyncCounter.objects.get(user=user).pruned_seq > int(token)
+    assert _sync(auth_client, token)["reset"] is True
+
+
+def test_event_broker_fanout_and_replay():
+    broker = InMemoryBroker(buffer_size=3)
+
+    async def run():
+        sub = broker.subscribe(1)
+        broker.publish(1, Event(5, "transaction", {"id": 9}))
+        broker.publish(2, Event(6, "transaction", {"id": 10}))
+        got = await sub.get(1)
+        broker.unsubscribe(sub)
+        return got
+
+    assert asyncio.run(run()).data == {"id": 9}
+    for seq in (7, 8, 9):
+        broker.publish(1, Event(seq, "category", {}))
+    # 5 saiu do buffer: replay a partir de 4 não é confiável
+    assert broker.replay(1, 4) is None
+    assert [e.id for e in broker.replay(1, 7)] == [8, 9]
+    assert broker.replay(3, 0) is None
+
+    # buffers limitados em número de usuários: sai quem publicou há mais tempo
+    broker = InMemoryBroker(buffer_size=3, buffer_users=2)
+    for user_id in (1, 2, 1, 3):
+        broker.publish(user_id, Event(10 + user_id, "category", {}))
+    assert list(broker._buffers) == [1, 3]
+    assert broker.replay(2, 12) is None and broker.replay(3, 13) == []
+
+
+def test_stream_pushes_deltas_with_last_event_id(user, django_capture_on_commit_callbacks):
+    broker = events.InMemoryBroker()
+    events.set_broker(broker)
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            first = Transaction.objects.create(user=user, type="IN", amount=Decimal("100.00"), date=date(2026, 1, 5))
+        with django_capture_on_commit_callbacks(execute=True):
+            first.date = date(2026, 2, 1)
+            first.save()
+        replayed = broker.replay(user.pk, first.sync_seq - 1)
+        assert [e.data["months"] for e in replayed] == [["2026-01", "2026-02"]]
+
+        async def read(gen, count, publish=None):
+            chunks = []
+            async for chunk in gen:
+                chunks.append(chunk)
+                if publish and len(chunks) == 2:
+                    broker.publish(user.pk, publish)
+                if len(chunks) == count:
+                    break
+            await gen.aclose()
+            return chunks
+
+        # reconexão com Last-Event-ID: replay do que faltou, não snapshot
+        gen = stream.event_stream(user, first.sync_seq - 1, time.time() + 60, broker=broker, heartbeat=5)
+        chunks = async_to_sync(read)(gen, 2)
+        assert chunks[0].startswith("retry:")
+        assert chunks[1].startswith(f"id: {first.sync_seq}\nevent: transaction\n")
+        assert '"balance_total":100.0' in chunks[1]
+        assert '"month":"2026-01","income":0.0' in chunks[1]
+
+        # conexão nova: snapshot e depois o delta publicado ao vivo
+        # (id acima do contador, senão o stream descarta como já coberto pelo snapshot)
+        second = Transaction.objects.create(user=user, type="OUT", amount=Decimal("30.00"), date=date(2026, 2, 3))
+        live = Event(second.sync_seq + 1, "transaction", {"id": second.pk, "deleted": False, "months": ["2026-02"]})
+        gen = stream.event_stream(user, None, time.time() + 60, broker=broker, heartbeat=5)
+        chunks = async_to_sync(read)(gen, 3, publish=live)
+        assert "event: snapshot" in chunks[1] and '"balance_total":70.0' in chunks[1]
+        assert chunks[2].startswith(f"id: {live.id}\nevent: transaction")
+        assert '"month":"2026-02","income":100.0,"expense":30.0' in chunks[2]
+        assert not broker._subscribers
+
+        # heartbeat quando não tem nada
+        gen = stream.event_stream(user, None, time.time() + 60, broker=broker, heartbeat=0.05)
+        assert async_to_sync(read)(gen, 3)[2] == ": ping\n\n"
+
+        # pela URL: cookie obrigatório (AsyncClient = request ASGI)
+        client = AsyncClient()
+        assert async_to_sync(client.get)(reverse("stream")).status_code == 401
+        client.cookies["access_token"] = str(RefreshToken.for_user(user).access_token)
+        resp = async_to_sync(client.get)(reverse("stream"))
+        assert resp.status_code == 200 and resp["Content-Type"] == "text/event-stream"
+        assert async_to_sync(read)(resp.streaming_content, 1)[0].startswith(b"retry:")
+    finally:
+        events.set_broker(None)
+
+
+def test_category_rules_apply_on_create_and_retroactively(auth_client, user, other_user):
+    rules_url = reverse("categoryrule-list")
+    tx_url = reverse("transaction-list")
+    mercado = Category.objects.create(user=user, name="Mercado")
+    transporte = Category.objects.create(user=user, name="Transporte")
+    alheia = Category.objects.create(user=other_user, name="Alheia")
+
+    # sem regras: cai no "Outros" do próprio usuário (existe também o global)
+    plain = auth_client.post(tx_url, {"type": "OUT", "amount": "5.00", "date": "2026-01-02"}, format="json")
+    assert plain.status_code == 201, plain.content
+    assert plain.json()["category"] == Category.objects.get(user=user, name="Outros").pk
+
+    for body in (
+        {"kind": "keyword", "pattern": "Padaria", "category": mercado.pk},
+        {"kind": "prefix", "pattern": "uber", "category": transporte.pk, "priority": 10},
+        {"kind": "regex", "pattern": r"posto (shell|ipiranga)", "category": transporte.pk},
+        {"kind": "amount", "min_amount": "1000.00", "category": mercado.pk, "priority": 500},
+    ):
+        resp = auth_client.post(rules_url, body, format="json")
+        assert resp.status_code == 201, resp.content
+    for bad in (
+        {"kind": "regex", "pattern": "(abc", "category": mercado.pk},
+        {"kind": "regex", "pattern": r"(a)\1", "category": mercado.pk},
+        {"kind": "keyword", "pattern": "  ", "category": mercado.pk},
+        {"kind": "amount", "category": mercado.pk},
+        {"kind": "keyword", "pattern": "x", "category": alheia.pk},
+    ):
+        assert auth_client.post(rules_url, bad, format="json").status_code == 400
+    assert auth_client.get(rules_url).json()["count"] == 4
+
+    def create(description, amount="10.00", **extra):
+        resp = auth_client.post(tx_url, {
+            "type": "OUT", "amount": amount, "date": "2026-01-05", "description": description, **extra,
+        }, format="json")
+        assert resp.status_code == 201, resp.content
+        return resp.json()["category_name"]
+
+    assert create("PADARIA SÃO  jorge") == "Mercado"
+    assert create("Uber *trip padaria") == "Transporte"  # prioridade 10 ganha do keyword
+    assert create("posto Ipiranga 123") == "Transporte"
+    assert create("aluguel", amount="1500.00") == "Mercado"
+    assert create("aluguel") == "Outros"
+    assert create("padaria", category=transporte.pk) == "Transporte"  # escolha do cliente vale
+
+    # retroativo: só o que está em "Outros"/sem categoria, em lotes, marcando pro delta-sync
+    outros_global = Category.objects.get(user=None, name="Outros")
+    old = [
+        Transaction.objects.create(user=user, type="OUT", amount=Decimal("8.00"), date=date(2025, 5, 1),
+                                   description=desc, category=category)
+        for desc, category in [
+            ("padaria do ze", outros_global), ("UBER 99", None), ("posto shell", transporte), ("nada", None),
+            ("padaria nova", Category.objects.get(user=user, name="Outros")),
+        ]
+    ]
+    theirs = Transaction.objects.create(user=other_user, type="OUT", amount=Decimal("8.00"), date=date(2025, 5, 1),
+                                        description="padaria", category=None)
+    before = max(tx.sync_seq for tx in old)
+    result = categorize.apply_to_uncategorized(user, batch_size=2)
+    assert result == {"scanned": 6, "updated": 3}  # 4 antigas + "aluguel" + a primeira, sem regra
+    got = {tx.description: (tx.category.name if tx.category else None, tx.sync_seq > before)
+           for tx in Transaction.objects.filter(pk__in=[t.pk for t in old]).select_related("category")}
+    assert got == {
+        "padaria do ze": ("Mercado", True), "UBER 99": ("Transporte", True), "posto shell": ("Transporte", False),
+        "nada": (None, False), "padaria nova": ("Mercado", True),
+    }
+    theirs.refresh_from_db()
+    assert theirs.category_id is None
+    assert auth_client.post(reverse("categoryrule-apply")).json() == {"scanned": 3, "updated": 0}
+
+    # cache: mesmo matcher até as regras mudarem
+    matcher = categorize.matcher_for(user.pk)
+    assert categorize.matcher_for(user.pk) is matcher
+    rule = CategoryRule.objects.get(user=user, kind="keyword")
+    auth_client.patch(reverse("categoryrule-detail", args=[rule.pk]), {"pattern": "nada"}, format="json")
+    assert categorize.matcher_for(user.pk) is not matcher
+    assert categorize.matcher_for(user.pk).match("NADA", Decimal("1")) == mercado.pk
+    CategoryRule.objects.filter(user=user).delete()
+    assert categorize.matcher_for(user.pk) is None
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_rule_matcher_priority_amounts_and_automaton(monkeypatch, native):
+    if not native:
+        monkeypatch.setattr(categorize, "ahocorasick", None)
+    elif categorize.ahocorasick is None:
+        pytest.skip("pyahocorasick não instalado")
+
+    def rule(kind, pattern, category, low=None, high=None):
+        return CategoryRule(kind=kind, pattern=pattern, category_id=category, min_amount=low, max_amount=high)
+
+    matcher = categorize.RuleMatcher([
+        rule("keyword", "café", 1, high=Decimal("20")),
+        rule("regex", r"\d{4}\*\d+", 2),  # sem trecho literal: regex combinada
+        rule("prefix", "pix", 3),
+        rule("regex", r"^ifood .*(lanche|pizza)", 4, low=Decimal("50")),
+        rule("regex", r"ifood", 5),
+        rule("keyword", "CAFE", 6),
+        rule("keyword", "he", 7),
+        rule("keyword", "she", 8),
+        rule("amount", "", 9, low=Decimal("1000")),
+    ])
+    assert isinstance(matcher.automaton, categorize._Automaton) is not native
+    items = [
+        ("Cafe da manhã", Decimal("10")),   # sem acento/maiúscula
+        ("CAFÉ", Decimal("30")),            # faixa da regra 1 não aceita: vale a 6
+        ("compra 1234*99 pix", Decimal("5")),
+        ("PIX enviado", Decimal("5")),
+        ("compra pix", Decimal("5")),       # prefixo só no começo
+        ("ifood pizza", Decimal("80")),
+        ("ifood pizza", Decimal("20")),     # regra 4 pede >= 50: cai na 5
+        ("ushers", None),                   # sobreposição: "she" e "he" no mesmo ponto
+        ("tv", Decimal("1000")),
+        ("tv", None),
+        ("", Decimal("1")),
+    ]
+    expected = [1, 6, 2, 3, None, 4, 5, 7, 9, None, None]
+    assert matcher.match_many(items) == expected
+    assert [matcher.match(description, amount) for description, amount in items] == expected
+
+
+@pytest.mark.parametrize("pattern, expected", [
+    (r"posto (shell|ipiranga)", {"posto"}),
+    (r"(ifood|rappi) .*", {"ifood", "rappi"}),
+    (r"^ifood .*(lanche|pizza)", {"ifood"}),
+    (r"uber?s eats", {"s eats"}),
+    (r"a(bcd)?efgh", {"efgh"}),
+    (r"[xy]abc+d", {"abc"}),
+    (r"Padaria\.com|mercado", {"padaria.com", "mercado"}),
+    (r"\d{4}\*\d+", None),
+    (r"abc|d", None),  # um ramo sem trecho: nada obriga
+    (r"(?i)padaria", None),  # flags/lookaround: desiste em vez de adivinhar
+    (r"(?=padaria)", None),
+    (r"(padaria", None),
+])
+def test_required_literals_reads_patterns_conservatively(pattern, expected):
+    found = categorize.required_literals(pattern)
+    assert (set(found) if found is not None else None) == expected
+    if found:
+        # toda descrição casada contém um dos trechos
+        regex = re.compile(pattern, categorize.REGEX_FLAGS)
+        for sample in ("posto shell", "rappi x", "ifood lanche", "ubers eats", "efgh", "yabccd", "padaria.com"):
+            if regex.search(sample):
+                assert any(word in categorize.normalize(sample) for word in found)
+
+
+def test_transaction_batch_applies_in_one_transaction_and_replays_keys(auth_client, user, other_user, django_assert_max_num_queries):
+    url = reverse("transaction-batch")
+    mercado = Category.objects.create(user=user, name="Mercado")
+    lazer = Category.objects.create(user=user, name="Lazer")
+    alheia = Category.objects.create(user=other_user, name="Alheia")
+    CategoryRule.objects.create(user=user, kind="keyword", pattern="padaria", category=mercado)
+    keep = Transaction.objects.create(user=user, type="OUT", amount=Decimal("5.00"), date=date(2026, 1, 1), category=lazer)
+    gone = Transaction.objects.create(user=user, type="OUT", amount=Decimal("6.00"), date=date(2025, 12, 31))
+    theirs = Transaction.objects.create(user=other_user, type="OUT", amount=Decimal("7.00"), date=date(2026, 1, 1))
+    token = _sync(auth_client)["next"]
+
+    creates = [
+        {"op": "create", "key": f"c-{i}", "data": {
+            "type": "OUT", "amount": f"{i + 1}.50", "date": "2026-01-10", "description": f"padaria {i}" if i % 2 else "",
+            "category": lazer.pk if i % 3 == 0 else None,
+        }}
+        for i in range(300)
+    ]
+    ops = creates + [
+        {"op": "update", "key": "u-1", "id": keep.pk, "data": {"amount": "50.00", "date": "2026-02-01"}},
+        {"op": "delete", "key": "d-1", "id": gone.pk},
+        {"op": "delete", "id": theirs.pk},  # de outro usuário: 404, o resto segue
+    ]
+    # número de consultas fixo, não importa o tamanho do lote (4 delas são dos contadores
+    # de orçamento, 2 do lock do contador do usuário)
+    with django_assert_max_num_queries(24):
+        resp = auth_client.post(url, ops, format="json")
+    assert resp.status_code == 200, resp.content
+    results = resp.json()["results"]
+    assert [r["status"] for r in results[-3:]] == [200, 204, 404]
+    assert {r["status"] for r in results[:300]} == {201}
+    names = [r["transaction"]["category_name"] for r in results[:300]]
+    assert names[:4] == ["Lazer", "Mercado", "Outros", "Lazer"]  # cliente > regra > "Outros" do usuário
+    assert results[300]["transaction"]["amount"] == "50.00"
+    assert Transaction.objects.filter(user=user).count() == 301
+    assert not Transaction.objects.filter(pk=gone.pk).exists() and Transaction.objects.filter(pk=theirs.pk).exists()
+
+    # delta-sync enxerga tudo (seq por operação) e a remoção deixa tombstone
+    delta = _sync(auth_client, token, limit=1000)
+    assert len(delta["transactions"]) == 301
+    assert delta["deleted"] == [{"type": "transaction", "id": gone.pk}]
+    assert len({t.sync_seq for t in Transaction.objects.filter(user=user)}) == 301
+
+    # reenvio (ex.: a resposta se perdeu): nada aplicado de novo, mesmos resultados
+    resp = auth_client.post(url, ops[:2] + ops[-3:-1] + [{"op": "create", "key": "novo", "data": {
+        "type": "IN", "amount": "1.00", "date": "2026-01-11",
+    }}], format="json")
+    again = resp.json()["results"]
+    assert [r.get("replayed") for r in again] == [True, True, True, True, None]
+    assert again[0]["id"] == results[0]["id"] and again[2]["transaction"] == results[300]["transaction"]
+    assert Transaction.objects.filter(user=user).count() == 302
+    assert IdempotencyKey.objects.filter(user=user).count() == 303
+
+    # inválido: 400 com o erro na posição e nada aplicado
+    bad = [
+        {"op": "create", "data": {"type": "IN", "amount": "1.00", "date": "2026-01-12"}},
+        {"op": "create", "data": {"type": "IN", "amount": "-1", "date": "2026-01-12", "category": alheia.pk}},
+        {"op": "create", "data": {"type": "IN"}},
+        {"op": "update", "data": {"amount": "1.00"}},
+        {"op": "create", "key": "k", "data": {"type": "IN", "amount": "1.00", "date": "2026-01-12"}},
+        {"op": "delete", "key": "k", "id": keep.pk},
+    ]
+    resp = auth_client.post(url, bad[:1] + bad[4:], format="json")
+    assert resp.status_code == 400
+    assert resp.json() == [{}, {"key": ["Chave repetida no lote."]}, {"key": ["Chave repetida no lote."]}]
+    errors = auth_client.post(url, bad[:3], format="json").json()
+    assert errors[0] == {} and set(errors[1]["data"]) == {"amount", "category"}
+    assert set(errors[2]["data"]) == {"amount", "date"}
+    assert "id" in auth_client.post(url, bad[:4], format="json").json()[3]
+    assert Transaction.objects.filter(user=user).count() == 302
+    assert Tombstone.objects.filter(user=user).count() == 1
+    assert auth_client.post(url, [{"op": "delete", "id": 1}] * 1001, format="json").status_code == 400
+    # categoria que não é id (lista/objeto) é erro do item, não 500
+    resp = auth_client.post(url, [
+        {"op": "create", "data": {"type": "IN", "amount": "1.00", "date": "2026-01-12", "category": [lazer.pk]}},
+        {"op": "create", "data": {"type": "IN", "amount": "1.00", "date": "2026-01-12", "category": {"id": 1}}},
+        {"op": "create", "data": {"type": "IN", "amount": "1.00", "date": "2026-01-12", "category": str(lazer.pk)}},
+    ], format="json")
+    assert resp.status_code == 400
+    assert [set(item.get("data", {})) for item in resp.json()] == [{"category"}, {"category"}, set()]
+
+
+def test_transaction_batch_reads_under_the_counter_lock_and_updates_only_sent_fields(auth_client, user):
+    a = Transaction.objects.create(user=user, type="OUT", amount=Decimal("1.00"), date=date(2026, 1, 3), description="a")
+    b = Transaction.objects.create(user=user, type="OUT", amount=Decimal("2.00"), date=date(2026, 1, 4), description="b")
+    ops = [
+        {"op": "update", "id": a.pk, "data": {"amount": "10.00"}},
+        {"op": "update", "id": b.pk, "data": {"description": "feira"}},
+    ]
+    with CaptureQueriesContext(connection) as queries:
+        assert auth_client.post(reverse("transaction-batch"), ops, format="json").status_code == 200
+    sql = [q["sql"] for q in queries.captured_queries]
+
+    # cada linha só regrava o que veio pra ela
+    updates = [q for q in sql if q.startswith('UPDATE "finance_transaction"')]
+    assert len(updates) == 2
+    assert any('"amount"' in q and '"description"' not in q for q in updates)
+    assert any('"description"' in q and '"amount"' not in q for q in updates)
+    a.refresh_from_db()
+    b.refresh_from_db()
+    assert (a.amount, a.description, b.amount, b.description) == (Decimal("10.00"), "a", Decimal("2.00"), "feira")
+
+    # as transações são lidas com o contador do usuário já travado
+    if connection.features.has_select_for_update:
+        lock = next(i for i, q in enumerate(sql) if "FOR UPDATE" in q and "synccounter" in q)
+        read = next(i for i, q in enumerate(sql) if q.startswith("SELECT") and 'FROM "finance_transaction"' in q)
+        assert lock < read
+
+
+def test_transaction_batch_maps_only_key_races_to_conflict(auth_client, user, monkeypatch):
+    url = reverse("transaction-batch")
+    ops = [{"op": "create", "key": "k-1", "data": {"type": "IN", "amount": "1.00", "date": "2026-01-12"}}]
+
+    def broken(*args):
+        raise IntegrityError("violates check constraint")
+
+    # erro de integridade qualquer: sobe, não vira 409 de "tente de novo"
+    monkeypatch.setattr(batch, "_write", broken)
+    with pytest.raises(IntegrityError):
+        auth_client.post(url, ops, format="json")
+
+    # outro envio gravou a mesma chave no meio do caminho: 409
+    validate = batch._validate
+
+    def racing(request, payload):
+        validated = validate(request, payload)
+        IdempotencyKey.objects.create(user=request.user, key="k-1", result={})
+        return validated
+
+    monkeypatch.setattr(batch, "_validate", racing)
+    resp = auth_client.post(url, ops, format="json")
+    assert resp.status_code == 409
+
+
+def _seed_admin_rows(users, rows, categories_per_user):
+    txs = []
+    for user in users:
+        cats = Category.objects.bulk_create(
+            [Category(user=user, name=f"Cat {user.pk}-{Category.objects.count()}-{j}") for j in range(categories_per_user)]
+        )
+        txs += [
+            Transaction(user=user, type="OUT", amount=Decimal(i + 1), date=date(2026, 1, 1) + timedelta(days=i % 60),
+                        description=f"compra {i}", category=cats[i % len(cats)])
+            for i in range(rows)
+        ]
+    Transaction.objects.bulk_create(txs)
+
+
+def test_admin_transaction_changelist_has_fixed_query_count(admin_client, user, other_user, django_assert_num_queries,
+                                                            monkeypatch):
+
+    # contagem sempre exata: a estimativa do Postgres depende de quando o ANALYZE rodou
+    monkeypatch.setattr(finance_admin, "EXACT_COUNT_BELOW", 10**9)
+    postgres = connection.vendor == "postgresql"
+
+    url = reverse("admin:finance_transaction_changelist")
+    pages = [
+        {},
+        {"p": "2"},
+        {"category__id__exact": "__cat__"},
+        {"user__id__exact": str(user.pk)},
+        {"date__year": "2026", "date__month": "1"},
+        {"q": "compra 1"},
+    ]
+
+    def query_counts():
+        cat = str(Category.objects.filter(user=user).first().pk)
+        counts = []
+        for params in pages:
+            params = {k: (cat if v == "__cat__" else v) for k, v in params.items()}
+            with CaptureQueriesContext(connection) as captured:
+                resp = admin_client.get(url, params)
+            assert resp.status_code == 200, params
+            counts.append(len(captured))
+        return counts
+
+    _seed_admin_rows([user, other_user], 120, 5)
+    small = query_counts()
+    # 10x mais linhas e categorias: nada no changelist cresce junto
+    _seed_admin_rows([user, other_user], 1200, 50)
+    assert query_counts() == small
+
+    # sessão + usuário, contagem (no Postgres antes o reltuples), linhas e o MIN/MAX do date_hierarchy
+    with django_assert_num_queries(6 if postgres else 5):
+        resp = admin_client.get(url)
+    cl = resp.context["cl"]
+    assert cl.next_cursor_url and "after=" in cl.next_cursor_url
+    # o sidebar não lista categoria nem usuário nenhum (autocomplete)
+    sidebar = resp.content.split(b'id="changelist-filter"')[1].split(b"</search>")[0]
+    assert b"admin-autocomplete" in sidebar
+    assert b"Cat " not in sidebar and b"john" not in sidebar
+
+    ordered = list(Transaction.objects.order_by("-date", "-id").values_list("id", flat=True)[:300])
+    seen = [tx.pk for tx in cl.result_list]
+    next_url = cl.next_cursor_url
+    while len(seen) < 300:
+        with django_assert_num_queries(4):
+            resp = admin_client.get(url + next_url)
+        cl = resp.context["cl"]
+        seen += [tx.pk for tx in cl.result_list]
+        next_url = cl.next_cursor_url
+    assert seen == ordered
+
+    # o select2 do filtro e do formulário busca no autocomplete do admin
+    resp = admin_client.get(reverse("admin:autocomplete"), {
+        "app_label": "finance", "model_name": "transaction", "field_name": "category", "term": Category.objects.filter(user=user).last().name,
+    })
+    assert resp.status_code == 200 and resp.json()["results"]
+    assert admin_client.get(reverse("admin:finance_transaction_change", args=[seen[0]])).status_code == 200
+
+    # filtro e ordem recomeçam do início
+    assert "after=" not in cl.get_query_string({"type__exact": "OUT"})
+    resp = admin_client.get(url, {"after": "lixo"})
+    assert resp.status_code == 200 and resp.context["cl"].cursor is None
+
+
+@pytest.mark.parametrize("frequency, interval, start, expected", [
+    ("monthly", 1, date(2026, 1, 31), [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)]),
+    ("yearly", 1, date(2024, 2, 29), [date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28)]),
+    ("weekly", 2, date(2026, 1, 5), [date(2026, 1, 5), date(2026, 1, 19), date(2026, 2, 2), date(2026, 2, 16)]),
+    ("daily", 3, date(2026, 1, 30), [date(2026, 1, 30), date(2026, 2, 2), date(2026, 2, 5), date(2026, 2, 8)]),
+])
+def test_recurring_occurrences_clamp_and_first_position(frequency, interval, start, expected):
+    assert [occurrence(start, frequency, interval, n) for n in range(4)] == expected
+    for n, day in enumerate(expected):
+        assert first_position(start, frequency, interval, day) == n
+        if n:
+            assert first_position(start, frequency, interval, expected[n - 1] + (day - expected[n - 1]) / 2) == n
+
+
+def test_recurring_scheduler_catches_up_in_batches(auth_client, user, other_user, django_assert_max_num_queries):
+    url = reverse("recurringtransaction-list")
+    rent = auth_client.post(url, {
+        "type": "OUT", "amount": "1500.00", "description": "Aluguel", "frequency": "monthly",
+        "start_date": "2026-01-31", "count": 3,
+    }, format="json")
+    assert rent.status_code == 201 and rent.json()["next_run"] == "2026-01-31"
+    mine = Category.objects.create(user=user, name="Salário")
+    salary = auth_client.post(url, {
+        "type": "IN", "amount": "5000.00", "description": "Salário", "category": mine.pk,
+        "frequency": "monthly", "start_date": "2026-01-05",
+    }, format="json").json()
+    theirs = Category.objects.create(user=other_user, name="Dele")
+    assert auth_client.post(url, {
+        "type": "OUT", "amount": "1", "frequency": "daily", "start_date": "2026-01-01", "category": theirs.pk,
+    }, format="json").status_code == 400
+    assert auth_client.post(url, {
+        "type": "OUT", "amount": "1", "frequency": "daily", "start_date": "2026-01-10", "end_date": "2026-01-01",
+    }, format="json").status_code == 400
+    # muitos usuários vencendo juntos: consultas por lote, não por recorrência
+    RecurringTransaction.objects.bulk_create([
+        RecurringTransaction(user=other_user, type="OUT", amount=Decimal(i + 1), description=f"assinatura {i}",
+                             start_date=date(2026, 4, 1), next_run=date(2026, 4, 1))
+        for i in range(150)
+    ])
+
+    since = _sync(auth_client, None, 1000)["next"]
+    with django_assert_max_num_queries(40):
+        totals = run_due(date(2026, 4, 10), chunk_size=100)
+    assert totals == {"recurring": 152, "created": 150 + 3 + 4}
+    assert run_due(date(2026, 4, 10)) == {"recurring": 0, "created": 0}
+
+    created = Transaction.objects.filter(user=user).order_by("date", "id")
+    assert [(t.description, t.date) for t in created if t.description == "Aluguel"] == [
+        ("Aluguel", date(2026, 1, 31)), ("Aluguel", date(2026, 2, 28)), ("Aluguel", date(2026, 3, 31)),
+    ]
+    assert {t.category.name for t in created if t.description == "Aluguel"} == {"Outros"}
+    assert {t.category_id for t in created if t.description == "Salário"} == {mine.pk}
+    # cada transação criada tem o seu seq e aparece no delta-sync
+    assert len({t.sync_seq for t in created}) == 7
+    assert len(_sync(auth_client, since, 1000)["transactions"]) == 7
+
+    detail = reverse("recurringtransaction-detail", kwargs={"pk": salary["id"]})
+    assert auth_client.get(detail).json()["next_run"] == "2026-05-05"
+    assert auth_client.get(reverse("recurringtransaction-detail", kwargs={"pk": rent.json()["id"]})).json()["next_run"] is None
+
+    # pausada, o que vencer nesse meio tempo não é criado ao reativar
+    auth_client.patch(detail, {"active": False}, format="json")
+    assert run_due(date(2026, 7, 10))["created"] == 150 * 3
+    resumed = date.fromisoformat(auth_client.patch(detail, {"active": True}, format="json").json()["next_run"])
+    assert resumed.day == 5 and date.today() <= resumed < date.today() + timedelta(days=32)
+    # mudar a regra recalcula a partir da última criada
+    changed = auth_client.patch(detail, {"active": False, "frequency": "weekly", "start_date": "2026-03-02"},
+                                format="json").json()
+    assert changed["next_run"] == "2026-04-06" and changed["last_run"] == "2026-04-05"
+
+    api_client = APIClient()
+    api_client.force_authenticate(user=other_user)
+    assert api_client.get(detail).status_code == 404
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="SKIP LOCKED só em Postgres")
+@pytest.mark.django_db(transaction=True)
+def test_recurring_schedulers_skip_rows_locked_by_another(user):
+    RecurringTransaction.objects.bulk_create([
+        RecurringTransaction(user=user, type="OUT", amount=Decimal("10"), start_date=date(2026, 1, 1),
+                             next_run=date(2026, 1, 1), count=2)
+        for _ in range(20)
+    ])
+    locked, release = threading.Event(), threading.Event()
+
+    def other_scheduler():
+        # segura as 5 primeiras como se outro scheduler estivesse no meio do lote dele
+        with transaction.atomic():
+            list(RecurringTransaction.objects.select_for_update().order_by("id")[:5])
+            locked.set()
+            release.wait(10)
+        connections.close_all()
+
+    thread = threading.Thread(target=other_scheduler)
+    thread.start()
+    assert locked.wait(10)
+    try:
+        assert materialize_due(date(2026, 3, 1), "default") == (15, 30)
+        assert materialize_due(date(2026, 3, 1), "default") == (0, 0)
+    finally:
+        release.set()
+        thread.join()
+    assert materialize_due(date(2026, 3, 1), "default") == (5, 10)
+    dates = list(Transaction.objects.filter(user=user).values_list("date", flat=True))
+    assert len(dates) == 40 and sorted(set(dates)) == [date(2026, 1, 1), date(2026, 2, 1)]
+
+
+def test_account_purge_runs_in_bounded_resumable_batches(api_client, user, other_user, admin_client):
+    rows = 20_000
+    category = Category.objects.filter(user=user).first()
+    Transaction.objects.bulk_create([
+        Transaction(user=user, type="OUT", amount=Decimal("1.00"), date=date(2026, 1, 1 + i % 28), category=category)
+        for i in range(rows)
+    ], batch_size=5000)
+    Tombstone.objects.bulk_create([Tombstone(user=user, kind="transaction", object_id=i, sync_seq=i) for i in range(3500)])
+    CategoryRule.objects.create(user=user, category=category, kind="keyword", pattern="uber")
+    recurring = RecurringTransaction.objects.create(user=user, type="OUT", amount=Decimal("9.90"),
+                                                    start_date=date(2026, 1, 1), next_run=date(2026, 1, 1))
+    Transaction.objects.create(user=other_user, type="IN", amount=Decimal("5.00"), date=date(2026, 1, 1))
+    other_categories = Category.objects.filter(user=other_user).count()
+
+    refresh = RefreshToken.for_user(user)
+    api_client.cookies["access_token"] = str(refresh.access_token)
+    assert api_client.get(reverse("transaction-list")).status_code == 200
+
+    # pedido: inativo na hora (cookie e refresh recusados), nada apagado ainda
+    request = purge.request_purge(user)
+    assert api_client.get(reverse("transaction-list")).status_code == 401
+    assert api_client.post(reverse("auth_refresh"), {"refresh": str(refresh)}, format="json").status_code == 401
+    recurring.refresh_from_db()
+    assert not recurring.active
+    assert Transaction.objects.filter(user=user).count() == rows
+    assert purge.request_purge(user).pk == request.pk
+
+    # cai no meio: o que saiu fica registrado e a próxima execução continua
+    calls = count(1)
+
+    def crash(msg):
+        if next(calls) == 3:
+            raise RuntimeError("worker morreu")
+
+    with pytest.raises(RuntimeError):
+        purge.run_purge(request, batch_size=1000, log=crash)
+    request.refresh_from_db()
+    assert request.started_at and not request.finished_at and request.batches == 3
+    assert request.deleted == {"finance.Tombstone": 3000}
+    assert Tombstone.objects.filter(user=user).count() == 500
+
+    tracemalloc.start()
+    try:
+        call_command("purge_accounts", "--batch-size", "1000", stdout=StringIO())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    request.refresh_from_db()
+    assert request.finished_at and not request.error
+    assert request.deleted["finance.Transaction"] == rows and request.deleted["finance.Tombstone"] == 3500
+    assert request.batches >= rows // 1000 + 3
+    # memória e lock por lote não crescem com o tamanho da conta
+    assert peak < 8 * 1024 * 1024
+    assert 0 < request.max_batch_ms < 2000
+    assert not get_user_model().objects.filter(pk=user.pk).exists()
+    assert not Category.objects.filter(user_id=user.pk).exists()
+    assert Transaction.objects.filter(user=other_user).count() == 1
+    assert Category.objects.filter(user=other_user).count() == other_categories
+
+    # admin: excluir só desativa e agenda
+    url = reverse("admin:auth_user_delete", args=[other_user.pk])
+    assert "segundo plano" in admin_client.get(url).content.decode()
+    assert admin_client.post(url, {"post": "yes"}).status_code == 302
+    other_user.refresh_from_db()
+    assert not other_user.is_active
+    assert AccountPurge.objects.filter(user_id=other_user.pk, finished_at__isnull=True).exists()
+    assert Transaction.objects.filter(user=other_user).count() == 1
+
+
+def test_quantile_sketch_merges_within_relative_accuracy():
+    values = np.round(np.random.default_rng(7).lognormal(8, 1.5, 30_000))
+    whole, parts = QuantileSketch(), QuantileSketch()
+    whole.add(values)
+    for piece in np.array_split(values, 3):
+        part = QuantileSketch()
+        part.add(piece)
+        parts.merge(part)
+
+    ordered = np.sort(values)
+    for q in (0.5, 0.9, 0.99):
+        assert parts.quantile(q) == whole.quantile(q)
+        exact = ordered[int(q * (len(values) - 1))]
+        assert abs(whole.quantile(q) - exact) <= 0.01 * exact
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def _seed_platform(user, other_user):
+    market = Category.objects.create(user=user, name="Mercado")
+    other_market = Category.objects.create(user=other_user, name="Mercado")
+    rent = Category.objects.create(user=other_user, name="Aluguel")
+    Transaction.objects.bulk_create([
+        Transaction(user=user, type="IN", amount=Decimal("1000.00"), date=date(2026, 1, 5)),
+        Transaction(user=user, type="OUT", amount=Decimal("100.50"), date=date(2026, 1, 6), category=market),
+        Transaction(user=user, type="OUT", amount=Decimal("20.00"), date=date(2026, 2, 1), category=market),
+        Transaction(user=other_user, type="OUT", amount=Decimal("50.00"), date=date(2026, 1, 9), category=other_market),
+        Transaction(user=other_user, type="OUT", amount=Decimal("900.00"), date=date(2026, 1, 10), category=rent),
+    ])
+    ArchivedMonthTotal.objects.create(user=user, month=date(2024, 3, 1), type="OUT", total=Decimal("42.00"), count=3)
+
+
+def test_platform_report_merges_partitions_and_is_staff_only(monkeypatch, user, other_user, admin_user, auth_client):
+    _seed_platform(user, other_user)
+    admin_client = APIClient()
+    admin_client.force_authenticate(user=admin_user)
+    url = reverse("platform-report")
+    assert auth_client.get(url).status_code == 403
+    assert admin_client.get(url).status_code == 404
+
+    # uma faixa por usuário (e pedaços sem ninguém): o merge tem que dar o mesmo que tudo junto
+    monkeypatch.setattr(platform_report, "PARTITIONS_PER_WORKER", 5)
+    assert len(platform_report.partitions(1)) > 1
+    platform_report.generate(workers=1)
+
+    data = admin_client.get(url).json()
+    assert data["generated_at"] and data["stale"] is False and data["rows"] == 5
+    months = {m["month"]: m for m in data["months"]}
+    assert months["2026-01"] == {"month": "2026-01", "income": 1000.0, "expense": 1050.5,
+                                 "transactions": 4, "active_users": 2}
+    assert months["2026-02"]["expense"] == 20.0 and months["2026-02"]["active_users"] == 1
+    assert months["2024-03"] == {"month": "2024-03", "income": 0.0, "expense": 42.0,
+                                 "transactions": 3, "active_users": 0}
+    categories = {c["name"]: c for c in data["categories"]}
+    assert categories["Mercado"] == {"name": "Mercado", "users": 2, "transactions": 3, "expense": 170.5}
+    assert categories["Aluguel"]["users"] == 1 and data["categories"][0]["name"] == "Mercado"
+    spending = data["spending"]
+    # saídas 20 / 50 / 100,50 / 900; gasto por usuário/mês 20 / 100,50 / 950 (erro de até 1%)
+    assert abs(spending["per_transaction"]["p50"] - 50.0) <= 0.5
+    assert abs(spending["per_user_month"]["p50"] - 100.5) <= 1.01
+
+
+def test_platform_report_streams_users_larger_than_a_block(monkeypatch, user, other_user):
+    _seed_platform(user, other_user)
+    expected = platform_report.build_report(platform_report.collect(1))
+
+    # usuário que atravessa vários blocos: mesmo resultado, e nenhum bloco maior que FETCH_SIZE
+    aggregate, sizes = platform_report._aggregate_block, []
+
+    def spy(partial, block, pairs, pending):
+        sizes.append(len(block))
+        return aggregate(partial, block, pairs, pending)
+
+    monkeypatch.setattr(platform_report, "_aggregate_block", spy)
+    for size in (1, 2, 3):
+        monkeypatch.setattr(platform_report, "FETCH_SIZE", size)
+        sizes.clear()
+        assert platform_report.build_report(platform_report.collect(1)) == expected
+        assert max(sizes) <= size
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="pool de processos precisa de um banco compartilhado")
+@pytest.mark.django_db(transaction=True)
+# a thread do live_server (sessão inteira) não segura nada que os filhos do fork usem
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")
+def test_platform_report_process_pool_matches_single_process(user, other_user):
+    _seed_platform(user, other_user)
+    single = platform_report.build_report(platform_report.collect(1))
+    pooled = platform_report.build_report(platform_report.collect(2))
+    assert pooled == single and single["rows"] == 5
+
+
+def test_budget_counters_follow_every_transaction_write(auth_client, user, other_user, django_capture_on_commit_callbacks):
+    budgets_url = reverse("budget-list")
+    tx_url = reverse("transaction-list")
+    mercado = Category.objects.create(user=user, name="Mercado")
+    lazer = Category.objects.create(user=user, name="Lazer")
+    alheia = Category.objects.create(user=other_user, name="Alheia")
+
+    for body in ({"category": mercado.pk, "limit": "100.00"}, {"category": mercado.pk, "month": "2026-03", "limit": "200.00"}):
+        assert auth_client.post(budgets_url, body, format="json").status_code == 201
+    for bad in (
+        {"category": alheia.pk, "limit": "10.00"},
+        {"category": lazer.pk, "limit": "0.00"},
+        {"category": lazer.pk, "month": "março", "limit": "10.00"},
+        {"category": mercado.pk, "limit": "50.00"},  # já tem o recorrente
+    ):
+        assert auth_client.post(budgets_url, bad, format="json").status_code == 400
+
+    def spent(category, month):
+        return SpendingCounter.objects.filter(user=user, category=category, month=month).values_list("spent", flat=True).first()
+
+    broker = events.InMemoryBroker(buffer_size=1000)
+    events.set_broker(broker)
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            resp = auth_client.post(tx_url, {
+                "type": "OUT", "amount": "60.00", "date": "2026-02-10", "category": mercado.pk,
+            }, format="json")
+        assert resp.status_code == 201, resp.content
+        assert resp.json()["budget"]["percent"] == 60 and resp.json()["budget"]["spent"] == "60.00"
+        tx_id = resp.json()["id"]
+        with django_capture_on_commit_callbacks(execute=True):
+            resp = auth_client.patch(reverse("transaction-detail", args=[tx_id]), {"amount": "85.00"}, format="json")
+        assert resp.json()["budget"] == {"id": resp.json()["budget"]["id"], "limit": "100.00", "spent": "85.00", "percent": 85}
+        published = [e.data for e in broker._buffers[user.pk] if e.kind == "budget"]
+        assert [(e["threshold"], e["spent"], e["month"]) for e in published] == [(50, "60.00", "2026-02"), (80, "85.00", "2026-02")]
+    finally:
+        events.set_broker(None)
+
+    # troca de mês (o de março tem orçamento próprio) e de categoria
+    detail = reverse("transaction-detail", args=[tx_id])
+    resp = auth_client.patch(detail, {"date": "2026-03-05"}, format="json")
+    assert resp.json()["budget"]["limit"] == "200.00" and resp.json()["budget"]["percent"] == 42
+    assert spent(mercado, date(2026, 2, 1)) == 0 and spent(mercado, date(2026, 3, 1)) == Decimal("85.00")
+    resp = auth_client.patch(detail, {"date": "2026-02-05", "category": lazer.pk}, format="json")
+    assert resp.json()["budget"] is None
+    assert spent(mercado, date(2026, 3, 1)) == 0 and spent(lazer, date(2026, 2, 1)) == Decimal("85.00")
+    assert auth_client.delete(detail).status_code == 204
+    assert spent(lazer, date(2026, 2, 1)) == 0
+
+    # entrada não conta; limiar já avisado no mês não repete
+    auth_client.post(tx_url, {"type": "IN", "amount": "500.00", "date": "2026-02-01", "category": mercado.pk}, format="json")
+    auth_client.post(tx_url, {"type": "OUT", "amount": "60.00", "date": "2026-02-11", "category": mercado.pk}, format="json")
+    resp = auth_client.post(reverse("transaction-batch"), [
+        {"op": "create", "data": {"type": "OUT", "amount": "25.00", "date": "2026-02-12", "category": mercado.pk}}
+        for _ in range(2)
+    ], format="json")
+    assert resp.status_code == 200, resp.content
+    assert spent(mercado, date(2026, 2, 1)) == Decimal("110.00")
+    assert list(BudgetEvent.objects.filter(user=user).order_by("id").values_list("threshold", flat=True)) == [50, 80, 100]
+
+    resp = auth_client.get(budgets_url, {"month": "2026-02"}).json()
+    assert [(b["category_name"], b["month"], b["spent"], b["remaining"], b["percent"]) for b in resp] == [
+        ("Mercado", None, "110.00", "-10.00", 110),
+    ]
+    assert auth_client.get(budgets_url, {"month": "2026-03"}).json()[0]["limit"] == "200.00"
+    assert [e["threshold"] for e in auth_client.get(reverse("budget-events")).json()] == [100, 80, 50]
+
+    # regras aplicadas depois e categoria apagada levam o gasto junto
+    Transaction.objects.create(user=user, type="OUT", amount=Decimal("7.00"), date=date(2026, 2, 1),
+                               description="padaria", category=None)
+    CategoryRule.objects.create(user=user, kind="keyword", pattern="padaria", category=lazer)
+    assert categorize.apply_to_uncategorized(user)["updated"] == 1
+    assert spent(lazer, date(2026, 2, 1)) == Decimal("7.00")
+    assert auth_client.delete(_category_detail_url(lazer.pk)).status_code == 204
+    outros = Category.objects.get(user=None, name="Outros")
+    assert spent(outros, date(2026, 2, 1)) == Decimal("7.00")
+    assert budgets.reconcile() == []
+
+
+def test_transaction_list_shows_budget_usage_with_constant_queries(auth_client, user):
+    categories = [Category.objects.create(user=user, name=f"Cat {i}") for i in range(6)]
+    for category in categories[:4]:
+        Budget.objects.create(user=user, category=category, limit=Decimal("50.00"))
+
+    def page_queries(n):
+        Transaction.objects.bulk_create([
+            Transaction(user=user, type="OUT", amount=Decimal("1.00"), date=date(2026, 1 + i % 3, 1),
+                        category=categories[i % len(categories)])
+            for i in range(n)
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            rows = auth_client.get(reverse("transaction-list"), {"page_size": 200}).json()["results"]
+        return len(ctx.captured_queries), rows
+
+    few, _ = page_queries(6)
+    many, rows = page_queries(40)
+    assert few == many
+    by_category = {(r["category"], r["date"][:7]): r["budget"] for r in rows}
+    assert by_category[categories[5].pk, "2026-03"] is None
+    # bulk_create não passa pelos signals: o contador é o que o reconcile recalcula
+    budgets.reconcile(fix=True)
+    rows = auth_client.get(reverse("transaction-list"), {"month": "2026-01"}).json()["results"]
+    usage = {r["category"]: r["budget"] for r in rows}
+    assert usage[categories[0].pk] == {"id": usage[categories[0].pk]["id"], "limit": "50.00", "spent": "8.00", "percent": 16}
+    recent = auth_client.get(reverse("transaction-recent")).json()
+    assert all("budget" in r for r in recent)
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="escrita concorrente precisa de locks de linha")
+@pytest.mark.django_db(transaction=True)
+def test_reconcile_fix_holds_writers_that_would_create_counters(user, monkeypatch):
+    mercado = Category.objects.create(user=user, name="Mercado")
+    Transaction.objects.create(user=user, type="OUT", amount=Decimal("3.00"), date=date(2026, 4, 2), category=mercado)
+
+    def writer():
+        # mês novo: o upsert criaria o contador (user, Mercado, 2026-05)
+        Transaction.objects.create(user=user, type="OUT", amount=Decimal("7.00"), date=date(2026, 5, 3), category=mercado)
+        connections.close_all()
+
+    thread = threading.Thread(target=writer)
+    expected = budgets._expected
+
+    def racing(user_ids, using):
+        # a escrita chega depois do `expected` e antes dos contadores serem lidos
+        result = expected(user_ids, using)
+        thread.start()
+        thread.join(0.5)
+        return result
+
+    monkeypatch.setattr(budgets, "_expected", racing)
+    budgets.reconcile(fix=True)
+    thread.join(10)
+    assert not thread.is_alive()
+    monkeypatch.setattr(budgets, "_expected", expected)
+    assert budgets.reconcile() == []
+    assert SpendingCounter.objects.get(user=user, month=date(2026, 5, 1)).spent == Decimal("7.00")
+
+
+def test_reconcile_budgets_reports_and_fixes_drift(auth_client, user, other_user):
+    mercado = Category.objects.create(user=user, name="Mercado")
+    for who, amount in ((user, "30.00"), (user, "12.50"), (other_user, "5.00")):
+        Transaction.objects.create(user=who, type="OUT", amount=Decimal(amount), date=date(2026, 4, 2), category=mercado)
+    SpendingCounter.objects.filter(user=user).update(spent=Decimal("1.00"))
+    SpendingCounter.objects.filter(user=other_user).delete()
+
+    out = StringIO()
+    call_command("reconcile_budgets", stdout=out)
+    assert "2 contadores divergentes" in out.getvalue()
+    assert "contador 1.00, transações 42.50" in out.getvalue()
+    assert SpendingCounter.objects.get(user=user).spent == Decimal("1.00")
+
+    call_command("reconcile_budgets", "--fix", "--user", "john", stdout=StringIO())
+    assert SpendingCounter.objects.get(user=user).spent == Decimal("42.50")
+    assert SpendingCounter.objects.get(user=user).count == 2
+    assert not SpendingCounter.objects.filter(user=other_user).exists()
+    call_command("reconcile_budgets", "--fix", stdout=StringIO())
+    out = StringIO()
+    call_command("reconcile_budgets", stdout=out)
+    assert "Contadores conferem." in out.getvalue()
+    assert SpendingCounter.objects.get(user=other_user).spent == Decimal("5.00")
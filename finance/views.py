@@ -1,9 +1,10 @@
 '''finance.views'''
-from datetime import date as date_cls
-from decimal import Decimal
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
+from datetime import date as date_cls, timedelta
+from django.conf import settings
+from django.db import router, transaction
 from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from rest_framework import viewsets
 from rest_framework.decorators import action
@@ -11,11 +12,25 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Category, Transaction
-from .serializers import CategorySerializer, TransactionSerializer
+from backend.db_routing import pin_to_primary
+
+from . import ledger, platform_report
+from .analytics import DEFAULT_MONTHS, build_analytics
+from .archive import MergedRows, archive_horizon, archived_extent, archived_transaction, archived_transactions
+from .batch import BatchConflict, apply_batch
+from .budgets import move_category, spent_in
+from .categorize import apply_to_uncategorized
+from .models import ArchivedMonthTotal, Budget, BudgetEvent, Category, CategoryRule, RecurringTransaction, Transaction
+from .serializers import (
+    BudgetEventSerializer, BudgetSerializer, CategoryRuleSerializer, CategorySerializer, RecurringTransactionSerializer,
+    TransactionSerializer,
+)
+from .sharding import UserShardMixin
+from .summary import build_summary, month_range
+from .sync import DEFAULT_LIMIT, bump_epoch, changes_since, touch
 
 def parse_month(month_str: str | None) -> tuple[int, int]:
     """
@@ -31,7 +46,11 @@ def parse_month(month_str: str | None) -> tuple[int, int]:
         return today.year, today.month
     return d.year, d.month
 
-class CategoryViewSet(viewsets.ModelViewSet):
+def atomic_for(model):
+    ''' transaction.atomic no banco onde o model é escrito (shard do usuário, se houver) '''
+    return transaction.atomic(using=router.db_for_write(model))
+
+class CategoryViewSet(UserShardMixin, viewsets.ModelViewSet):
     '''
     Docstring for CategoryViewSet
     '''
@@ -50,7 +69,12 @@ class CategoryViewSet(viewsets.ModelViewSet):
         )
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with atomic_for(Category):
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with atomic_for(Category):
+            serializer.save()
 
     def destroy(self, request, *args, **kwargs):
         ''' Se deletar categoria em uma transação, joga para "Outros" '''
@@ -62,12 +86,92 @@ class CategoryViewSet(viewsets.ModelViewSet):
         if instance.name.strip().lower() == "outros":
             return Response({"detail": "A categoria 'Outros' não pode ser excluída."}, status=status.HTTP_409_CONFLICT)
 
-        # Joga pra 'Outros' quando a categoria é deletada
-        Transaction.objects.filter(user=request.user,category=instance).update(category=outros)
+        with atomic_for(Category):
+            # Joga pra 'Outros' quando a categoria é deletada (marcando pro delta-sync)
+            touch(Transaction.objects.filter(user=request.user, category=instance), request.user.pk, category=outros)
+            if ArchivedMonthTotal.objects.filter(user=request.user, category=instance).update(category=outros):
+                bump_epoch(request.user.pk)
+            # o gasto (tabela e arquivadas) vai junto pro contador do 'Outros'
+            move_category(request.user.pk, instance.pk, outros.pk)
+
+            return super().destroy(request, *args, **kwargs)
+
+class CategoryRuleViewSet(UserShardMixin, viewsets.ModelViewSet):
+    '''
+    Regras de categorização automática do usuário (ver finance/categorize.py).
+    POST /api/rules/apply/ roda as regras nas transações que estão em "Outros".
+    '''
+    permission_classes = [IsAuthenticated]
+    queryset = CategoryRule.objects.all()
+    serializer_class = CategoryRuleSerializer
+
+    def get_queryset(self):
+        return CategoryRule.objects.select_related("category").filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=["post"], url_path="apply")
+    def apply(self, request):
+        ''' Recategoriza as transações em "Outros"/sem categoria pelas regras atuais '''
+        return Response(apply_to_uncategorized(request.user))
+
+class RecurringTransactionViewSet(UserShardMixin, viewsets.ModelViewSet):
+    '''
+    Lançamentos recorrentes do usuário; as transações são criadas pelo
+    `manage.py run_recurring` (ver finance/recurring.py).
+    '''
+    permission_classes = [IsAuthenticated]
+    queryset = RecurringTransaction.objects.all()
+    serializer_class = RecurringTransactionSerializer
+
+    def get_queryset(self):
+        return RecurringTransaction.objects.select_related("category").filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+class BudgetViewSet(UserShardMixin, viewsets.ModelViewSet):
+    '''
+    Orçamentos por categoria (num mês ou em todo mês). A lista mostra os que
+    valem em ?month=YYYY-MM (padrão: mês atual), com gasto e % usado dos
+    contadores (ver finance/budgets.py); GET /api/budgets/events/ lista os
+    limiares cruzados.
+    '''
+    permission_classes = [IsAuthenticated]
+    queryset = Budget.objects.all()
+    serializer_class = BudgetSerializer
+
+    def get_queryset(self):
+        return Budget.objects.select_related("category").filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        month = date_cls(*parse_month(request.query_params.get("month")), 1)
+        current = {}
+        # o do mês vale no lugar do recorrente
+        for budget in self.get_queryset().filter(Q(month=month) | Q(month__isnull=True)):
+            if budget.month or budget.category_id not in current:
+                current[budget.category_id] = budget
+        context = {
+            **self.get_serializer_context(),
+            "month": month,
+            "spent": spent_in(request.user.pk, current, month),
+        }
+        rows = sorted(current.values(), key=lambda b: b.category.name)
+        return Response(BudgetSerializer(rows, many=True, context=context).data)
 
-        return super().destroy(request, *args, **kwargs)
+    @action(detail=False, methods=["get"], url_path="events")
+    def events(self, request):
+        ''' Últimos limiares cruzados (?month=YYYY-MM filtra pelo mês) '''
+        qs = BudgetEvent.objects.select_related("budget").filter(user=request.user)
+        if request.query_params.get("month"):
+            qs = qs.filter(month=date_cls(*parse_month(request.query_params["month"]), 1))
+        return Response(BudgetEventSerializer(qs[:50], many=True).data)
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(UserShardMixin, viewsets.ModelViewSet):
     '''
     Docstring for TransactionViewSet
     '''
@@ -85,11 +189,12 @@ class TransactionViewSet(viewsets.ModelViewSet):
         :param self: Description
         '''
         qs = Transaction.objects.select_related("category").filter(user=self.request.user)
-        month = self.request.query_params.get("month")
-        if month:
-            # month = "YYYY-MM"
-            year, m = month.split("-")
-            qs = qs.filter(date__year=int(year), date__month=int(m))
+        try:
+            bounds = self._month_bounds()
+        except ValueError:
+            return qs.none()
+        if bounds:
+            qs = qs.filter(date__gte=bounds[0], date__lt=bounds[1])
 
         tx_type = self.request.query_params.get("type")
         if tx_type in ("IN", "OUT"):
@@ -101,8 +206,110 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
         return qs
 
+    def get_serializer_context(self):
+        # cada saída mostra o % usado do orçamento (finance/budgets.py)
+        return {**super().get_serializer_context(), "budgets": True}
+
+    def _month_bounds(self):
+        ''' month = "YYYY-MM" -> (início, fim) do mês; ValueError se inválido '''
+        month = self.request.query_params.get("month")
+        if not month:
+            return None
+        year, m = month.split("-")
+        return month_range(int(year), int(m))
+
+    def list(self, request, *args, **kwargs):
+        '''
+        Com um mês antes do horizonte de arquivamento, as linhas arquivadas do
+        período entram junto com as da tabela, na mesma ordenação e paginação.
+        Sem ?month (lista inteira), o arquivo só é descompactado quando o filtro,
+        a ordenação ou a página pedida precisam dele (ver MergedRows).
+        '''
+        try:
+            bounds = self._month_bounds()
+        except ValueError:
+            return super().list(request, *args, **kwargs)
+        ordering = self._ordering()
+        if bounds is not None:
+            if bounds[0] < archive_horizon():
+                archived = self._filter_archived(archived_transactions(request.user, *bounds))
+                if archived:
+                    return self._list_with_archived(archived, ordering)
+            return super().list(request, *args, **kwargs)
+
+        params = request.query_params
+        tx_type = params.get("type") if params.get("type") in ("IN", "OUT") else None
+        count, last_date = archived_extent(request.user, tx_type)
+        if not count:
+            return super().list(request, *args, **kwargs)
+        category = params.get("category")
+        if self._search_terms() or (category and category.isdigit()) or ordering[0] != "-date":
+            archived = self._filter_archived(archived_transactions(request.user))
+            return self._list_with_archived(archived, ordering)
+        return self._list_with_archived(
+            lambda: self._filter_archived(archived_transactions(request.user)), ordering, count, last_date,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            pk = str(kwargs.get("pk", ""))
+            tx = archived_transaction(request.user, int(pk)) if pk.isdigit() else None
+            if tx is None:
+                raise
+            return Response(self.get_serializer(tx).data)
+
+    def _ordering(self):
+        params = self.request.query_params
+        ordering = [f.strip() for f in (params.get("ordering") or "").split(",") if f.strip()]
+        return [f for f in ordering if f.lstrip("-") in self.ordering_fields] or ["-date", "-id"]
+
+    def _search_terms(self):
+        # os mesmos termos do SearchFilter, pra tabela e arquivo filtrarem igual
+        return [term.lower() for term in SearchFilter().get_search_terms(self.request)]
+
+    def _filter_archived(self, archived):
+        params = self.request.query_params
+        tx_type = params.get("type")
+        category = params.get("category")
+        terms = self._search_terms()
+        return [
+            tx for tx in archived
+            if (tx_type not in ("IN", "OUT") or tx.type == tx_type)
+            and (not (category and category.isdigit()) or tx.category_id == int(category))
+            and all(term in tx.description.lower() for term in terms)
+        ]
+
+    def _list_with_archived(self, archived, ordering, count=None, last_date=None):
+        rows = MergedRows(self.filter_queryset(self.get_queryset()), archived, ordering, count, last_date)
+        page = self.paginate_queryset(rows)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with atomic_for(Transaction):
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with atomic_for(Transaction):
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with atomic_for(Transaction):
+            instance.delete()
+
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        ''' Lote de create/update/delete numa transação só, com chaves de idempotência (ver finance/batch.py) '''
+        try:
+            results = apply_batch(request, request.data)
+        except BatchConflict:
+            return Response(
+                {"detail": "Outro envio com as mesmas chaves está em andamento; tente de novo."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({"results": results})
 
     @action(detail=False, methods=["get"], url_path="recent")
     def recent(self, request):
@@ -113,50 +320,99 @@ class TransactionViewSet(viewsets.ModelViewSet):
         :param request: Description
         '''
         limit = int(request.query_params.get("limit", "10"))
-        qs = self.get_queryset().order_by("-date", "-id")[: max(1, min(limit, 50))]
-        data = TransactionSerializer(qs, many=True).data
+        limit = max(1, min(limit, 50))
+        if ledger.use_ledger(request):
+            return Response(TransactionSerializer(
+                self._recent_from_ledger(limit), many=True, context=self.get_serializer_context()
+            ).data)
+        qs = self.get_queryset().order_by("-date", "-id")[:limit]
+        data = TransactionSerializer(qs, many=True, context=self.get_serializer_context()).data
         return Response(data)
 
-class SummaryView(APIView):
+    def _recent_from_ledger(self, limit):
+        ''' Mesmos filtros do get_queryset, escolhidos no razão em memória; só busca as linhas pelo id '''
+        params = self.request.query_params
+        try:
+            bounds = self._month_bounds()
+        except ValueError:
+            return []
+        category = params.get("category")
+        ids = ledger.recent_ids(
+            self.request.user, bounds, params.get("type"), int(category) if category and category.isdigit() else None,
+            limit,
+        )
+        rows = Transaction.objects.select_related("category").filter(user=self.request.user).in_bulk(ids)
+        return [rows[pk] for pk in ids if pk in rows]
+
+class SummaryView(UserShardMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         month = request.query_params.get("month")  # YYYY-MM
         y, m = parse_month(month)
+        if ledger.use_ledger(request):
+            return Response(ledger.build_summary(request.user, y, m))
+        return Response(build_summary(request.user, y, m))
 
-        base_qs = Transaction.objects.filter(user=request.user)
-
-        month_qs = base_qs.filter(date__year=y, date__month=m)
+class AnalyticsView(UserShardMixin, APIView):
+    '''
+    Tendências, médias móveis e previsão do mês: GET /api/analytics/?month=YYYY-MM&months=12.
+    Ver finance/analytics.py.
+    '''
+    permission_classes = [IsAuthenticated]
 
-        income = month_qs.filter(type=Transaction.Type.INCOME).aggregate(
-            v=Coalesce(Sum("amount"), Decimal("0.00"))
-        )["v"]
+    def get(self, request):
+        y, m = parse_month(request.query_params.get("month"))
+        try:
+            months = int(request.query_params.get("months", DEFAULT_MONTHS))
+        except ValueError:
+            return Response({"detail": "Parâmetro 'months' inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        totals = ledger.daily_totals(request.user) if ledger.use_ledger(request) else None
+        return Response(build_analytics(request.user, y, m, months, totals=totals))
 
-        expense = month_qs.filter(type=Transaction.Type.EXPENSE).aggregate(
-            v=Coalesce(Sum("amount"), Decimal("0.00"))
-        )["v"]
+class SyncView(UserShardMixin, APIView):
+    '''
+    Delta-sync: GET /api/sync/?since=<token>&limit=<n> devolve só o que mudou
+    (e o que foi removido) desde o token. Ver finance/sync.py.
+    '''
+    permission_classes = [IsAuthenticated]
 
-        total_income = base_qs.filter(type=Transaction.Type.INCOME).aggregate(
-            v=Coalesce(Sum("amount"), Decimal("0.00"))
-        )["v"]
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", DEFAULT_LIMIT))
+            # contador e linhas do mesmo banco (nada de réplicas com atrasos diferentes)
+            with pin_to_primary():
+                changes = changes_since(request.user, request.query_params.get("since"), limit)
+        except ValueError:
+            return Response({"detail": "Parâmetro 'since' ou 'limit' inválido."}, status=status.HTTP_400_BAD_REQUEST)
 
-        total_expense = base_qs.filter(type=Transaction.Type.EXPENSE).aggregate(
-            v=Coalesce(Sum("amount"), Decimal("0.00"))
-        )["v"]
+        return Response({
+            "categories": CategorySerializer(changes["categories"], many=True).data,
+            "transactions": TransactionSerializer(changes["transactions"], many=True).data,
+            "deleted": [{"type": t.kind, "id": t.object_id} for t in changes["deleted"]],
+            "next": changes["next"],
+            "has_more": changes["has_more"],
+            "reset": changes["reset"],
+        })
 
-        by_category = (
-            month_qs.values("category__id", "category__name", "type")
-            .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
-            .order_by("type", "category__name")
-        )
+class PlatformReportView(APIView):
+    '''
+    Relatório da plataforma (só staff): GET /api/platform/report/ devolve o último
+    gerado pelo `manage.py platform_report`, com a hora em que foi gerado.
+    Ver finance/platform_report.py.
+    '''
+    permission_classes = [IsAdminUser]
 
-        return Response(
-            {
-                "month": f"{y:04d}-{m:02d}",
-                "income": income,
-                "expense": expense,
-                "balance_month": income - expense,
-                "balance_total": total_income - total_expense,
-                "by_category": list(by_category),
-            }
-        )
\ No newline at end of file
+    def get(self, request):
+        report = platform_report.latest()
+        if report is None:
+            return Response({"detail": "Nenhum relatório gerado ainda (manage.py platform_report)."},
+                            status=status.HTTP_404_NOT_FOUND)
+        max_age = timedelta(hours=settings.FINANCE_PLATFORM_REPORT_MAX_AGE_HOURS)
+        return Response({
+            "generated_at": report.generated_at,
+            "stale": report.generated_at < timezone.now() - max_age,
+            "workers": report.workers,
+            "elapsed_ms": round(report.elapsed_ms),
+            **report.data,
+        })